@@ -0,0 +1,172 @@
+# bench.engine.py compares the fan-out of fireblade tools before and after
+# fireblade_engine, against a local stub NETCONF server that answers the
+# hello exchange and one RPC with configurable latency. It measures, per
+# executor, wall time, sessions per second, peak threads and peak RSS:
+# 1. 'threadpool' - concurrent.futures.ThreadPoolExecutor as the tools used;
+# 2. 'engine' - fireblade_engine with the same blocking job;
+# 3. 'engine-async' - fireblade_engine with a coroutine job, no worker threads.
+# Each executor runs in its own process so that RSS figures do not mix.
+#
+# usage: python3 bench.engine.py [-n HOSTS] [-w WORKERS] [--handshake SEC] [--rpc SEC]
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import threading
+import subprocess
+import multiprocessing
+import concurrent.futures
+import fireblade_engine
+
+EOM = b']]>]]>'
+HELLO = (b'<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+    b'<capability>urn:ietf:params:netconf:base:1.0</capability></capabilities>'
+    b'<session-id>1</session-id></hello>' + EOM)
+REPLY = (b'<rpc-reply><software-information><host-name>stub</host-name>'
+    b'<product-model>ex4300-48p</product-model></software-information></rpc-reply>' + EOM)
+RPC = b'<rpc><get-software-information/></rpc>' + EOM
+CLOSE = b'<rpc><close-session/></rpc>' + EOM
+
+# stub NETCONF server: delayed hello, then a delayed reply per rpc
+def serve(port, handshake, rpc, ready):
+
+    async def session(reader, writer):
+        try:
+            await asyncio.sleep(handshake)
+            writer.write(HELLO)
+            await reader.readuntil(EOM)
+            while True:
+                request = await reader.readuntil(EOM)
+                if b'close-session' in request:
+                    writer.write(b'<rpc-reply><ok/></rpc-reply>' + EOM)
+                    break
+                await asyncio.sleep(rpc)
+                writer.write(REPLY)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(session, '127.0.0.1', port, backlog=4096)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+# blocking session, as a PyEZ Device would run it
+def blocking_job(host, port):
+    with socket.create_connection(('127.0.0.1', port), timeout=60) as sock:
+        stream = sock.makefile('rwb')
+        _read_until(stream)
+        stream.write(HELLO)
+        stream.write(RPC)
+        stream.flush()
+        reply = _read_until(stream)
+        stream.write(CLOSE)
+        stream.flush()
+        _read_until(stream)
+    return host, len(reply)
+
+def _read_until(stream):
+    data = b''
+    while not data.endswith(EOM):
+        chunk = stream.read1(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+# the same session as a coroutine
+async def async_job(host, port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=1 << 16)
+    await reader.readuntil(EOM)
+    writer.write(HELLO + RPC)
+    reply = await reader.readuntil(EOM)
+    writer.write(CLOSE)
+    await reader.readuntil(EOM)
+    writer.close()
+    return host, len(reply)
+
+# sample the thread count while a run is in progress
+class ThreadSampler(threading.Thread):
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = threading.active_count()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+def run_scenario(scenario, hosts, port, workers):
+    sampler = ThreadSampler()
+    sampler.start()
+    start = time.perf_counter()
+    failed = 0
+    if scenario == 'threadpool':
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(blocking_job, host, port) for host in hosts]
+            for future in concurrent.futures.as_completed(futures):
+                failed += future.exception() is not None
+    elif scenario == 'engine':
+        engine = fireblade_engine.Engine(limit=workers)
+        for future in engine.as_completed(blocking_job, hosts, port):
+            failed += future.exception() is not None
+    else:
+        engine = fireblade_engine.Engine(limit=workers)
+        for future in engine.as_completed(async_job, hosts, port):
+            failed += future.exception() is not None
+    elapsed = time.perf_counter() - start
+    sampler.done.set()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{scenario},{workers},{len(hosts)},{elapsed:.2f},{len(hosts) / elapsed:.1f},{sampler.peak},{rss // 1024},{failed}')
+
+def getArgs():
+    parser = argparse.ArgumentParser(description='Fan-out engine benchmark against a stub NETCONF server')
+    parser.add_argument('-n', '--hosts', type=int, default=2000, help='Number of simulated hosts. Default to 2000.')
+    parser.add_argument('-w', '--workers', type=int, default=100,
+        help='Concurrency of threadpool and engine runs. Default to 100.')
+    parser.add_argument('-a', '--async_workers', type=int, default=1000,
+        help='Concurrency of the engine-async run. Default to 1000.')
+    parser.add_argument('--handshake', type=float, default=0.2, help='Seconds before the stub sends hello. Default to 0.2.')
+    parser.add_argument('--rpc', type=float, default=0.05, help='Seconds the stub takes per RPC. Default to 0.05.')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = getArgs()
+    hosts = [f'bby-h{i:05d}-edge-1.bench' for i in range(args.hosts)]
+
+    # child process: run one scenario against the running stub
+    if args.scenario:
+        workers = args.async_workers if args.scenario == 'engine-async' else args.workers
+        run_scenario(args.scenario, hosts, args.port, workers)
+        return
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(port, args.handshake, args.rpc, ready), daemon=True)
+    server.start()
+    ready.wait()
+
+    print('executor,concurrency,hosts,seconds,sessions/s,peak threads,peak RSS MB,failed')
+    try:
+        for scenario in ['threadpool', 'engine', 'engine-async']:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', scenario, '--port', str(port),
+                '-n', str(args.hosts), '-w', str(args.workers), '-a', str(args.async_workers)], check=True)
+    finally:
+        server.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# bench.fleet.py runs fireblade tools end to end against a simulated fleet of
+# switches (see fireblade_sim), 1,000 hosts by default, and reports their
+# throughput and tail latency. It
+# 1. starts the fleet in processes of its own, one per CPU by default, every
+#    host on a local port;
+# 2. runs each scenario in a child process as an operator would, with its
+#    command line, its prompts answered on stdin, and a scratch HOME and
+#    working directory, the hostnames of the fleet redirected to their ports;
+# 3. tells the latency of each host from the sessions the fleet served it,
+#    first connection to last reply within the run;
+# 4. prints per scenario and concurrency: hosts, seconds, hosts per second,
+#    p50/p95/p99 and max host latency, hosts never served a whole session,
+#    i.e. those refusing, rejecting or dropping it, and the tool's exit code.
+# Scenarios are:
+#   mss           fireblade.mss 'show' of a command on the pooled shells;
+#   mss.rpc       fireblade.mss csv of the MAC table through its RPC;
+#   mss.testride  fireblade.mss testride of an interface description;
+#   ii            fireblade.ii inventory of inactive interfaces;
+#   ji            fireblade.ji staging and installation of dummy packages, then rollback;
+#   vlan.flip     fireblade.vlan.flip commit of a matrix of 4 interfaces per host.
+# The fleet keeps its state from run to run as a real one does, so the first
+# run of ii and ji also uploads the agent and the packages. Each run writes
+# the output of its tool to <scenario>.<workers>.out in the working directory.
+# SSH handshakes cost the fleet as much CPU as the tools, so with few CPUs the
+# machine, not the tool, sets the highest hosts per second.
+#
+# usage: python3 bench.fleet.py [-n HOSTS] [-w WORKERS ...] [-f PROCESSES] [-a TOOL_ARGS] [-s SCENARIO ...] [--handshake SEC] [--rpc SEC] [--commit SEC] [--faults KIND=RATE,...]
+
+import os
+import sys
+import json
+import time
+import shlex
+import runpy
+import random
+import argparse
+import tempfile
+import subprocess
+import collections
+import multiprocessing
+import fireblade_sim
+import fireblade_trace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+USER = 'bench'
+PASSWORD = 'sim'
+
+SCENARIOS = ['mss', 'mss.rpc', 'mss.testride', 'ii', 'ji', 'vlan.flip']
+
+# size of each dummy Junos package of 'ji'
+PACKAGE_MB = 1
+
+# run the fleet until terminated, sending {host: port} once it listens
+def serve(hosts, options, log, conn):
+    with fireblade_sim.Fleet(hosts, password=PASSWORD, log=log, **options) as fleet:
+        conn.send(fleet.ports)
+        while True:
+            time.sleep(3600)
+
+# child process: a tool run as __main__ with the fleet's hostnames redirected
+def run_tool(ports, argv):
+    with open(ports) as fo:
+        fireblade_sim.redirect(json.load(fo))
+    sys.argv = argv
+    sys.path.insert(0, HERE)
+    runpy.run_path(os.path.join(HERE, argv[0]), run_name='__main__')
+
+# hostnames of campuses and roles the tools' selectors know, i.e. bby-a00001-edge-1.bench
+def hostnames(n):
+    return [f'{["bby", "sry", "van"][i % 3]}-a{i:05d}-{"edge" if i % 10 else "ext"}-1.bench' for i in range(n)]
+
+# lines 'host,interface,oldvlan,newvlan' of 4 access interfaces per host, as the fleet made them
+def vlan_matrix(hosts, seed):
+    lines = []
+    for host in hosts:
+        switch = fireblade_sim.Switch(host, seed)
+        rnd = random.Random(host)
+        for interface in rnd.sample(sorted(switch.vlan_of), 4):
+            old = switch.vlan_of[interface]
+            lines.append(f'{host},{interface},{old},{"DATA" if old == "NAC-UNPRIV" else "NAC-UNPRIV"}\n')
+    return lines
+
+# files of the scenarios in the working directory; returns {scenario: (argv, stdin)}
+def prepare(work, hosts, seed):
+    # fireblade.ji logs into ./logs
+    os.makedirs(os.path.join(work, 'logs'), exist_ok=True)
+    with open(os.path.join(work, 'hosts.list'), 'w') as fo:
+        fo.writelines(f'{host}\n' for host in hosts)
+    with open(os.path.join(work, 'vlan.matrix'), 'w') as fo:
+        fo.writelines(vlan_matrix(hosts, seed))
+    packages = []
+    for model in ['ex4300-48p', 'ex4300-48mp', 'ex2300-c-12p']:
+        path = os.path.join(work, f'junos-{model}-21.4R3-S6.tgz')
+        with open(path, 'wb') as fo:
+            fo.write(model.encode() * (PACKAGE_MB * 1024 * 1024 // len(model)))
+        packages.append(path)
+    credential = f'{USER}\n{PASSWORD}\n'
+    return {
+        'mss': (['fireblade.mss.py', '-l', 'hosts.list', '-c', 'show interfaces terse'], credential),
+        'mss.rpc': (['fireblade.mss.py', '-l', 'hosts.list', '-c', 'show ethernet-switching table', '-o', 'csv'], credential),
+        'mss.testride': (['fireblade.mss.py', '-l', 'hosts.list', '-m', 'testride',
+            '-c', 'set interfaces ge-0/0/0 description bench'], credential),
+        'ii': (['fireblade.ii.py', '-l', 'hosts.list', '-g', os.path.join(HERE, 'portusage.slax')], credential),
+        'ji': (['fireblade.ji.py', '-l', 'hosts.list', '-x', 'rollback', '-s', 'ji.log'],
+            credential + ''.join(f'{path}\n' for path in packages)),
+        'vlan.flip': (['fireblade.vlan.flip.py', '-c', 'vlan.matrix', '-m', 'commit'], credential),
+    }
+
+# records of the sessions a fleet process logged from 'start' on
+def records(log, start):
+    if not os.path.exists(log):
+        return []
+    with open(log) as fo:
+        return [record for record in map(json.loads, fo) if record['start'] >= start]
+
+# one row of results of a run
+def row(scenario, workers, hosts, seconds, served, code):
+    per_host = collections.defaultdict(list)
+    for record in served:
+        per_host[record['host']].append(record)
+    latencies = sorted(max(r['last'] for r in rs) - min(r['start'] for r in rs) for rs in per_host.values())
+    whole = {host for host, rs in per_host.items() if any(r['error'] is None and r['requests'] for r in rs)}
+    tail = ','.join(f'{fireblade_trace.percentile(latencies, p):.2f}' if latencies else '' for p in fireblade_trace.PERCENTILES)
+    return (f'{scenario},{workers},{len(hosts)},{seconds:.1f},{len(hosts) / seconds:.1f},{tail},' +
+        f'{latencies[-1] if latencies else 0:.2f},{len(set(hosts) - whole)},{code}')
+
+def getArgs():
+    parser = argparse.ArgumentParser(description='Fireblade tools benchmark against a simulated fleet')
+    parser.add_argument('-n', '--hosts', type=int, default=1000, help='Number of simulated hosts. Default to 1000.')
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[50],
+        help='--workers of each tool run, one run per value. Default to 50.')
+    parser.add_argument('-s', '--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS,
+        help='Scenarios to run. Default to all.')
+    parser.add_argument('-a', '--tool_args', default='',
+        help='Arguments added to every tool run, i.e. -a="--no-adaptive --retries 0".')
+    parser.add_argument('-d', '--work_dir', metavar='DIR',
+        help='Working directory of the tools, kept afterwards. Default to a temporary one, removed afterwards.')
+    parser.add_argument('-f', '--fleet_processes', type=int, default=os.cpu_count() or 1,
+        help='Processes serving the simulated hosts. Default to the number of CPUs.')
+    fireblade_sim.add_arguments(parser)
+    parser.add_argument('--ports', help=argparse.SUPPRESS)
+    parser.add_argument('--tool', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = getArgs()
+
+    # child process: run one tool against the running fleet
+    if args.tool:
+        run_tool(args.ports, json.loads(args.tool))
+        return
+
+    hosts = hostnames(args.hosts)
+    with tempfile.TemporaryDirectory() as scratch:
+        work = args.work_dir or scratch
+        os.makedirs(work, exist_ok=True)
+        scenarios = prepare(work, hosts, args.seed)
+
+        # every process serves a share of the hosts and logs their sessions
+        fleet, ports, logs = [], {}, []
+        for i in range(args.fleet_processes):
+            logs.append(os.path.join(work, f'fleet.{i}.jsonl'))
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve,
+                args=(hosts[i::args.fleet_processes], fireblade_sim.from_args(args), logs[-1], child), daemon=True)
+            process.start()
+            fleet.append(process)
+            ports.update(parent.recv())
+        with open(os.path.join(work, 'ports.json'), 'w') as fo:
+            json.dump(ports, fo)
+
+        sys.stderr.write(f'{len(hosts)} simulated hosts in {work}' +
+            (', faults: ' + ', '.join(f'{kind} {rate}' for kind, rate in args.faults.items()) if args.faults else '') + '\n')
+
+        print('scenario,workers,hosts,seconds,hosts/s,' + ','.join(f'p{p}' for p in fireblade_trace.PERCENTILES) +
+            ',max,unreached,exit')
+        try:
+            for scenario in args.scenarios:
+                for workers in args.workers:
+                    argv, stdin = scenarios[scenario]
+                    argv = argv + ['--workers', str(workers)] + shlex.split(args.tool_args)
+                    home = tempfile.mkdtemp(dir=work, prefix=f'{scenario}.{workers}.home.')
+                    start = time.time()
+                    with open(os.path.join(work, f'{scenario}.{workers}.out'), 'w') as out:
+                        code = subprocess.run([sys.executable, os.path.abspath(__file__), '--ports', os.path.join(work, 'ports.json'),
+                            '--tool', json.dumps(argv)], input=stdin, text=True, stdout=out, stderr=subprocess.STDOUT,
+                            cwd=work, env=dict(os.environ, HOME=home)).returncode
+                    seconds = time.time() - start
+                    # sessions the tool left open are logged as the fleet sees them close
+                    time.sleep(1)
+                    served = [record for log in logs for record in records(log, start)]
+                    print(row(scenario, workers, hosts, seconds, served, code), flush=True)
+        finally:
+            for process in fleet:
+                process.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# bench.mac.map.py times ninja.mac.map.sh against ninja_mac (the engine of
+# ninja.mac.map.py) on a synthetic raw MAC log in the format of
+# fireblade.mss.py -c "show ethernet-switching table", and checks that both
+# write the same MAC_MAP_CSV.
+#
+# usage: python3 bench.mac.map.py [-n LINES] [-d DIR]
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import ninja_mac
+
+BANNER = '''\033[1;34m------------------------------------------------\033[0m
+Host: {host}
+
+
+MAC flags (S - static MAC, D - dynamic MAC, L - locally learned, P - Persistent static, C - Control MAC
+           SE - statistics enabled, NM - non configured MAC, R - remote PE MAC, O - ovsdb MAC)
+
+
+Ethernet switching table : {n} entries, {n} learned
+Routing instance : default-switch
+    Vlan                MAC                 MAC         Age    Logical                NH        RTR
+    name                address             flags              interface              Index     ID
+'''
+VLANS = ['DATA', 'VOICE', 'BMS', 'WIRELESS-AP', 'MANAGEMENT', 'PRINTER']
+
+# raw log of about 'lines' lines, 2,000 entries per host, and its trunk csv
+def generate(lines, log_path, trunk_path):
+    rnd = random.Random(7)
+    n_hosts = max(1, lines // 2010)
+    with open(log_path, 'w') as log, open(trunk_path, 'w') as trunk:
+        trunk.write('hostname,interfacename\n')
+        for h in range(n_hosts):
+            host = f'bby-b{h:05d}-edge-1.managenet.sfu.ca'
+            trunk.write(f'{host},ae0\n{host},xe-0/2/0\n{host},xe-0/2/1\n{host},ge-0/0/47\n')
+            log.write(BANNER.format(host=host, n=2000))
+            rows = []
+            for _ in range(2000):
+                mac = ':'.join(f'{rnd.randrange(256):02x}' for _ in range(6))
+                port = rnd.random()
+                interface = 'ae0.0' if port < 0.5 else f'ge-{rnd.randrange(4)}/0/{rnd.randrange(48)}.0' \
+                    if port < 0.95 else f'mge-0/0/{rnd.randrange(48)}.0'
+                rows.append(f'    {rnd.choice(VLANS):<20}{mac}   D             -   {interface:<23}0         0       \n')
+            log.writelines(rows)
+            log.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='ninja.mac.map.sh vs ninja_mac benchmark')
+    parser.add_argument('-n', '--lines', type=int, default=5_000_000, help='Lines of the synthetic log. Default to 5,000,000.')
+    parser.add_argument('-d', '--dir', help='Working directory. Default to a temporary directory.')
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix='bench.mac.map.')
+    log_path = os.path.join(work, 'mac.rawdata.log')
+    trunk_path = os.path.join(work, 'trunk.int.csv')
+    awk_out = os.path.join(work, 'mac.map.awk.csv')
+    py_out = os.path.join(work, 'mac.map.py.csv')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ninja.mac.map.sh')
+
+    generate(args.lines, log_path, trunk_path)
+    with open(log_path) as fo:
+        n_lines = sum(1 for _ in fo)
+    print(f'synthetic log: {n_lines} lines, {os.path.getsize(log_path) >> 20} MB in {work}')
+    print('tool,vlans,seconds,lines/s')
+
+    for vlans in [[], ['DATA', 'VOICE']]:
+        start = time.perf_counter()
+        if vlans:
+            # the shell script takes one VLAN per run
+            for vlan in vlans:
+                subprocess.run(['bash', script, '-m', log_path, '-t', trunk_path, '-o', f'{awk_out}.{vlan}', '-n', vlan],
+                    check=True, stdout=subprocess.DEVNULL)
+        else:
+            subprocess.run(['bash', script, '-m', log_path, '-t', trunk_path, '-o', awk_out],
+                check=True, stdout=subprocess.DEVNULL)
+        awk_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trunks = ninja_mac.load_trunks(trunk_path)
+        with open(log_path) as fo:
+            ninja_mac.write(ninja_mac.mapping(ninja_mac.parse(fo), trunks, set(vlans)), py_out)
+        py_time = time.perf_counter() - start
+
+        label = '+'.join(vlans) or 'all'
+        print(f'ninja.mac.map.sh,{label},{awk_time:.2f},{n_lines / awk_time:.0f}')
+        print(f'ninja_mac,{label},{py_time:.2f},{n_lines / py_time:.0f}')
+
+        # same rows from both
+        if vlans:
+            awk_rows = []
+            for vlan in vlans:
+                with open(f'{awk_out}.{vlan}') as fo:
+                    awk_rows += fo.readlines()[1:]
+        else:
+            with open(awk_out) as fo:
+                awk_rows = fo.readlines()[1:]
+        with open(py_out) as fo:
+            py_rows = fo.readlines()[1:]
+        print(f'identical output: {sorted(awk_rows) == sorted(py_rows)} ({len(py_rows)} rows)')
+
+if __name__ == '__main__':
+    main()
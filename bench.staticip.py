@@ -0,0 +1,88 @@
+# bench.staticip.py times ninja.hostinfo.processor.sh against
+# ninja.hostinfo.processor.py on a synthetic range file and ARP file, and
+# checks that both write the same rows. The shell script forks for every
+# (IP, range) pair, so it only runs on the first SAMPLE lines of the ARP file
+# and its time for the whole file is extrapolated.
+#
+# usage: python3 bench.staticip.py [-a ARP_ENTRIES] [-r RANGES] [-s SAMPLE] [-d DIR]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import ninja_staticip
+
+# range file of 'n' subnets with one static range each, ARP file and MAC map
+def generate(n_ranges, n_arp, range_path, arp_path, mac_path):
+    rnd = random.Random(7)
+    subnets = rnd.sample(range(1 << 16), n_ranges)
+    with open(range_path, 'w') as fo:
+        for s in subnets:
+            base = f'10.{s >> 8}.{s & 0xff}'
+            first = rnd.randrange(1, 200)
+            fo.write(f'{base}.0/24,{base}.{first},{base}.{rnd.randrange(first, 255)}\n')
+    with open(arp_path, 'w') as arp, open(mac_path, 'w') as mac_map:
+        arp.write('mac,ip,hostname\n')
+        mac_map.write('mac,host,interface,original vlan\n')
+        for i in range(n_arp):
+            mac = ':'.join(f'{rnd.randrange(256):02x}' for _ in range(6))
+            # three in four in a known subnet
+            s = rnd.choice(subnets) if rnd.random() < 0.75 else rnd.randrange(1 << 16)
+            arp.write(f'{mac},10.{s >> 8}.{s & 0xff}.{rnd.randrange(1, 255)},host-{i}.sfu.ca\n')
+            if rnd.random() < 0.8:
+                mac_map.write(f'{mac},bby-b{i % 500:05d}-edge-1.managenet.sfu.ca,ge-0/0/{i % 48},DATA\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='ninja.hostinfo.processor.sh vs ninja.hostinfo.processor.py benchmark')
+    parser.add_argument('-a', '--arp_entries', type=int, default=100_000, help='ARP entries. Default to 100,000.')
+    parser.add_argument('-r', '--ranges', type=int, default=2_000, help='Static IP ranges. Default to 2,000.')
+    parser.add_argument('-s', '--sample', type=int, default=20, help='ARP entries run through the shell script. Default to 20.')
+    parser.add_argument('-d', '--dir', help='Working directory. Default to a temporary directory.')
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix='bench.staticip.')
+    range_path = os.path.join(work, 'static.ip.ranges.csv')
+    arp_path = os.path.join(work, 'arp.csv')
+    sample_path = os.path.join(work, 'arp.sample.csv')
+    mac_path = os.path.join(work, 'mac.map.csv')
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    generate(args.ranges, args.arp_entries, range_path, arp_path, mac_path)
+    with open(arp_path) as fo, open(sample_path, 'w') as sample:
+        sample.writelines(line for _, line in zip(range(args.sample + 1), fo))
+    print(f'{args.ranges} ranges, {args.arp_entries} ARP entries in {work}')
+    print(f'engine: {"numpy" if ninja_staticip.numpy is not None else "bisect"}')
+    print('tool,entries,seconds,entries/s')
+
+    def run(script, arp, out):
+        command = ['bash'] if script.endswith('.sh') else [sys.executable]
+        start = time.perf_counter()
+        subprocess.run(command + [os.path.join(here, script), '-r', range_path, '-t', arp, '-o', out, '-m', mac_path],
+            check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    sh_time = run('ninja.hostinfo.processor.sh', sample_path, os.path.join(work, 'hosts.sh.csv'))
+    py_sample = run('ninja.hostinfo.processor.py', sample_path, os.path.join(work, 'hosts.py.sample.csv'))
+    py_time = run('ninja.hostinfo.processor.py', arp_path, os.path.join(work, 'hosts.py.csv'))
+    print(f'ninja.hostinfo.processor.sh,{args.sample},{sh_time:.2f},{args.sample / sh_time:.1f}')
+    print(f'ninja.hostinfo.processor.sh,{args.arp_entries},{sh_time * args.arp_entries / args.sample:.0f} (extrapolated),')
+    print(f'ninja.hostinfo.processor.py,{args.arp_entries},{py_time:.2f},{args.arp_entries / py_time:.0f}')
+
+    # classification alone, ranges loaded
+    table = ninja_staticip.load(range_path)
+    with open(arp_path) as fo:
+        next(fo)
+        ips = [line.split(',')[1] for line in fo]
+    start = time.perf_counter()
+    table.classify(ips)
+    classify_time = time.perf_counter() - start
+    print(f'ninja_staticip.classify,{len(ips)},{classify_time:.3f},{len(ips) / classify_time:.0f}')
+
+    with open(os.path.join(work, 'hosts.sh.csv')) as sh, open(os.path.join(work, 'hosts.py.sample.csv')) as py:
+        print(f'identical output on sample: {sh.read() == py.read()} (python sample run {py_sample:.2f}s)')
+
+if __name__ == '__main__':
+    main()
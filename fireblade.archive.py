@@ -0,0 +1,157 @@
+# fireblade.archive.py archives the committed configuration of hosts (see
+# fireblade_archive) and answers questions about it offline. Mode 'fetch'
+# logs into the hosts, and fetches the configuration of those whose
+# configuration changed since the last fetch only; the other modes read the
+# archive alone, through its index (see fireblade_query):
+#   trunk  hostname,interfacename of trunks and LAG members, the
+#          sfu.all.trunk.int.csv of README.NAC.md step 1;
+#   edge   host,interface,vlan of access interfaces of VLANs, the
+#          <corename>.edge.int.csv of README.NAC.md step 4;
+#   match  host,line of lines matching a pattern, as Junos 'match' does;
+#   show   archived configuration of hosts, in 'display set' form.
+#
+# Example: fireblade.archive.py -l ~/garage/hosts.all -m fetch --workers 100
+# Example: fireblade.archive.py -m trunk > sfu.all.trunk.int.csv
+# Example: fireblade.archive.py -l <hosts.list> -m edge -v DATA VOICE > <corename>.edge.int.csv
+# Example: fireblade.archive.py -m match -e 'vlan members (DATA|VOICE)' -s interfaces
+
+import sys
+import argparse
+from getpass import getpass
+from jnpr.junos import Device
+import fireblade_archive
+import fireblade_engine
+import fireblade_query
+import fireblade_result
+import fireblade_trace
+import ninja_nac
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(description = 'Configuration Archive Tool')
+
+    # group arg_host
+    arg_host = parser.add_mutually_exclusive_group()
+    arg_host.add_argument('-H', '--hosts', nargs='+',
+        help='hosts\' FQDN in format of \'host1\' \'host2\'... Default to all archived hosts, except for mode "fetch".')
+    arg_host.add_argument('-l', '--host_list', metavar="FILE", help='Direcotry to a list of hosts.')
+
+    # arg 'mode'
+    parser.add_argument('-m', '--mode', choices=['fetch', 'trunk', 'edge', 'match', 'show'], default='fetch',
+        help='Operation mode: Default to "fetch" to archive configurations that changed. Other choices are: ' +
+        '\n"trunk" for trunk and LAG member interfaces;' +
+        '\n"edge" for access interfaces of VLANs;' +
+        '\n"match" for lines matching a pattern;' +
+        '\n"show" for archived configurations.')
+
+    # arg 'vlans'
+    parser.add_argument('-v', '--vlans', nargs='+', metavar='VLAN',
+        help='VLAN names, for mode "edge". All VLANs by default.')
+
+    # args 'pattern' and 'section'
+    parser.add_argument('-e', '--pattern',
+        help='Regular expression of mode "match", case insensitive as Junos "match" is, i.e. "trunk|802.3ad".')
+    parser.add_argument('-s', '--section', metavar='SECTION',
+        help='Top hierarchy of the lines of mode "match", i.e. "interfaces". All lines by default.')
+
+    # arg 'refresh'
+    parser.add_argument('--refresh', action='store_true',
+        help='Fetch configurations even if they have not changed since archived.')
+
+    # arg 'archive'
+    fireblade_archive.add_arguments(parser)
+
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=100)
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts mode "fetch" is to run again
+    fireblade_result.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    # group arg_host
+    hosts = args.hosts
+    if args.host_list:
+        with open(f"{args.host_list}", "r") as fo:
+            hosts = [line.strip() for line in fo.readlines() if line.strip() and not line.startswith('#')]
+    if args.mode == 'fetch' and not hosts:
+        parser.error('Mode "fetch" requires hosts, -H or -l')
+    if args.mode == 'match' and not args.pattern:
+        parser.error('Mode "match" requires a pattern, -e')
+
+    tracer = fireblade_trace.from_args(args) if args.mode == 'fetch' else None
+    return hosts, args.mode, args.vlans, args.pattern, args.section, args.refresh, fireblade_archive.from_args(args), fireblade_engine.from_args(args), tracer, fireblade_result.from_args(args)
+
+# process credential
+def getCredential():
+    credential = ['','']
+    uname = input('Username: ')
+    credential[0] = uname.strip()
+    passwd = getpass('Password: ')
+    credential[1] = passwd
+    return credential
+
+# netconf session archiving the configuration of a host; session errors are
+# left to the engine, which retries the transient ones after a backoff
+def fetch(host, uname, passwd, archive, refresh):
+    with Device(host=host, user=uname, password=passwd, gather_facts=False) as dev:
+        status = archive.fetch(dev, host, refresh)
+        result = f'{host},{status},{archive.head(host)[0][:12]}'
+        print (result)
+        return fireblade_result.Result(host, status, result)
+
+def main():
+
+    hosts, mode, vlans, pattern, section, refresh, archive, engine, tracer, tally = getArgs()
+
+    with archive:
+        if mode == 'fetch':
+            credential = getCredential()
+            uname = credential[0]
+            passwd = credential[1]
+
+            print ('Hostname,Status,Configuration')
+            for future in engine.as_completed(fetch, hosts, uname, passwd, archive, refresh):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    result = fireblade_result.error(future.host, err)
+                    print (f'{future.host},{result.status},{result.detail}')
+                tally.add(result, future.attempts)
+            print (f"\n{tally.counts['new']} new, {tally.counts['changed']} changed, {tally.counts['unchanged']} unchanged " +
+                f"configuration(s) of {len(hosts)} host(s) in {archive.path}.")
+            print (tally.summary())
+            tally.report()
+
+        elif mode == 'trunk':
+            print (ninja_nac.TRUNK_HEADER)
+            with fireblade_query.Index(archive) as index:
+                for host, interface in index.trunks(hosts):
+                    print (f'{host},{interface}')
+
+        elif mode == 'edge':
+            with fireblade_query.Index(archive) as index:
+                for host, interface, vlan in index.vlan_members(vlans, hosts):
+                    print (f'{host},{interface},{vlan}')
+
+        elif mode == 'match':
+            with fireblade_query.Index(archive) as index:
+                for host, line in index.match(pattern, hosts, section):
+                    print (f'{host},{line}')
+
+        else:
+            for host in hosts or archive.hosts():
+                print ('\033[1;34m------------------------------------------------\033[0m')
+                print (f'Host: {host}')
+                sys.stdout.write(archive.text(host))
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# fireblade.facts.py shows or drops the host facts that fireblade tools cache
+# in ~/.netauto/cache.sqlite (see fireblade_facts). A host's facts are cached
+# the first time a tool needs them, and by fireblade.hardware.probe.py for
+# campus, role, model and chassis. Drop them after a chassis changes, i.e. a
+# member is added or replaced, or use --refresh_facts on the next run.
+#
+# Example: fireblade.facts.py --show
+# Example: fireblade.facts.py -H bby-acf111-edge-1.managenet.sfu.ca --invalidate
+
+import argparse
+import fireblade_cache
+import fireblade_facts
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(description = 'Host Facts Cache Tool')
+
+    # group arg_host
+    arg_host = parser.add_mutually_exclusive_group()
+    arg_host.add_argument('-H', '--hosts', nargs='+',
+        help='hosts\' FQDN in format of \'host1\' \'host2\'... Default to all cached hosts.')
+    arg_host.add_argument('-l', '--host_list', metavar="FILE", help='Direcotry to a list of hosts.')
+
+    # group arg_action
+    arg_action = parser.add_mutually_exclusive_group(required=True)
+    arg_action.add_argument('--show', action='store_true', help='Print cached facts with their hosts.')
+    arg_action.add_argument('--invalidate', action='store_true', help='Drop cached facts.')
+
+    args = parser.parse_args()
+
+    # group arg_host
+    hosts = args.hosts
+    if args.host_list:
+        with open(f"{args.host_list}", "r") as fo:
+            hosts = [line.strip() for line in fo.readlines() if line.strip() and not line.startswith('#')]
+
+    return hosts, args.show
+
+def main():
+
+    hosts, show = getArgs()
+
+    with fireblade_cache.Cache() as cache:
+        facts = fireblade_facts.Facts(cache)
+        if show:
+            prefixes = [f'{host}/' for host in hosts] if hosts else ['']
+            for prefix in prefixes:
+                for key, value in sorted(cache.items(fireblade_facts.NAMESPACE, prefix).items()):
+                    host, _, name = key.rpartition('/')
+                    print (f'{host},{name},{value}')
+        else:
+            for host in hosts or [None]:
+                facts.invalidate(host)
+            print (f"Cached facts dropped for {len(hosts) if hosts else 'all'} host(s).")
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,11 @@ import os
 import argparse
 from getpass import getpass
 from jnpr.junos import Device
-from jnpr.junos.exception import *
-import concurrent.futures
+import fireblade_engine
+import fireblade_facts
+import fireblade_inventory
+import fireblade_result
+import fireblade_trace
 
 def getCredential():
     credential = ['','']
@@ -24,6 +27,21 @@ def getArgs():
         help='hosts\' FQDN in format of \'host1\' \'host2\'...single and double quote function the same.')
     arg_host.add_argument('-l', '--host_list', metavar="FILE", help='Direcotry to a list of hosts.')
 
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=100, adaptive=True)
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     args = parser.parse_args()
 
     # group arg_host
@@ -36,35 +54,34 @@ def getArgs():
     else:
         hosts = args.hosts
 
-    return hosts
+    facts = fireblade_facts.from_args(args)
+    return hosts, fireblade_engine.from_args(args), facts, fireblade_inventory.from_args(args, facts), fireblade_trace.from_args(args), fireblade_result.from_args(args)
+
+# facts reported by the probe, and facts it caches along for other tools
+REPORTED = ['hostname', 'device_model', 'model_info']
+WARMED = ['campus', 'role', 'model', 'chassis']
 
-def probe(host, username, password):
+def probe(host, username, password, facts):
     errmsg = 'No Error'
     hostname = model = model_info = ''
 
-    try:
-        with Device(host=host,user=username,password=password) as dev:
-            hostname = dev.facts['hostname']
-            model = dev.facts['model']
-            model_info = dev.facts['model_info']
-
-    except ConnectError as err:
-        errmsg += f"Cannot connect to device: {err}"
-    except ConnectAuthError as err:
-        errmsg += f"Cannot authenticate to device: {err}"
-    except ConnectTimeoutError as err:
-        errmsg += f"Connection to device timed out: {err}"
-    except ConnectRefusedError as err:
-        errmsg += f"Connection to device was refused: {err}, please check NETCONF configuration"
-    except RpcError as err:
-        errmsg += f"RPC error: {err}"
+    # no session at all when the facts of the host are cached
+    if facts.warm(host, REPORTED + WARMED):
+        hostname, model, model_info = (facts.cached(host, name) for name in REPORTED)
+        return hostname, model, model_info, errmsg
+
+    # session errors are left to the engine, which retries the transient ones after a backoff
+    with Device(host=host,user=username,password=password) as dev:
+        hostname, model, model_info = (facts.get(dev, host, name) for name in REPORTED)
+        for name in WARMED:
+            facts.get(dev, host, name)
 
     return hostname, model, model_info, errmsg
 
 def main():
     
     try:
-        hosts = getArgs()
+        hosts, engine, facts, selector, tracer, tally = getArgs()
 
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
@@ -75,21 +92,43 @@ def main():
     uname = credential[0]
     passwd = credential[1]
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=100) as executor:
-        futures = [executor.submit(probe, host, uname, passwd) for host in hosts]
-        results = []
-
-        for future in concurrent.futures.as_completed(futures):
-            report = None
-            try:
-                result = future.result()
-                #report = f"hostname: {result[0]}, model: {result[1]}, model_info: {result[2]}" if result[3] is '' else f"{result[3]}{host}"
-                #print (report)
-                results.append(result)
-            except Exception as err:
-                results.append(err)
-        
-        print (results)
+    # hosts the campus, role and model selectors rule out are not probed
+    hosts, dropped = selector.select(hosts)
+    for host, reason in dropped:
+        print (f'{host}: {reason}')
+        tally.add(fireblade_result.Result(host, 'skipped', '', reason))
+
+    results = []
+
+    for future in engine.as_completed(probe, hosts, uname, passwd, facts):
+        report = None
+        try:
+            result = future.result()
+            # hosts the inventory could not tell on are told on the facts the probe cached
+            reason = selector.check(future.host)
+            if reason:
+                print (f'{future.host}: {reason}')
+                tally.add(fireblade_result.Result(future.host, 'skipped', '', reason), future.attempts)
+                continue
+            #report = f"hostname: {result[0]}, model: {result[1]}, model_info: {result[2]}" if result[3] is '' else f"{result[3]}{host}"
+            #print (report)
+            results.append(result)
+            tally.add(fireblade_result.Result(future.host, 'probed'), future.attempts)
+        except Exception as err:
+            # a session error past its retries
+            error = fireblade_result.error(future.host, err)
+            results.append(('', '', '', error.detail))
+            tally.add(error, future.attempts)
+
+    print (results)
+
+    # hosts per outcome, and the failed ones to run again
+    print ()
+    tally.report()
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
             
 if __name__ == '__main__':
     main()
\ No newline at end of file
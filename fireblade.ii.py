@@ -1,18 +1,20 @@
 import sys
 import os
-import re
 import datetime
 import argparse
-import hashlib
 from lxml import etree
 from getpass import getpass
 from jnpr.junos import Device
-from jnpr.junos.exception import *
-from jnpr.junos.utils.start_shell import StartShell
 from jnpr.junos.utils.config import Config
-from jnpr.junos.utils.scp import SCP
-from utils import formatter, fireblade_hw
-import concurrent.futures
+from utils import fireblade_hw
+import fireblade_engine
+import fireblade_facts
+import fireblade_files
+import fireblade_inventory
+import fireblade_portusage
+import fireblade_result
+import fireblade_trend
+import fireblade_trace
 
 # get and process command line options
 def getArgs():
@@ -29,6 +31,41 @@ def getArgs():
     parser.add_argument('-g', '--slax_file', metavar="FILE", required=True,
         help='Directory of a local slax agent file')
 
+    # arg 'mode'
+    parser.add_argument('-m', '--mode', choices=['inventory', 'deploy-agent'], default='inventory',
+        help='Operation mode: Default to "inventory" of inactive interfaces. "deploy-agent" only pushes and verifies the agent, ' +
+        'ahead of inventory runs.')
+
+    # arg 'kinds' of interfaces counted in the inventory
+    parser.add_argument('-k', '--kinds', nargs='+', choices=fireblade_portusage.KINDS, default=['ge', 'mge'],
+        help='Kinds of interfaces counted in the inventory. Default to "ge" and "mge", the copper interfaces.')
+
+    # arg 'export'
+    parser.add_argument('-e', '--export', metavar="FILE",
+        help='File to export the down interfaces of all hosts to, one typed record per interface,\n' +
+        'Parquet if FILE ends with .parquet (requires pyarrow), CSV otherwise.')
+
+    # arg 'trend' of the inventory history
+    fireblade_trend.add_arguments(parser)
+
+    # args 'deploy_ttl' and 'redeploy' of the agent deployment state
+    fireblade_files.add_state_arguments(parser)
+
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=50)
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     # start taking and processing args
     args = parser.parse_args()
 
@@ -42,7 +79,10 @@ def getArgs():
     else:
         hosts = args.hosts
 
-    return hosts, args.slax_file
+    if args.export and args.export.endswith('.parquet') and fireblade_portusage.pyarrow is None:
+        parser.error('--export to Parquet requires pyarrow, please install it or export to CSV')
+
+    return hosts, args.slax_file, fireblade_engine.from_args(args), fireblade_inventory.from_args(args, fireblade_facts.from_args(args)), args.mode, fireblade_files.state_from_args(args), args.kinds, args.export, fireblade_trend.from_args(args), fireblade_trace.from_args(args), fireblade_result.from_args(args)
 
 # process credential
 def getCredential():
@@ -53,197 +93,105 @@ def getCredential():
     credential[1] = passwd
     return credential
 
-# calculate MD5 hash of local file
-def get_md5_hash(filepath):
-    md5_hash = hashlib.md5()
-    with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            md5_hash.update(chunk)
-    return md5_hash.hexdigest()
-
-# function time_in_sec
-def time_in_sec(time):
-    time_dict = {
-        'weeks': 7 * 24 * 60 * 60,
-        'days': 24 * 60 * 60,
-        'hours': 60 * 60,
-        'minutes': 60,
-        'seconds': 1
-    }
-    seconds = 0
-    for unit in time_dict.keys():
-        match = re.search(r'(\d+)\s*{}'.format(unit), time)
-        if match:
-            seconds += int(match.group(1)) * time_dict[unit]
-    return seconds
-
-# netconf session for inactive interface inquiry
-def action(host, uname, passwd, log_dir, slax_file, local_agent_hash):
-
-    try:
-        with Device(host=host, user=uname, password=passwd) as dev:
-
-            # fetch hardware info
-            hw_dict = fireblade_hw.hw_dict(dev)
-
-            ## check if agent file exists on remote host
-            # initialize varibles
-            remote_path = '/var/db/scripts/op/portusage.slax'
-            remote_agent_flag = False
-            scp_agent_flag = True
-            report = f'{host}\n'
-
-            # Use PyEZ RPC to check if file exists
-            remote_agent_report = dev.rpc.file_list(path=remote_path)
-
-            # Check if remote agent exists by examining XML response
-            # If agent doesn't exist: <output>path: No such file or directory</output>
-            # If agent exists: <file-information><file-name>path</file-name></file-information>
-            output_elm = remote_agent_report.find('.//output')
-            file_info_elm = remote_agent_report.find('.//file-name')
-
-            if output_elm is not None and 'No such file or directory' in output_elm.text:
-                remote_agent_flag = False
-            elif file_info_elm is not None:
-                remote_agent_flag = True
-            else:
-                # unpected reponse format
-                remote_agent_flag = False
-
-            if remote_agent_flag:
-                # remote agent exists, check its MD5 hash using RPC
-                try:
-                    remote_agent_md5_report = dev.rpc.get_checksum_information(path=remote_path)
-                    # Extract MD5 from XML response: <checksum>hash</checksum>
-                    checksum_elm = remote_agent_md5_report.find('.//checksum')
-
-                    if checksum_elm is not None and checksum_elm.text:
-                        remote_agent_hash = checksum_elm.text.strip()
-
-                        if remote_agent_hash != local_agent_hash:
-                            report += f'Local & remote agent MD5 hash mismatch, '
-                            report += f'local agent is being copied to remote host\n'
-                        else:
-                            report += f'Remote agent verified'
-                            scp_agent_flag = False
-                    else:
-                        report += f'Unable to extract remote MD5 hash, '
-                        report += f'local agent is being copied to remote host\n'
-
-                except Exception as checksum_err:
-                    report += f'Error getting remote MD5 hash: {checksum_err}, '
-                    report += f'local agent is being copied to remote host\n'
-
-            else:
-                # remote agent doesn't exist
-                report += f'remtoe agent is not found, local agent is being copied to remote host\n'
-
-            if scp_agent_flag:
-                try:
-                    with SCP(dev) as scp:
-                        scp.put(slax_file, remote_path)
-
-                    # initialize varibles
-                    remote_agent_md5_report = None
-                    checksum_elm = None
-                    remote_agent_hash = None
-
-                    # verify agent file integrity after scp
-                    try:
-                        remote_agent_md5_report = dev.rpc.get_checksum_information(path=remote_path)
-                        checksum_elm = remote_agent_md5_report.find('.//checksum')
-
-                        if checksum_elm is not None and checksum_elm.text:
-                            remote_agent_hash = checksum_elm.text.strip()
-
-                            if remote_agent_hash == local_agent_hash:
-                                report += f'agent file copied and verified\n'
-                            else:
-                                raise Exception(f'MD5 checksum failed after scp')
-                        else:
-                            raise Exception('Unable to extract MD5 checksum from remote agent after scp')
-
-                    except Exception as verify_err:
-                        raise Exception(f'unable to verify MD5 checksum after scp: {verify_err}')
-
-                except Exception as scp_err:
-                    print(f'Error during SCP or verification: {scp_err}')
-                    return None
-
-            # getting bootdays
-            up_times = [value['up_time'] for key, value in hw_dict.items() if isinstance(value, dict) and 'up_time' in value]
-            max_sec = max(map(time_in_sec, up_times))
-            weeks, remaining_seconds = divmod(max_sec, 7 * 24 * 60 * 60)
-            days, remaining_seconds = divmod(remaining_seconds, 24 * 60 * 60)
-            boot_wd = f'{days}d' if weeks == 0 else f'{weeks}w{days}d'
-
-            # getting number of members
-            n_member = sum(1 for key in hw_dict['model_info'].keys() if 'fpc' in key)
-
-            # getting number of MP members
-            n_mp = sum(1 for key, value in hw_dict['model_info'].items() if 'fpc' in key and value == 'EX4300-48MP')
-
-            # getting number of P members
-            n_p = sum(1 for key, value in hw_dict['model_info'].items() if 'fpc' in key and value == 'EX4300-48P')
-
-            # getting number of total copper interfaces
-            n_interface_total = 48 * n_member if n_mp != 0 or n_p != 0 else 12 * n_member
-
-            host_shell = StartShell(dev)
-            host_shell.open()
-
-            # getting interfaces in status of 'down' and their last flap time
-            cli_output = host_shell.run(f"cli -c 'op portusage | no-more'", timeout=600)[1]
-            trimed_output = formatter.pop_first_last_lines(cli_output)
+# where portusage.slax runs from on a host
+AGENT_PATH = '/var/db/scripts/op/portusage.slax'
+
+# netconf session for inactive interface inquiry, or for the agent deployment alone in mode 'deploy-agent';
+# returns its Result with the summary line of the host. Session errors are left to the engine, which
+# retries the transient ones after a backoff
+def action(host, uname, passwd, log_dir, slax_file, mode, state, selector, kinds, records, trend):
+
+    with Device(host=host, user=uname, password=passwd) as dev:
+
+        # campus, role and model the inventory left to the session
+        reason = selector.check(host, dev)
+        if reason:
+            print (f'{host}: {reason}')
+            return fireblade_result.Result(host, 'skipped', '', reason)
+
+        ## make sure the agent on remote host matches the local one: no RPC at all if
+        ## it was verified within --deploy_ttl, else one checksum RPC, and scp plus
+        ## another checksum RPC only if it is missing or differs
+        try:
+            ok, agent_report = fireblade_files.stage(dev, {slax_file: AGENT_PATH}, cleanfs=False, state=state)
+        except Exception as scp_err:
+            ok, agent_report = False, scp_err
+        if not ok:
+            print(f'Error during SCP or verification on {host}: {agent_report}')
+            return fireblade_result.Result(host, 'failed', '', f'agent not staged: {agent_report}')
+        report = f'{host}\n{agent_report}\n'
+
+        # agent deployment only
+        if mode == 'deploy-agent':
+            result = f'{host},{agent_report}'
+            print (result)
+            return fireblade_result.Result(host, 'deployed', result)
+
+        # fetch hardware info
+        hw_dict = fireblade_hw.hw_dict(dev)
+
+        # getting bootdays
+        up_times = [value['up_time'] for key, value in hw_dict.items() if isinstance(value, dict) and 'up_time' in value]
+        boot_seconds = max(map(fireblade_portusage.uptime_seconds, up_times))
+        boot_wd = fireblade_portusage.wd(boot_seconds)
+
+        # getting number of members
+        n_member = sum(1 for key in hw_dict['model_info'].keys() if 'fpc' in key)
+
+        # getting number of MP members
+        n_mp = sum(1 for key, value in hw_dict['model_info'].items() if 'fpc' in key and value == 'EX4300-48MP')
+
+        # getting number of P members
+        n_p = sum(1 for key, value in hw_dict['model_info'].items() if 'fpc' in key and value == 'EX4300-48P')
+
+        # getting number of total copper interfaces
+        n_interface_total = 48 * n_member if n_mp != 0 or n_p != 0 else 12 * n_member
+
+        # getting interfaces in status of 'down' and their seconds since last flap, as structured records
+        dev.timeout = 600
+        portusage = dev.rpc.cli(fireblade_portusage.COMMAND, format='xml')
+        if portusage.find('.//port-usage') is not None or portusage.tag == 'port-usage':
+            ports = list(fireblade_portusage.parse_xml(portusage, host, boot_seconds))
+        else:
+            # an older agent has no structured mode, take its text mode instead
+            text = ''.join(dev.rpc.cli(fireblade_portusage.TEXT_COMMAND, format='text').itertext())
 
             # return error if error
-            if re.match(r'.*error*', trimed_output[1]):
-                result = f'{host} error message: {trimed_output[1]}'
+            if not fireblade_portusage.is_text(text):
+                # the agent may have gone since it was verified, check it on the next run
+                state.invalidate(host)
+                result = f'{host} error message: {" ".join(portusage.itertext()).strip()}'
                 print (result)
-                return result
-
-            # extracting interfaces which last flap time is same as bootdays
-            interface_pattern = r'\t(.*?)\t'
-            time_pattern = r'\((.*?)\)'
-            n_ii = 0
-            list_ii = ''
-            # match inactive interfaces
-            for item in trimed_output:
-                matching_time = re.search(time_pattern, item)
-                interface = re.search(interface_pattern, item).group(1)
-                matching_interface = interface if re.match(r'.*ge.*', interface) else None
-                if matching_time and matching_interface and matching_time.group(1).split()[0] == boot_wd:
-                    list_ii += f'{matching_interface}\n'
-                    n_ii += 1
-
-            # log list of inactive interfaces
-            with open(f'{log_dir}/{host}.ii.list.log','a') as f_o:
-                f_o.write(report)
-                f_o.write(f'---inventory of inactive interfaces---\n{list_ii}')
-                f_o.write(f'\n---portusage raw data---\n{trimed_output}')
-
-            result = f'{host},{boot_wd},{n_member},{n_mp},{n_p},{n_interface_total},{n_ii},{round(100*n_ii/n_interface_total)}%'
-            
-            # log and screen ourput the report for this host 
-            print (result)            
-            return result
-
-    except ConnectError as err:
-        print(f"Cannot connect to device: {err}")
-    except ConnectAuthError as err:
-        print(f"Cannot authenticate to device: {err}")
-    except ConnectTimeoutError as err:
-        print(f"Connection to device timed out: {err}")
-    except ConnectRefusedError as err:
-        print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-    except RpcError as err:
-        print(f"RPC error: {err}")
+                return fireblade_result.Result(host, 'failed', result, 'portusage agent error')
+            ports = list(fireblade_portusage.parse_text(text, host, boot_seconds))
+
+        # interfaces which last flap time is same as bootdays
+        if records is not None:
+            records.extend(ports)
+        list_ii = ''.join(f'{port.name}\n' for port in ports if port.inactive and port.kind in kinds)
+        n_ii = sum(1 for port in ports if port.inactive and port.kind in kinds)
+
+        # log list of inactive interfaces
+        with open(f'{log_dir}/{host}.ii.list.log','a') as f_o:
+            f_o.write(report)
+            f_o.write(f'---inventory of inactive interfaces---\n{list_ii}')
+            f_o.write(f'\n---portusage records---\n')
+            f_o.writelines('\t'.join(str(field) for field in port[1:]) + '\n' for port in ports)
+
+        # record this host in the inventory history
+        trend.add(host, fireblade_engine.campus(host), fireblade_engine.role(host), boot_seconds, n_interface_total, n_ii, ports)
+
+        result = f'{host},{boot_wd},{n_member},{n_mp},{n_p},{n_interface_total},{n_ii},{round(100*n_ii/n_interface_total)}%'
+        
+        # log and screen ourput the report for this host 
+        print (result)            
+        return fireblade_result.Result(host, 'inventoried', result)
 
 def main():
 
     # command line options
     try:
-        hosts, slax_file = getArgs()
+        hosts, slax_file, engine, selector, mode, state, kinds, export, trend, tracer, tally = getArgs()
 
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
@@ -273,7 +221,7 @@ def main():
 
     # calculate MD5 hash
     try:
-        local_md5 = get_md5_hash(slax_file)
+        local_md5 = fireblade_files.md5(slax_file)
         print(f"Local portusage.slax MD5: {local_md5}\n")
     except IOError as err:
         print(f"Error reading SLAX file: {err}")
@@ -293,24 +241,53 @@ def main():
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    print (f'\nFireblade.ii is inquiring the inventory of inactive interfaces on below chassis.\nAn summary for all chassis and their respective inventory files will be saved in directory:\n{log_dir}\n')
-    print ('Hostname,Number of alive days,Number of members,Number of MPs,Number of Ps,Number of total interfaces,Number of inactive interfaces,Percentage of inactive interfaces')
-
-    with open(f'{log_dir}/summary.log', 'w') as f_o:
-        f_o.write('Hostname,Number of alive days,Number of members,Number of MPs,Number of Ps,Number of total interfaces,Number of inactive interfaces,Percentage of inactive interfaces\n')
-        # run commands on each host in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-            futures = [executor.submit(action, host, uname, passwd, log_dir, slax_file, local_md5) for host in hosts]
-            concurrent.futures.wait(futures)
-
-            for future in futures:
-                try:
-                    result = future.result()
-                    if result:
-                        f_o.write(f'{result}\n')
-
-                except TypeError as err:
-                    print (f'An error occurred: {err}')
+    # summary of agent deployment, or of inventory
+    if mode == 'deploy-agent':
+        summary_log = f'{log_dir}/deploy.log'
+        header = 'Hostname,Agent'
+        print (f'\nFireblade.ii is deploying the portusage agent on below chassis.\nAn summary for all chassis will be saved in:\n{summary_log}\n')
+    else:
+        summary_log = f'{log_dir}/summary.log'
+        header = 'Hostname,Number of alive days,Number of members,Number of MPs,Number of Ps,Number of total interfaces,Number of inactive interfaces,Percentage of inactive interfaces'
+        print (f'\nFireblade.ii is inquiring the inventory of inactive interfaces on below chassis.\nAn summary for all chassis and their respective inventory files will be saved in directory:\n{log_dir}\n')
+    print (header)
+
+    # hosts the campus, role and model selectors rule out are skipped without a session
+    hosts, dropped = selector.select(hosts)
+    for host, reason in dropped:
+        print (f'{host}: {reason}')
+        tally.add(fireblade_result.Result(host, 'skipped', '', reason))
+
+    # inventory runs are numbered in the trend store, see fireblade.trend.py
+    if mode == 'inventory':
+        trend.start(kinds)
+
+    with open(summary_log, 'w') as f_o, trend:
+        f_o.write(f'{header}\n')
+        # run commands on each host in parallel, keeping the records of all hosts for --export only
+        records = [] if export and mode == 'inventory' else None
+        for future in engine.as_completed(action, hosts, uname, passwd, log_dir, slax_file, mode, state, selector, kinds, records, trend):
+            try:
+                result = future.result()
+            except Exception as err:
+                result = fireblade_result.error(future.host, err)
+                print (f'{future.host}: {result.detail}')
+            if result.output:
+                f_o.write(f'{result.output}\n')
+            tally.add(result, future.attempts)
+
+    # hosts per outcome, and the failed ones to run again
+    print ()
+    tally.report()
+
+    # typed records of the down interfaces of all hosts
+    if export and mode == 'inventory':
+        fireblade_portusage.export(records, export)
+        print (f'\n{len(records)} interface records exported to {export}')
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
 
 if __name__ == '__main__':
     main()
@@ -11,8 +11,14 @@ from jnpr.junos.utils.scp import *
 from jnpr.junos.utils.sw import *
 from jnpr.junos.utils.start_shell import StartShell
 from jnpr.junos.utils.config import Config
-from utils import formatter, fireblade_hw
-import concurrent.futures
+from utils import formatter
+import fireblade_engine
+import fireblade_facts
+import fireblade_files
+import fireblade_inventory
+import fireblade_journal
+import fireblade_result
+import fireblade_trace
 from pprint import pprint
 
 # get and process command line options
@@ -32,6 +38,27 @@ def getArgs():
         '0-20 minutes for a host at the desired hour')
     parser.add_argument('-s', '--summary_log', metavar="FILE", required=True, help='Directory to an output file')
 
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=100, adaptive=True)
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # args 'journal' and 'resume' of the job journal
+    fireblade_journal.add_arguments(parser, 'ji')
+
+    # arg 'upload_limit' of package staging
+    fireblade_files.add_arguments(parser)
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     args = parser.parse_args()
 
     # process group arg_host
@@ -44,7 +71,8 @@ def getArgs():
         with open(f"{args.hosts_list}", "r") as fo:
             hosts = [line.strip() for line in fo.readlines() if not line.startswith('#')]
 
-    return hosts, args.action, args.summary_log
+    facts = fireblade_facts.from_args(args)
+    return hosts, args.action, args.summary_log, fireblade_engine.from_args(args), facts, fireblade_inventory.from_args(args, facts), fireblade_journal.from_args(args, parser), fireblade_files.from_args(args), fireblade_trace.from_args(args), fireblade_result.from_args(args)
 
 # get credential
 def getCredential():
@@ -80,70 +108,80 @@ def myprogress(dev, report):
     with open(f'logs/{dev.hostname.split(".")[0]}-junosinstallation-{now.strftime("%Y")}-{now.strftime("%m")}-{now.strftime("%d")}.log', 'a') as fo:
         fo.write(f'{now.strftime("%H")}:{now.strftime("%M")} {report}\n')
 
-# install junos on a chassis of same devices
-def install_onepkg(dev, pkg, action):
-
+# install junos on a chassis of same devices, from a package staged in /var/tmp
+def install_onepkg(dev, pkg, action, budget=None):
 
+    # stage the package, no upload if it is there already
+    ok, msg = fireblade_files.stage(dev, [pkg], budget=budget, progress=myprogress)
+    if not ok:
+        return ok, msg, msg
 
     sw = SW(dev)
-    ok, msg = sw.install(package=pkg, validate=False, progress=myprogress)
+    ok, msg = sw.install(package=pkg, remote_path=fireblade_files.DEFAULT_DIR, no_copy=True, cleanfs=False, validate=False, progress=myprogress)
+    action_report = msg
 
     if ok:
         action_report = sw.reboot() if action == 'now' else sw.rollback() if action == 'rollback' else sw.reboot(at=action)
 
     return ok, msg, action_report
 
-# install junos on a mixed chassis
-def install_twopkg(dev, p_pkg, mp_pkg, action):
+# install junos on a mixed chassis, from packages staged in /var/tmp
+def install_twopkg(dev, p_pkg, mp_pkg, action, budget=None):
 
     # test point
 #    return True, dev.facts['hostname']
 
     pkg_set = [p_pkg, mp_pkg]
+
+    # stage the packages, no upload for those there already
+    ok, msg = fireblade_files.stage(dev, pkg_set, budget=budget, progress=myprogress)
+    if not ok:
+        return ok, msg, msg
+
     sw = SW(dev)
-    ok, msg = sw.install(pkg_set=pkg_set, validate=False, progress=myprogress)
+    ok, msg = sw.install(pkg_set=pkg_set, remote_path=fireblade_files.DEFAULT_DIR, no_copy=True, cleanfs=False, validate=False, progress=myprogress)
+    action_report = msg
 
     if ok:
         action_report = sw.reboot() if action == 'now' else sw.rollback() if action == 'rollback' else sw.reboot(at=action)
 
     return ok, msg, action_report
 
-# call installation fuctions for chassis
-def installJUNOS(host, uname, passwd, junos, action):
+# call installation fuctions for chassis; returns (ok, host, report), ok being
+# True, False or 'skipped' for a host no installation is meant for. Session
+# errors are left to the engine, which retries the transient ones after a
+# backoff, and then to main
+def installJUNOS(host, uname, passwd, junos, action, facts, selector, journal, budget=None):
 
     # set action o'{offset:02d}'r boot time
     if action not in ['rollback', 'now']:
         action += f'{random.randint(0, 20):02d}'
 
-    try:
-        with Device(host=host, user=uname, password=passwd) as dev:
-            
-            # chassis type dictates package
-            chassis = fireblade_hw.chassis(dev)
-            if chassis == 'EX4300-48P' and junos["p_pkg"] != 'skip_pkg':
-                ok, msg, action_report = install_onepkg(dev, junos["p_pkg"], action)
-            elif chassis == 'EX4300-48MP' and junos["mp_pkg"] != 'skip_pkg':
-                ok, msg, action_report = install_onepkg(dev, junos["mp_pkg"], action)
-            elif chassis == 'EX2300-C-12P' and junos["c_pkg"] != 'skip_pkg':
-                ok, msg, action_report = install_onepkg(dev, junos["c_pkg"], action)
-            elif chassis == 'mixed' and junos["p_pkg"] != 'skip_pkg' and junos["mp_pkg"] != 'skip_pkg':
-                ok, msg, action_report = install_twopkg(dev, junos["p_pkg"], junos["mp_pkg"], action)
-            else:
-                ok = False
-                action_report = f'JUNOS installation on {host} is skipped due to hardware mismatch, invaid or insufficient JUNOS installation package'
-
-        return ok, host, action_report
-
-    except ConnectError as err:
-        print(f"Cannot connect to device: {err}")
-    except ConnectAuthError as err:
-        print(f"Cannot authenticate to device: {err}")
-    except ConnectTimeoutError as err:
-        print(f"Connection to device timed out: {err}")
-    except ConnectRefusedError as err:
-        print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-    except RpcError as err:
-        print(f"RPC error: {err}")
+    # no fact gathering when the chassis of the host is cached
+    with Device(host=host, user=uname, password=passwd, **facts.device_args(host, ['chassis'] + selector.pending(host))) as dev:
+        journal.record(host, 'connected')
+        
+        # campus, role and model the inventory left to the session
+        reason = selector.check(host, dev)
+        if reason:
+            return 'skipped', host, f'JUNOS installation on {host} is skipped. {reason}'
+
+        # chassis type dictates package
+        chassis = facts.get(dev, host, 'chassis')
+        journal.record(host, 'installing', chassis=chassis)
+        if chassis == 'EX4300-48P' and junos["p_pkg"] != 'skip_pkg':
+            ok, msg, action_report = install_onepkg(dev, junos["p_pkg"], action, budget)
+        elif chassis == 'EX4300-48MP' and junos["mp_pkg"] != 'skip_pkg':
+            ok, msg, action_report = install_onepkg(dev, junos["mp_pkg"], action, budget)
+        elif chassis == 'EX2300-C-12P' and junos["c_pkg"] != 'skip_pkg':
+            ok, msg, action_report = install_onepkg(dev, junos["c_pkg"], action, budget)
+        elif chassis == 'mixed' and junos["p_pkg"] != 'skip_pkg' and junos["mp_pkg"] != 'skip_pkg':
+            ok, msg, action_report = install_twopkg(dev, junos["p_pkg"], junos["mp_pkg"], action, budget)
+        else:
+            ok = 'skipped'
+            action_report = f'JUNOS installation on {host} is skipped due to hardware mismatch, invaid or insufficient JUNOS installation package'
+
+    return ok, host, action_report
 
 def main():
 
@@ -153,6 +191,13 @@ def main():
         hosts = args[0]
         action = args[1]
         summary_log = args[2]
+        engine = args[3]
+        facts = args[4]
+        selector = args[5]
+        journal = args[6]
+        budget = args[7]
+        tracer = args[8]
+        tally = args[9]
 
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
@@ -166,6 +211,14 @@ def main():
     # junos pkg info
     junos_pkg = getJUNOS()
 
+    # md5 of each package, computed once for all hosts to check their staged copies against
+    md5s = {os.path.basename(pkg): fireblade_files.md5(pkg) for pkg in junos_pkg.values() if pkg != 'skip_pkg'}
+    for name, md5 in md5s.items():
+        print (f'{name} MD5: {md5}')
+
+    # a resumed job has to be of the same action and packages
+    journal.start(action=action, packages=md5s)
+
     # run commands on each host in parallel
 
     print ('\nJUNOS installation is undergoing and may take hours. Please be patient.')
@@ -173,29 +226,60 @@ def main():
     print ('\n1) tail summary log file at ' + f'{summary_log} to view summary of the progress on targeted hosts, and')
     print ('2) tail log files named "host-junosinstallation-yyyy-mm-dd.log" for detailed progress on each host\n')
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=100) as executor:
-        futures = [executor.submit(installJUNOS, host, uname, passwd, junos_pkg, action) for host in hosts]
-        results =[]
-
-        with open(summary_log,'a') as fo:
-
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    now = datetime.datetime.now()
-                    timestamp = f'{now.strftime("%Y")}-{now.strftime("%m")}-{now.strftime("%d")} {now.strftime("%H")}:{now.strftime("%M")}'
+    results =[]
+
+    # hosts the campus, role and model selectors rule out are skipped without a session
+    hosts, dropped = selector.select(hosts)
+
+    # hosts a resumed job has done already are skipped too
+    hosts, done = journal.pending(hosts)
+    if journal.resume:
+        print (f'\nResuming the job in {journal.path}: {len(done)} host(s) done already, {len(hosts)} to go.')
+
+    with journal, open(summary_log,'a') as fo:
+
+        for host, reason in dropped:
+            report = f"{host}: JUNOS installation skipped. {reason}"
+            fo.write(report + '\n')
+            print ('\n'+report)
+            tally.add(fireblade_result.Result(host, 'skipped', '', reason))
+
+        for future in engine.as_completed(installJUNOS, hosts, uname, passwd, junos_pkg, action, facts, selector, journal, budget):
+            try:
+                result = future.result()
+                journal.record(future.host, 'done' if result[0] is True else 'unchanged' if result[0] == 'skipped' else 'failed', report=result[2])
+                now = datetime.datetime.now()
+                timestamp = f'{now.strftime("%Y")}-{now.strftime("%m")}-{now.strftime("%d")} {now.strftime("%H")}:{now.strftime("%M")}'
+                if result[0] == 'skipped':
+                    report = f"{timestamp} {result[2]}"
+                else:
                     report = f"{timestamp} {result[1]}: JUNOS installation completed." if result[0] is True else f"{result[1]}: JUNOS installation failed."
                     report += '\n' + f"{timestamp} {result[1]} Post installation action: {result[2]}"
-                    fo.write(report + '\n')
-                    print ('\n'+report)
-                    results.append(result)
-                    results.append('\n')
-                except Exception as err:
-                    results.append(err)
-                    results.append('\n')
-    
-            print ('results: ')
-            print (results)
+                fo.write(report + '\n')
+                print ('\n'+report)
+                results.append(result)
+                results.append('\n')
+                status = 'installed' if result[0] is True else 'skipped' if result[0] == 'skipped' else 'failed'
+                tally.add(fireblade_result.Result(future.host, status, '', result[2]), future.attempts)
+            except Exception as err:
+                # no result at all after a session error, past its retries
+                error = fireblade_result.error(future.host, err)
+                print (f'\n{future.host}: {error.detail}')
+                journal.record(future.host, 'failed', error=str(err))
+                results.append(err)
+                results.append('\n')
+                tally.add(error, future.attempts)
+
+        print ('results: ')
+        print (results)
+
+    # hosts per outcome, and the failed ones to run again
+    print ()
+    tally.report()
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
 
 if __name__ == '__main__':
     main()
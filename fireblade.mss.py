@@ -1,12 +1,20 @@
 import sys
 import argparse
 from getpass import getpass
-from jnpr.junos import Device
-from jnpr.junos.exception import *
 from jnpr.junos.utils.start_shell import StartShell
-from jnpr.junos.utils.config import Config
-from utils import formatter, fireblade_hw
-import concurrent.futures
+from utils import formatter
+import fireblade_pool
+import fireblade_config
+import fireblade_engine
+import fireblade_facts
+import fireblade_inventory
+import fireblade_rpc
+import fireblade_sink
+import fireblade_mac
+import fireblade_trace
+import fireblade_archive
+import fireblade_query
+import fireblade_result
 
 # get and process command line options
 def getArgs():
@@ -29,37 +37,60 @@ def getArgs():
     arg_cmd.add_argument('-f', '--cmdfile', metavar="FILE", help='Directory to a cli command file.')
 
     # arg 'mode'
-    parser.add_argument('-m', '--mode', choices=['show','testride', 'comconf', 'commit', 'intdesc'], default='show', 
+    parser.add_argument('-m', '--mode', choices=['show','testride', 'comconf', 'commit', 'intdesc', 'macdelta'], default='show', 
         help='Operation mode: Default to "show". Other choices are:\n' + 
         '"testride" for testing configuration;\n' + 
         '"comconf" for "commit confirm" with input minutes;\n' + 
         '"commit" as what it is;\n' +
-        '"intdesc" for "update interface description" with specific input VLAN names')
-
-    # arg 'campus'
-    parser.add_argument('-p', '--campus', choices=['bby', 'sry', 'van'],
-        help='Campus: self-explanatory. All campuses are covered if no option of campus is provided.')
-
-    # arg 'role'
-    parser.add_argument('-r', '--role', default='all', 
-        choices=['all', 'core', 'edge', 'dc', 'ext', 'mgmt'], 
-        help='Chassis role: Default to "all" for all chassis. Other choices are: ' +
-        '\n"core" for CORE switches;' + 
-        '\n"edge" for EDGE switches;' + 
-        '\n"ext" for EXTENSION switches; ' + 
-        '\"dc" for DATACENTRE switches, and "mgmt" for MANAGEMENT network.')
-
-    # arg 'model'
-    parser.add_argument('-d', '--model', default='all', choices=['all', 'c', 'p', 'mp', 'm'], 
-        help='Chassis model: Default to "all" for all models,other choices are:' + 
-        '\n"c" for "EX2300-C-12P",' + 
-        '\n"p" for "EX4300-48P",' + 
-        '\n"mp" for "EX4300-48MP",' +
-        '\nand "m" for manual input.')
+        '"intdesc" for "update interface description" with specific input VLAN names;\n' +
+        '"macdelta" for MAC entries added, removed or moved since the last "macdelta" run')
+
+    # arg 'mac_store'
+    parser.add_argument('--mac_store', metavar="DIR", default=fireblade_mac.DEFAULT_STORE,
+        help=f'Directory of the MAC table snapshots of mode "macdelta". Default to {fireblade_mac.DEFAULT_STORE}')
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
 
     parser.add_argument('-s', '--silencer', action="store_false",
         help='Silence the output for mismatch hosts.')
 
+    # arg 'output_format'
+    parser.add_argument('-o', '--output_format', choices=['text', 'json', 'csv'], default='text',
+        help='Output format of mode "show": Default to "text" for CLI screen output. Other choices are:' +
+        '\n"json" for one JSON record per line and' +
+        '\n"csv" for CSV rows with a header,' +
+        '\nboth fetched through Junos XML RPCs instead of a shell. Supported commands are:' +
+        '\n  ' + '\n  '.join(list(fireblade_rpc.TABLES) + [fireblade_rpc.CONFIG]))
+
+    # arg 'archive'
+    parser.add_argument('--archive', metavar='DIR', nargs='?', const=fireblade_archive.DEFAULT_DIR,
+        help='Build the commands of mode "intdesc" and of "replace pattern" from the configurations archived by\n' +
+        f'fireblade.archive.py in DIR, default to {fireblade_archive.DEFAULT_DIR}, instead of querying each host.')
+
+    # arg 'output_log'
+    parser.add_argument('-g', '--output_log', metavar="FILE",
+        help='Directory to a file that receives the output of each host as soon as it completes.\n' +
+        'Default to the screen.')
+
+    # args 'ordered' and 'window'
+    parser.add_argument('--ordered', action='store_true',
+        help='Keep output in the order of the host list instead of the order of completion.')
+    parser.add_argument('--window', type=int,
+        help='Number of hosts --ordered may run ahead of the oldest unfinished host. Default to twice --workers.')
+
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=50)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     # start taking and processing args
     args = parser.parse_args()
 
@@ -86,10 +117,36 @@ def getArgs():
     else:
         commands = []
 
-    # model
-    model = 'all' if args.model == 'all' else 'EX4300-48P' if args.model == 'p' else 'EX4300-48MP' if args.model == 'mp' else 'EX2300-C-12P' if args.model == 'c' else input("Please key in specific model: ") if args.model == 'm' else None
-    
-    return hosts, commands, args.mode, model, args.role, args.campus, args.silencer #, args.port
+    # structured output takes commands that map to an RPC, and a single command for csv
+    if args.output_format != 'text':
+        if args.mode != 'show':
+            parser.error('--output_format json/csv is for mode "show" only')
+        for command in commands:
+            try:
+                fireblade_rpc.parse(command)
+            except ValueError as err:
+                parser.error(str(err))
+        if args.output_format == 'csv' and len(commands) != 1:
+            parser.error('--output_format csv takes exactly one command')
+
+    # mode 'macdelta' always reads the whole table and writes csv rows
+    if args.mode == 'macdelta':
+        commands = [fireblade_mac.COMMAND]
+        args.output_format = 'csv'
+
+    # engine, with a reorder window if output keeps host-list order
+    engine = fireblade_engine.from_args(args)
+    if args.ordered:
+        engine.window = args.window or 2 * engine.limit
+
+    # campus, role and model selectors on the facts cache
+    facts = fireblade_facts.from_args(args)
+    selector = fireblade_inventory.from_args(args, facts)
+
+    # index of archived configurations, if commands are to be built offline
+    index = fireblade_query.Index(fireblade_archive.Archive(args.archive)) if args.archive else None
+
+    return hosts, commands, args.mode, selector, args.silencer, engine, args.output_format, args.output_log, args.ordered, args.mac_store, facts, fireblade_trace.from_args(args), index, fireblade_result.from_args(args)
 
 # process credential
 def getCredential():
@@ -100,26 +157,33 @@ def getCredential():
     credential[1] = passwd
     return credential
 
+# bring the archived configuration of a host up to date before the index builds
+# its commands: a host changed since, or never archived, is fetched and its new
+# configuration indexed, as commands of a stale one would undo later changes
+def current(index, dev, host):
+    if index.archive.fetch(dev, host) != 'unchanged':
+        index.refresh()
+
 # funciton 'convertreplace' generate 
-def convertreplace(dev, old_pattern, new_pattern):
+def convertreplace(dev, host, old_pattern, new_pattern, pool=None, index=None):
 
-    # generate command to get matched lines
-    command = [f"show configuration | display set | match {old_pattern}"]
-    # get matched lines
-    matched_config_lines = inquiry(dev, command).splitlines()
-    
-    # generate command sets equipvalent to 'replace pattern with'
-    commands = []
-    for line in matched_config_lines:
-        commands.append(line.replace('set','delete').strip())
-        commands.append(line.replace(old_pattern, new_pattern).strip())
+    # get matched lines, from the archive index if given
+    if index:
+        matched_config_lines = [line for _, line in index.match(old_pattern, hosts=[host])]
+    else:
+        command = [f"show configuration | display set | match {old_pattern}"]
+        matched_config_lines = inquiry(dev, command, pool).splitlines()
 
-    return commands
+    # generate command sets equipvalent to 'replace pattern with'
+    return fireblade_query.replace_commands(matched_config_lines, old_pattern, new_pattern)
 
-# function 'inqury' to excute show commands
-def inquiry(dev, commands):
-    host_shell = StartShell(dev)
-    host_shell.open()
+# function 'inqury' to excute show commands, on the pooled shell of the host if a pool is given
+def inquiry(dev, commands, pool=None):
+    if pool:
+        host_shell = pool.shell(dev)
+    else:
+        host_shell = StartShell(dev)
+        host_shell.open()
     print_out = ''
 
     # excute show commands
@@ -132,118 +196,97 @@ def inquiry(dev, commands):
         for line in trimed_output:
             print_out += line + "\n"
 
-    host_shell.close()
+    if not pool:
+        host_shell.close()
     return print_out
 
-# funciton 'config_change' to implement changes
+# funciton 'config_change' to implement changes, all commands in one load; it
+# returns the print out and the status of the host
 def config_change(dev,commands,mode,time):
-    print_out = ''
-    with Config(dev, mode='exclusive') as cu:
-    # excute commands
-        for command in commands:
-            cu.load(command, format='set', ignore_warning=True)
-        diff = cu.diff()
-        print_out += f'{diff}\n' if len(commands) != 0 else f'{cu.diff(rb_id=1)}\n' if len(commands) == 0 else ''
-        try:
-            cu.commit_check(timeout=600)
-            print_out += '\033[32m' + 'Changes passed commit check.' + '\033[0m\n'
-            if mode == 'commit':
-                cu.commit(ignore_warning=True, timeout=600)
-                print_out += '\033[32m' + 'Changes committed.' + '\033[0m\n'
-            elif mode == 'comconf':
-                cu.commit(ignore_warning=True, timeout=600, confirm=time)
-                print_out += '\033[93;1m' + f'Changes committed and will be rolled back in {time} minutes unless confirmed ' + '\033[0m\n'
-            else:
-                cu.rollback()
-                print_out += '\033[93;1m' + 'Changes rolled back.' + '\033[0m\n'
-        except CommitError as err:
-            cu.rollback()
-            print_out += f'\033[31mError\033[0m in commit check, rolled back with {err.message}'
-        return print_out
+    return fireblade_config.change(dev, commands, mode, confirm=time)
 
-# netconf session
-def ncsession(host, campus, model, role, commands, mode, commit_mode, time, uname, passwd, si, vlan):
+# notes on a skipped host go with text output, structured output keeps them on stderr
+def skipped(print_out, si, output_format):
+    if si and output_format != 'text':
+        print (print_out, file=sys.stderr)
+    return print_out + '\n' if si and output_format == 'text' else None
 
-    try:
-        with Device(host=host, user=uname, password=passwd) as dev:
-
-            # where it starts for a host
-            print_out = f"\033[1;34m------------------------------------------------\033[0m\nHost: {host}\n"
-
-            # on/off switch of campus, role and model
-            # campus
-            camp = fireblade_hw.campus(dev)
-            if campus is not None and campus != camp:
-                print_out += f"\nThis host is on campus {camp.upper()}, campus mismatched, skipping"
-                print (print_out) if si else None
-                return
-
-            # role
-            r = fireblade_hw.role(dev)
-            if role != 'all' and role != r:
-                print_out += f"\nThis host is a '{r.upper()}' switch, chassis role mismatched, skipping."
-                print (print_out) if si else None
-                return
-
-            # model
-            m = fireblade_hw.model(dev)
-            if model != 'all' and model != m:
-                print_out += f"\nThis host is an '{m.upper()}' chassis, model mismatched, skipping."
-                print (print_out) if si else None
-                return
-            
-            # mode dictates
-            if mode == 'show':  # commands to make inquiry
-                print (print_out + f'\n{inquiry(dev,commands)}')
+# where the output block of a host starts
+def banner(host):
+    return f"\033[1;34m------------------------------------------------\033[0m\nHost: {host}\n"
+
+# netconf session, returns its Result with the output block of the host. Session
+# errors are left to the engine, which retries the transient ones after a backoff
+def ncsession(host, selector, commands, mode, commit_mode, time, pool, si, vlan, output_format='text', mac_store=None, facts=None, index=None):
+
+    # no fact gathering when the selectors the inventory could not resolve are cached
+    with pool.session(host, **facts.device_args(host, selector.pending(host))) as dev:
+
+        # where it starts for a host
+        print_out = banner(host)
 
-            elif mode == 'intdesc': # update interface description per its vlan
-                
-                interfaces = []
+        # on/off switch of campus, role and model the inventory left to the session
+        reason = selector.check(host, dev)
+        if reason:
+            print_out += f"\n{reason}"
+            return fireblade_result.Result(host, 'skipped', skipped(print_out, si, output_format), reason)
+        
+        # mode dictates
+        if mode == 'show' and output_format != 'text':   # structured records through RPCs
+            return fireblade_result.Result(host, 'shown', fireblade_rpc.render(dev, host, commands, output_format))
 
+        elif mode == 'macdelta':  # changes of the MAC table since last run
+            return fireblade_result.Result(host, 'shown', fireblade_mac.collect(dev, host, mac_store))
+
+        elif mode == 'show':  # commands to make inquiry
+            return fireblade_result.Result(host, 'shown', print_out + f'\n{inquiry(dev,commands,pool)}\n')
+
+        elif mode == 'intdesc': # update interface description per its vlan
+
+            interfaces = []
+
+            # access interfaces of the vlan from the archive index, no query on the host
+            if index:
+                current(index, dev, host)
+                interfaces = [interface for _, interface, _ in index.vlan_members([vlan], hosts=[host])]
+
+            else:
                 # query list of interfaces that are assigned with the vlan
-                outputs = inquiry(dev,['show configuration interfaces | display set | match ' + f'{vlan}'])
+                outputs = inquiry(dev,['show configuration interfaces | display set | match ' + f'{vlan}'],pool)
                 for item in outputs.splitlines():
                     interfaces.append(item.split()[2])
 
                 # remove trunked ports from interfaces
-                outputs = inquiry(dev,['show configuration interfaces | display set | match trunk'])
+                outputs = inquiry(dev,['show configuration interfaces | display set | match trunk'],pool)
                 for item in outputs.splitlines():
                     trunk_interface = item.split()[2]
                     interfaces.remove(trunk_interface) if trunk_interface in interfaces else None
-                
-                # populate commands to update interface description
-                commands = []
-                for item in interfaces:
-                    commands.append('set interfaces ' + f'{item}' + ' description ' + f'{vlan}')
-
-                # call function 'config_change' to implement the interface description update
-                print (print_out + f'\n{config_change(dev,commands,commit_mode,time)}')
-
-            else:   # commands to make configuration changes
-                # sort out commands to comply with Juniper RPC
-                sorted_commands = []
-                for command in commands:
-                    command_split = command.split()
-                    if command_split[0] == 'replace':
-                        # go convertreplace
-                        replace_pattern_commands = convertreplace(dev, command_split[2], command_split[4])
-                        sorted_commands += replace_pattern_commands
-                    else:
-                        sorted_commands.append(command)
-
-                # call function 'config_change' to implement the sorted configuration change commands
-                print (print_out + f'\n{config_change(dev,sorted_commands,mode,time)}')
-
-    except ConnectError as err:
-        print(f"Cannot connect to device: {err}")
-    except ConnectAuthError as err:
-        print(f"Cannot authenticate to device: {err}")
-    except ConnectTimeoutError as err:
-        print(f"Connection to device timed out: {err}")
-    except ConnectRefusedError as err:
-        print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-    except RpcError as err:
-        print(f"RPC error: {err}")
+            
+            # populate commands to update interface description
+            commands = fireblade_query.intdesc_commands(interfaces, vlan)
+
+            # call function 'config_change' to implement the interface description update
+            change_out, status = config_change(dev,commands,commit_mode,time)
+            return fireblade_result.Result(host, status, print_out + f'\n{change_out}\n')
+
+        else:   # commands to make configuration changes
+            if index and any(command.split()[0] == 'replace' for command in commands):
+                current(index, dev, host)
+
+            # sort out commands to comply with Juniper RPC
+            sorted_commands = []
+            for command in commands:
+                command_split = command.split()
+                if command_split[0] == 'replace':
+                    # go convertreplace
+                    replace_pattern_commands = convertreplace(dev, host, command_split[2], command_split[4], pool, index)
+                    sorted_commands += replace_pattern_commands
+                else:
+                    sorted_commands.append(command)
+
+            # call function 'config_change' to implement the sorted configuration change commands
+            change_out, status = config_change(dev,sorted_commands,mode,time)
+            return fireblade_result.Result(host, status, print_out + f'\n{change_out}\n')
 
 def main():
 
@@ -253,10 +296,17 @@ def main():
         hosts = args[0]
         commands = args[1]
         mode = args[2]
-        model = args[3]
-        role = args[4]
-        campus = args[5]
-        silencer = args[6]
+        selector = args[3]
+        silencer = args[4]
+        engine = args[5]
+        output_format = args[6]
+        output_log = args[7]
+        ordered = args[8]
+        mac_store = fireblade_mac.SnapshotStore(args[9]) if mode == 'macdelta' else None
+        facts = args[10]
+        tracer = args[11]
+        index = args[12]
+        tally = args[13]
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
         return
@@ -270,25 +320,43 @@ def main():
     uname = credential[0]
     passwd = credential[1]
 
-    print (f"commands: \n{commands}")
-
-    # run commands on each host in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        futures = [executor.submit(ncsession, host, campus, model, role, commands, mode, commit_mode, time, uname, passwd, silencer, vlan_name) 
-        for host in hosts]
-        concurrent.futures.wait(futures)
-
-        for future in futures:
+    if output_format == 'text':
+        print (f"commands: \n{commands}")
+    header = fireblade_mac.HEADER if mode == 'macdelta' else \
+        fireblade_rpc.csv_header(commands[0]) if output_format == 'csv' else None
+
+    # hosts the campus, role and model selectors rule out by their hostnames
+    # or cached facts are skipped without a session
+    hosts, dropped = selector.select(hosts)
+
+    # run commands on each host in parallel, one pooled session per host,
+    # and stream each host's output as soon as it completes
+    with fireblade_pool.SessionPool(uname, passwd, max_sessions=engine.limit) as pool, \
+        fireblade_sink.OutputSink(output_log, ordered, header) as sink:
+        for host, reason in dropped:
+            sink.note(skipped(banner(host) + f"\n{reason}", silencer, output_format))
+            tally.add(fireblade_result.Result(host, 'skipped', '', reason))
+        for future in engine.as_completed(ncsession, hosts, selector, commands, mode, commit_mode, time, pool, silencer, vlan_name, output_format, mac_store, facts, index):
             try:
                 result = future.result()
-                if result:
-                    print (f'Good result is:{result}')
 
-            except TypeError as err:
-                print (f'An error occurred: {err}')
-#        print (futures)
+            # no result at all after a session error, past its retries; structured
+            # output keeps the error on stderr
+            except Exception as err:
+                result = fireblade_result.error(future.host, err, banner(future.host))
+                if output_format != 'text':
+                    print (result.output, end='', file=sys.stderr)
+                    result = result._replace(output=None)
+
+            tally.add(result, future.attempts)
+            sink.write(future.index, result.output)
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
 
-    # ... (keep the existing code for summarizing counters, if needed)
+    # hosts per outcome, and the failed ones to run again, clear of structured output
+    tally.report(sys.stdout if output_format == 'text' else sys.stderr)
 
 if __name__ == '__main__':
     main()
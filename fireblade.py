@@ -6,6 +6,11 @@ from jnpr.junos.exception import *
 from jnpr.junos.utils.start_shell import StartShell
 from jnpr.junos.utils.config import Config
 from utils import formatter
+import fireblade_config
+import fireblade_engine
+import fireblade_inventory
+import fireblade_result
+import fireblade_trace
 
 # get and process input options
 def getArgs():
@@ -30,6 +35,18 @@ def getArgs():
 	parser.add_argument('-p', '--port', choices = ['830', '80'], default = '830', 
 		help='TCP port for NETCONF session. 830 by default otherwise 80')
 
+	# options 'campus', 'role' and 'model', long options only as -p is 'port'
+	fireblade_inventory.add_arguments(parser, short=False)
+
+	# options 'workers', 'group_limit' and 'group_by', one host at a time by default
+	fireblade_engine.add_arguments(parser, workers=1)
+
+	# option 'trace' of the session phase timings
+	fireblade_trace.add_arguments(parser)
+
+	# option 'failed_hosts' of the hosts to run again
+	fireblade_result.add_arguments(parser)
+
 	# take available options
 	args = parser.parse_args()
 
@@ -53,7 +70,7 @@ def getArgs():
 		with open(f"{args.cmdfile}", "r") as fo:
 			commands = [line.strip() for line in fo.readlines() if not line.startswith('#')]
 
-	return hosts, commands, args.mode, args.port
+	return hosts, commands, args.mode, args.port, fireblade_inventory.from_args(args), fireblade_engine.from_args(args), fireblade_trace.from_args(args), fireblade_result.from_args(args)
 
 # process credential
 def getCredential():
@@ -70,6 +87,85 @@ def netconf(host_name, username, password, port):
 	dev.open()
 	return dev
 
+# banner of a host's output block
+def banner(host):
+	return '\033[1;34m------------------------------------------------\033[0m\n' + 'HOST: ' + host + '\n'
+
+# netconf session of a host, returns its Result with the output block
+def session(host, uname, passwd, port, selector, commands, mode):
+	print_out = banner(host)
+	try:
+		with netconf(host, uname, passwd, port) as dev:
+
+			# campus, role and model the inventory left to the session
+			reason = selector.check(host, dev)
+			if reason:
+				return fireblade_result.Result(host, 'skipped', print_out + reason + '\n', reason)
+
+			# mode dictates
+			if mode == 'show':
+				host_shell = StartShell(dev)
+				host_shell.open()
+
+				# excute commands
+				for command in commands:
+					command += ' | no-more'
+					cli_output = host_shell.run('cli -c "' + command.strip() + '"')[1]
+					trimed_output = formatter.remove_first_last_lines(cli_output)
+					if trimed_output == ['FALSE']:
+						print_out += 'Output of command ' + '"' + command + '"' + ' on host ' + host + ' is corrupted by syslog message\n'
+						host_shell.close()
+						return fireblade_result.Result(host, 'error', print_out, 'output corrupted by syslog message')
+					for line in trimed_output:
+						print_out += line.strip("\n") + '\n'
+				host_shell.close()
+				return fireblade_result.Result(host, 'shown', print_out)
+
+			timings = fireblade_config.Timings()
+			with Config(dev, mode='exclusive') as cu:
+
+				# excute commands, all in one load
+				failures = fireblade_config.load(cu, commands, timings)
+				for command, message in failures:
+					print_out += '\033[31mError\033[0m in loading "' + command + '": ' + message + '\n'
+				if failures:
+					return fireblade_result.Result(host, 'load failed', print_out, f'{len(failures)} command(s) rejected')
+
+				with timings.phase('diff'):
+					diff = cu.diff()
+				if diff != None:
+					print_out += f'{diff}\n'
+
+					try:
+						with timings.phase('commit_check'):
+							cu.commit_check(timeout=600)
+						print_out += '\033[32m' + 'Changes passed commit check.' + '\033[0m\n'
+
+						if mode == 'commit':
+							with timings.phase('commit'):
+								cu.commit(ignore_warning=True,timeout=600)
+							status = 'committed'
+							print_out += '\033[32m' + 'Changes committed.' + '\033[0m\n'
+						else:
+							cu.rollback()
+							status = 'rolled back'
+							print_out += '\033[93;1m' + 'Changes rolled back.' + '\033[0m\n'
+
+					except CommitError as err:
+						cu.rollback()
+						status = 'check failed'
+						print_out += f'\033[31mError\033[0m in commit check, rolled back with {err.message}\n'
+				else:
+					status = 'no diff'
+					print_out += 'No differences found.\n'
+			print_out += 'Timings: ' + str(timings) + '\n'
+			return fireblade_result.Result(host, status, print_out, str(timings))
+
+	# session errors are left to the engine, which retries the transient ones
+	# after a backoff; an RPC error keeps the output of the host so far
+	except RpcError as err:
+		return fireblade_result.error(host, err, print_out)
+
 def main():
 
 	# command line options
@@ -79,6 +175,10 @@ def main():
 		commands = args[1]
 		mode = args[2]
 		port = args[3]
+		selector = args[4]
+		engine = args[5]
+		tracer = args[6]
+		tally = args[7]
 	except argparse.ArgumentError as err:
 		print(f"Error: {err}")
 		return
@@ -89,109 +189,31 @@ def main():
 	passwd = credential[1]
 	print (commands)
 
-	## NTOE: hold on counter feature apr 7
-#	# session counters
-#	cnt_total = hosts.length()
-#	cnt_connecterr,	cnt_autherr, cnt_timeout, cnt_refuse, cnt_rpcerr = [0,0,0,0,0]
-#
-#	# configuration counters
-#	if mode != 'show':
-#		cnt_commit, cnt_rollback, cnt_commiterr, cnt_nodiff = [0,0,0,0]
-
-	# run commands on each host
-	for host in hosts:
-		print ('\033[1;34m------------------------------------------------\033[0m')
-		print ('HOST: ' + host)
-		try:
-			with netconf(host, uname, passwd, port) as dev:
-
-				# mode dictates
-				if mode == 'show':
-					host_shell = StartShell(dev)
-					host_shell.open()
-
-					# excute commands
-					for command in commands:
-						command += ' | no-more'
-						cli_output = host_shell.run('cli -c "' + command.strip() + '"')[1]
-						trimed_output = formatter.remove_first_last_lines(cli_output)
-						if trimed_output == ['FALSE']:
-							print ('Output of command ' + '"' + command + '"' + ' on host ' + host + ' is corrupted by syslog message')
-							break
-						for line in trimed_output:
-							print (line.strip("\n"))
-					host_shell.close()
+	# session and configuration counters, per status of each host; hosts the
+	# campus, role and model selectors rule out are skipped without a session
+	hosts, dropped = selector.select(hosts)
+	for host, reason in dropped:
+		print ('HOST: ' + host + ' ' + reason)
+		tally.add(fireblade_result.Result(host, 'skipped', '', reason))
 
-				else:
-					with Config(dev, mode='exclusive') as cu:
-
-						# excute commands
-						for command in commands:
-							cu.load(command,format='set',ignore_warning=True)
-
-						if cu.diff() != None:
-							print (cu.diff())
-
-							try:
-								cu.commit_check(timeout=600)
-								print ('\033[32m' + 'Changes passed commit check.' + '\033[0m')
-
-								if mode == 'commit':
-									cu.commit(ignore_warning=True,timeout=600)
-#									cnt_commit += 1
-									print ('\033[32m' + 'Changes committed.' + '\033[0m')
-								else:
-									cu.rollback()
-#									cnt_rollback += 1
-									print ('\033[93;1m' + 'Changes rolled back.' + '\033[0m')
-
-							except CommitError as err:
-								cu.rollback()
-#								cnt_commiterr += 1
-								print ('\033[31mError\033[0m in commit check, rolled back with ',err.message)
-						else:
-#							cnt_nodiff += 1
-							print ('No differences found.')
-
-		except ConnectError as err:
-#			cnt_connecterr += 1
-			print(f"Cannot connect to device: {err}")
-			continue
-		except ConnectAuthError as err:
-#			cnt_autherr += 1
-			print(f"Cannot authenticate to device: {err}")
-			continue
-		except ConnectTimeoutError as err:
-#			cnt_timeout += 1
-			print(f"Connection to device timed out: {err}")
-			continue
-		except ConnectRefusedError as err:
-#			cnt_refuse += 1
-			print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-			continue
-		except RpcError as err:
-#			cnt_rpcerr += 1
-			print(f"RPC error: {err}")
-			continue
+	# run commands on each host, up to --workers hosts at a time
+	for future in engine.as_completed(session, hosts, uname, passwd, port, selector, commands, mode):
+		try:
+			result = future.result()
+		except Exception as err:
+			result = fireblade_result.error(future.host, err, banner(future.host))
+		print (result.output, end='')
+		tally.add(result, future.attempts)
 
 	# summarize counters
-#	cnt_checkered = cnt_total - cnt_autherr - cnt_connecterr - cnt_timeout - cnt_refuse - cnt_rpcerr
-#	print ("Session Counter Summary")
-#	print (f"Total Number of Sessions:				{cnt_total}")
-#	print (f"Connected Sessions:					{cnt_checkered}")
-#	print (f"Connection Error Sessions:				{cnt_connecterr}")
-#	print (f"Authentication Error Sessions:			{cnt_autherr}")
-#	print (f"Timeout Sessions:						{cnt_timeout}")
-#	print (f"Connection Refused Sessions:			{cnt_refuse}")
-#	print (f"RPC Error Sessions:					{cnt_rpcerr}\n")
-#	
-#	if mode != 'show':
-#		print ("Configuration Change Summary")
-#		print (f"Total Number of Change Sessions:		{cnt_total}")
-#		print (f"Committed Sessions:					{cnt_commit}")
-#		print (f"Rolled Back Sessions:					{cnt_rollback}")
-#		print (f"Commit Error Sessions:					{cnt_commiterr}")
-#		print (f"No Difference in Change:				{cnt_nodiff}")
+	print ('\033[1;34m------------------------------------------------\033[0m')
+	print (tally.table())
+	print (tally.summary(mode != 'show'))
+	tally.report()
+
+	# phase timings of all sessions
+	if tracer:
+		tracer.report()
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file
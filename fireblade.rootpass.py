@@ -7,6 +7,10 @@ from passlib.hash import sha512_crypt
 from jnpr.junos import Device
 from jnpr.junos.exception import *
 from jnpr.junos.utils.config import Config
+import fireblade_engine
+import fireblade_inventory
+import fireblade_result
+import fireblade_trace
 
 # receive and process input options
 def getArgs():
@@ -16,6 +20,10 @@ def getArgs():
 	arg_host.add_argument('-l', '--hosts_list', metavar="FILE", help='direcotry of a host list')
 	parser.add_argument('-t', '--testride', help='discard configuration change', action='store_true')
 	parser.add_argument('-o', '--output', metavar='FILE', help='directory to output file')
+	fireblade_inventory.add_arguments(parser)
+	fireblade_engine.add_arguments(parser, workers=1)
+	fireblade_trace.add_arguments(parser)
+	fireblade_result.add_arguments(parser)
 	args = parser.parse_args()
 
 	hosts = []
@@ -26,7 +34,7 @@ def getArgs():
 	elif args.hosts_list:
 		with open(f"{args.hosts_list}", "r") as f:
 			hosts = [line.strip() for line in f.readlines() if not line.startswith('#')]
-	return hosts,args.testride, args.output#, args.rootpass
+	return hosts,args.testride, args.output, fireblade_inventory.from_args(args), fireblade_engine.from_args(args), fireblade_trace.from_args(args), fireblade_result.from_args(args)#, args.rootpass
 
 # process credential
 def getCredential():
@@ -62,6 +70,56 @@ def netconf(host_name, uname, upass):
 	dev.open()
 	return dev
 
+# banner of a host's output block
+def banner(host):
+	return '------------------------------------------------\n' + 'HOST: ' + host + '\n'
+
+# netconf session of a host, returns its Result with the output block
+def session(host, uname, upass, selector, hashed_rootpass, testride):
+	print_out = banner(host)
+	try:
+
+		# establish netconf session
+		with netconf(host, uname, upass) as dev:
+
+			# campus, role and model the inventory left to the session
+			reason = selector.check(host, dev)
+			if reason:
+				return fireblade_result.Result(host, 'skipped', print_out + reason + '\n', reason)
+
+			# start configuration utility
+			try:
+				with Config(dev, mode="exclusive") as cu:
+
+					# set new root password
+					cu.load(f"set system root-authentication encrypted-password \"{hashed_rootpass}\"", format="set")
+					print_out += f'{cu.diff()}\n'
+					if testride is True:
+						cu.rollback()
+						print_out += 'Rollback completed\n'
+						return fireblade_result.Result(host, 'rolled back', print_out)
+					else:
+						cu.commit(ignore_warning=True,timeout=300)
+						print_out += "Root password has been changed.\n"
+						return fireblade_result.Result(host, 'committed', print_out)
+
+			except ConfigLoadError as err:
+				status, message = 'load failed', f"Unable to load configuration changes: {err}"
+			except CommitError as err:
+				status, message = 'commit failed', f"Unable to commit configuration changes: {err}"
+			except LockError as err:
+				status, message = 'lock error', f"Unable to lock the configuration: {err}"
+			except UnlockError as err:
+				status, message = 'unlock error', f"Unable to unlock the configuration: {err}"
+			except Exception as err:
+				status, message = 'error', f"An unexpected error occurred: {err}"
+			return fireblade_result.Result(host, status, print_out + message + '\n', message)
+
+	# session errors are left to the engine, which retries the transient ones
+	# after a backoff; an RPC error keeps the output of the host so far
+	except RpcError as err:
+		return fireblade_result.error(host, err, print_out)
+
 def main():
 	args = getArgs()
 	credential = getCredential()
@@ -69,6 +127,10 @@ def main():
 	hosts = args[0]
 	testride = args[1]
 	output = args[2]
+	selector = args[3]
+	engine = args[4]
+	tracer = args[5]
+	tally = args[6]
 	uname = credential[0]
 	upass = credential[1]
 
@@ -81,55 +143,30 @@ def main():
 	except Exception as e:
 		print(f"An error occurred: {e}")
 
-	for host in hosts:
-		print ('------------------------------------------------')
-		print ('HOST: ' + host)
+	# changed, rolled back and error counters, per status of each host; hosts
+	# the campus, role and model selectors rule out are skipped without a session
+	hosts, dropped = selector.select(hosts)
+	for host, reason in dropped:
+		print ('HOST: ' + host + ' ' + reason)
+		tally.add(fireblade_result.Result(host, 'skipped', '', reason))
 
+	# change root password on each host, up to --workers hosts at a time
+	for future in engine.as_completed(session, hosts, uname, upass, selector, rpass[1], testride):
 		try:
-
-			# establish netconf session
-			with netconf(host, uname, upass) as dev:
-
-				# start configuration utility
-				try:
-					with Config(dev, mode="exclusive") as cu:
-
-						# set new root password
-						cu.load(f"set system root-authentication encrypted-password \"{rpass[1]}\"", format="set")
-						print(cu.diff())
-						if testride is True:
-							cu.rollback()
-							print ('Rollback completed')
-						else:
-							cu.commit(ignore_warning=True,timeout=300)
-							print ("Root password has been changed.")
-
-				except ConfigLoadError as err:
-					print(f"Unable to load configuration changes: {err}")
-				except CommitError as err:
-					print(f"Unable to commit configuration changes: {err}")
-				except LockError as err:
-					print(f"Unable to lock the configuration: {err}")
-				except UnlockError as err:
-					print(f"Unable to unlock the configuration: {err}")
-				except Exception as err:
-				    print(f"An unexpected error occurred: {err}")
-
-		except ConnectError as err:
-			print(f"Cannot connect to device: {err}")
-			continue
-		except ConnectAuthError as err:
-			print(f"Cannot authenticate to device: {err}")
-			continue
-		except ConnectTimeoutError as err:
-			print(f"Connection to device timed out: {err}")
-			continue
-		except ConnectRefusedError as err:
-			print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-			continue
-		except RpcError as err:
-			print(f"RPC error: {err}")
-			continue
+			result = future.result()
+		except Exception as err:
+			result = fireblade_result.error(future.host, err, banner(future.host))
+		print (result.output, end='')
+		tally.add(result, future.attempts)
+
+	print ('------------------------------------------------')
+	print (tally.table())
+	print (tally.summary(change=True))
+	tally.report()
+
+	# phase timings of all sessions
+	if tracer:
+		tracer.report()
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+# fireblade.trend.py queries the history of fireblade.ii inventories that
+# fireblade.ii records in ~/.netauto/trend.sqlite (see fireblade_trend), and
+# prints it as csv, the way fireblade.ii prints its summary.
+#
+# Example: fireblade.trend.py -m runs
+# Example: fireblade.trend.py -m inactive -n 6 -p bby
+# Example: fireblade.trend.py -m campus -s 2025-01-01
+
+import argparse
+import fireblade_inventory
+import fireblade_portusage
+import fireblade_trend
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(description = 'Inactive Interfaces Trend Tool')
+
+    # arg 'mode'
+    parser.add_argument('-m', '--mode', choices=['runs', 'inactive', 'campus'], default='campus',
+        help='Query: Default to "campus" for inactive interfaces per run and campus. Other choices are: ' +
+        '\n"inactive" for interfaces inactive in each of the last N runs of their host;' +
+        '\n"runs" for the recorded runs.')
+
+    # arg 'runs'
+    parser.add_argument('-n', '--runs', type=int, default=3, metavar='N',
+        help='Number of consecutive runs an interface is inactive in, for mode "inactive". Default to 3.')
+
+    # arg 'kinds'
+    parser.add_argument('-k', '--kinds', nargs='+', choices=fireblade_portusage.KINDS,
+        help='Kinds of interfaces, for mode "inactive". All kinds by default.')
+
+    # args 'campus' and 'role'
+    parser.add_argument('-p', '--campus', choices=fireblade_inventory.CAMPUSES,
+        help='Campus: self-explanatory. All campuses are covered if no option of campus is provided.')
+    parser.add_argument('-r', '--role', choices=fireblade_inventory.ROLES,
+        help='Chassis role: All roles are covered if no option of role is provided.')
+
+    # arg 'since'
+    parser.add_argument('-s', '--since', metavar='YYYY-MM-DD',
+        help='Only runs started on or after this date, for mode "campus".')
+
+    # arg 'trend'
+    fireblade_trend.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    return args.mode, args.runs, args.kinds, args.campus, args.role, args.since, fireblade_trend.from_args(args)
+
+def main():
+
+    mode, n, kinds, campus, role, since, trend = getArgs()
+
+    with trend:
+        if mode == 'runs':
+            print ('Run,Started,Kinds,Number of hosts')
+            for row in trend.runs():
+                print (','.join(str(field) for field in row))
+
+        elif mode == 'inactive':
+            print ('Hostname,Interface,Kind,Weeks and days since last flap')
+            rows = trend.inactive_runs(n, campus=campus, role=role, kinds=kinds)
+            for host, name, kind, seconds in rows:
+                print (f'{host},{name},{kind},{fireblade_portusage.wd(seconds) if seconds is not None else ""}')
+            print (f'\n{len(rows)} interface(s) inactive in each of the last {n} runs of their host.')
+
+        else:
+            print ('Run,Started,Campus,Number of hosts,Number of total interfaces,Number of inactive interfaces,Percentage of inactive interfaces')
+            for run, started, campus, hosts, total, inactive in trend.campus_trend(campus=campus, role=role, since=since):
+                print (f'{run},{started},{campus},{hosts},{total},{inactive},{round(100*inactive/total) if total else 0}%')
+
+if __name__ == '__main__':
+    main()
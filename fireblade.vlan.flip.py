@@ -1,7 +1,17 @@
 # fireblade.vlan.flip.py is a python3 tool
 # to deploy some VLAN changes on target hosts. It
 # 1. changes VLAN assignment on switch interfaces per specific rules;
-# 2. (thinking...)
+# 2. applies the changes on many hosts at once through fireblade_engine, with
+#    a global and a per-campus concurrency cap;
+# 3. optionally rolls out to the first N hosts of the matrix as canaries and
+#    only carries on with the rest if every canary succeeded, the rest
+#    aborted otherwise;
+# 4. reports every host's status and phase timings in one table, and in
+#    "testride" mode estimates how long the real change would take from the
+#    commit check timings it measured;
+# 5. journals the state of each host, so --resume skips the hosts done already;
+# 6. writes the hosts that failed or were aborted to a file, so -l takes the
+#    rows of the matrix of those hosts only in a follow-up run.
 '''
 command line option vlan_change_matrix is a text file in below format:
 bby-brh7046-ext-1.managenet.sfu.ca,ge-0/0/10,DATA,NAC-UNPRIV
@@ -11,14 +21,20 @@ bby-ham1040-ext-1.managenet.sfu.ca,ge-0/0/11,DATA,NAC-UNPRIV
 '''
 
 import sys
+import time
+import heapq
 import argparse
-from lxml import etree
+import fireblade_config
+import fireblade_engine
+import fireblade_facts
+import fireblade_inventory
+import fireblade_journal
+import fireblade_result
+import fireblade_trace
 from collections import defaultdict
 from getpass import getpass
 from jnpr.junos import Device
-from jnpr.junos.exception import *
 from jnpr.junos.utils.start_shell import StartShell
-from jnpr.junos.utils.config import Config
 from utils import formatter, fireblade_hw
 import concurrent.futures
 
@@ -37,6 +53,13 @@ def getArgs():
         help='A matrix file containing VLAN change info'
         )
 
+    # arg 'host_list'
+    parser.add_argument('-l', '--host_list',
+        metavar="FILE",
+        help='Take the rows of the matrix of the hosts listed in the file only,\n' +
+        'i.e. the failed hosts of an earlier run. All hosts by default.'
+        )
+
     # arg 'mode'
     parser.add_argument('-m', '--mode',
         choices=['testride', 'commitconfirm', 'commit', 'commit-at'],
@@ -47,6 +70,30 @@ def getArgs():
         '"commit-at" for "commit at specific time" with input datetime.'
         )
 
+    # arg 'canary'
+    parser.add_argument('--canary', type=int, default=0, metavar='N',
+        help='Apply to the first N hosts of the matrix first, and to the rest\n' +
+        'only if all of them succeeded. Default to 0, no canary.'
+        )
+
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=10)
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # args 'journal' and 'resume' of the job journal
+    fireblade_journal.add_arguments(parser, 'vlan.flip')
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     # start taking and processing args
     args = parser.parse_args()
 
@@ -57,7 +104,13 @@ def getArgs():
         with open(f"{args.vlan_change_matrix}","r") as fo:
             vlan_matrix = [line.strip() for line in fo.readlines() if not line.startswith('#')]
 
-    return vlan_matrix, args.mode
+    # host_list
+    only = None
+    if args.host_list:
+        with open(f"{args.host_list}","r") as fo:
+            only = {line.strip() for line in fo.readlines() if line.strip() and not line.startswith('#')}
+
+    return vlan_matrix, only, args.mode, fireblade_engine.from_args(args), args.canary, fireblade_inventory.from_args(args, fireblade_facts.from_args(args)), fireblade_journal.from_args(args, parser), fireblade_trace.from_args(args), fireblade_result.from_args(args)
 
 # process credential
 def getCredential():
@@ -76,8 +129,8 @@ and the commands of changing vlan on interfaces
 """
 def change_cmd_gen(matrix):
 
-    # remove duplicates from matrix
-    matrix = set(matrix)
+    # remove duplicates from matrix, keeping the order of hosts for canaries
+    matrix = dict.fromkeys(matrix)
 
     # create a dictionary
     host_change_dict = defaultdict(list)
@@ -104,74 +157,120 @@ def change_cmd_gen(matrix):
 
     return host_change_dict
 
-# funciton 'config_change' to implement changes
-def config_change(dev,commands,mode,commit_at_time,confirm_time):
-    print_out = ''
-    with Config(dev, mode='exclusive') as cu:
-    # excute commands
-        for command in commands:
-            cu.load(command, format='set', ignore_warning=True)
-        diff = cu.diff()
-        print_out += f'{diff}\n' if len(commands) != 0 else f'{cu.diff(rb_id=1)}\n' if len(commands) == 0 else ''
-        try:
-            # temporarily disable below 2 lines
-            cu.commit_check(timeout=600)
-            print_out += '\033[32m' + 'Changes passed commit check.' + '\033[0m\n'
-
-            if mode == 'commit': # execute commit immediately
-                cu.commit(ignore_warning=True, timeout=600)
-                print_out += '\033[32m' + 'Changes committed.' + '\033[0m\n'
+# funciton 'config_change' to implement changes, all commands in one load; it
+# returns the print out and the status of the host and records the time of
+# each phase in 'timings'
+def config_change(dev,commands,mode,commit_at_time,confirm_time,timings):
+    return fireblade_config.change(dev, commands, mode, confirm=confirm_time, at_time=commit_at_time, timings=timings)
 
-            elif mode == 'commit-at': # execute the commit-configuration RPC with at-time
-                report = dev.rpc.commit_configuration(at_time=commit_at_time,dev_timeout=600)
-                print_out += etree.tostring(report, pretty_print=True).decode()
-
-            elif mode == 'commitconfirm': # execute the commit with a confirmation time
-                cu.commit(ignore_warning=True, timeout=600, confirm=time)
-                print_out += '\033[93;1m' + f'Changes committed and will be rolled back in {time} minutes unless confirmed ' + '\033[0m\n'
-
-            else: # go by deault mode testride
-                cu.rollback()
-                print_out += '\033[93;1m' + 'Changes rolled back.' + '\033[0m\n'
-
-        except CommitError as err:
-            cu.rollback()
-            print_out += f'\033[31mError\033[0m in commit check, rolled back with {err.message}'
-
-        return print_out
-
-# netconf session
+# netconf session, it returns the result of a host as a dictionary of
+# 'host', 'status', 'timings' and 'print_out'. Session errors are left to the
+# engine, which retries the transient ones after a backoff
 def ncsession(
     host,
+    host_change_dict,
     uname,
     passwd,
-    commands,
     mode,
     commit_at_time,
-    confirm_time
+    confirm_time,
+    selector,
+    journal
     ):
 
-    try:
-        with Device(host=host, user=uname, password=passwd) as dev:
-
-            # where it starts for a host
-            print_out = f"\033[1;34m------------------------------------------------\033[0m\nHost: {host}\n"
-
-            # call function 'config_change' to implement the sorted configuration change commands
-            print_out += f'\n{config_change(dev,commands,mode,commit_at_time,confirm_time)}'
-
-    except ConnectError as err:
-        print(f"Cannot connect to device: {err}")
-    except ConnectAuthError as err:
-        print(f"Cannot authenticate to device: {err}")
-    except ConnectTimeoutError as err:
-        print(f"Connection to device timed out: {err}")
-    except ConnectRefusedError as err:
-        print(f"Connection to device was refused: {err}, please check NETCONF configuration")
-    except RpcError as err:
-        print(f"RPC error: {err}")
-
-    return print_out
+    commands = host_change_dict[host]
+    timings = fireblade_config.Timings()
+    status = 'error'
+    start = time.perf_counter()
+
+    # where it starts for a host
+    print_out = f"\033[1;34m------------------------------------------------\033[0m\nHost: {host}\n"
+
+    with Device(host=host, user=uname, password=passwd) as dev:
+        timings['connect'] = time.perf_counter() - start
+        journal.record(host, 'connected')
+
+        # campus, role and model the inventory left to the session
+        reason = selector.check(host, dev)
+        if reason:
+            print_out += f'\n{reason}\n'
+            status = 'mismatched'
+            timings['total'] = time.perf_counter() - start
+            return {'host': host, 'status': status, 'timings': timings, 'print_out': print_out}
+
+        # call function 'config_change' to implement the sorted configuration change commands
+        journal.record(host, 'changing', mode=mode)
+        change_out, status = config_change(dev,commands,mode,commit_at_time,confirm_time,timings)
+        print_out += f'\n{change_out}'
+
+    timings['total'] = time.perf_counter() - start
+    return {'host': host, 'status': status, 'timings': timings, 'print_out': print_out}
+
+# status a host ends with once the change of a mode is applied on it
+APPLIED = {'commit': 'committed', 'commitconfirm': 'confirm pending', 'commit-at': 'commit scheduled'}
+
+# journal state of a host that finished with 'status' in 'mode'. Only a
+# change applied as the mode asks is done; a testride rolls back and a
+# mismatched host is left alone, so a resumed run of another mode takes
+# them again
+def journal_state(status, mode):
+    if status == APPLIED.get(mode):
+        return 'done'
+    return 'unchanged' if status in fireblade_config.SUCCESS + ['mismatched'] else 'failed'
+
+# apply the changes on 'hosts' through the engine, print and journal each host
+# as it finishes and return the results in host-list order
+def rollout(engine, hosts, host_change_dict, uname, passwd, mode, commit_at_time, confirm_time, selector, journal):
+    results = [None] * len(hosts)
+    for future in engine.as_completed(ncsession, hosts, host_change_dict, uname, passwd, mode, commit_at_time, confirm_time, selector, journal):
+        try:
+            result = future.result()
+        except Exception as err:
+            error = fireblade_result.error(future.host, err,
+                f"\033[1;34m------------------------------------------------\033[0m\nHost: {future.host}\n")
+            result = {'host': future.host, 'status': error.status, 'timings': {}, 'print_out': error.output}
+        result['attempts'] = future.attempts
+        print(result['print_out'])
+        journal.record(result['host'], journal_state(result['status'], mode), status=result['status'], mode=mode)
+        results[future.index] = result
+    return results
+
+# consolidated report of all hosts
+def report(results):
+    phases = ['connect'] + fireblade_config.PHASES + ['total']
+    print(f"{'Host':<45}{'Status':<18}" + ''.join(f'{phase:>14}' for phase in phases))
+    for result in results:
+        timings = result['timings']
+        print(f"{result['host']:<45}{result['status']:<18}" +
+            ''.join(f'{timings[phase]:>14.1f}' if phase in timings else f"{'-':>14}" for phase in phases))
+    aborted = sum(1 for result in results if result['status'] == 'aborted')
+    if aborted:
+        print(f'{aborted} host(s) aborted after the canary failed, never connected.')
+
+# time to apply on the measured hosts with the engine's limits, by scheduling
+# each host in host-list order on the first free session its group allows.
+# A host is taken to need its testride session time plus one more commit
+# check's worth of time for the commit itself.
+def estimate(results, engine):
+    pending = [(r['host'], r['timings']['total'] + r['timings']['commit_check'])
+        for r in results if 'commit_check' in r['timings']]
+    clock = 0.0
+    running = []
+    active = {}
+    while pending or running:
+        while len(running) < engine.limit:
+            for i, (host, seconds) in enumerate(pending):
+                group = engine.group_by(host)
+                if not engine.group_limit or active.get(group, 0) < engine.group_limit:
+                    break
+            else:
+                break
+            del pending[i]
+            active[group] = active.get(group, 0) + 1
+            heapq.heappush(running, (clock + seconds, group))
+        clock, group = heapq.heappop(running)
+        active[group] -= 1
+    return clock
 
 def main():
 
@@ -179,11 +278,21 @@ def main():
     try:
         args = getArgs()
         vlan_matrix = args[0]
-        mode = args[1]
+        only = args[1]
+        mode = args[2]
+        engine = args[3]
+        canary = args[4]
+        selector = args[5]
+        journal = args[6]
+        tracer = args[7]
+        tally = args[8]
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
         return
 
+    # a resumed job has to be of the same mode and matrix
+    journal.start(mode=mode, matrix=fireblade_journal.digest(vlan_matrix))
+
     commit_at_time = input('Dateime to commmit (yyyy-mm-dd hh[:mm:ss]): ') if mode == 'commit-at' else None
     confirm_time = input("Minutes to confirm configuration change: ") if mode == 'commitconfirm' else None
 
@@ -195,12 +304,58 @@ def main():
     # call function change_cmd_gen to generate Juniper CLI change
     # commands based on vlan_matrix
     host_change_dict = change_cmd_gen(vlan_matrix)
-
-    # call function ncsession to execute the change generated by change_cmd_gen
-    report = ''
-    for host,commands in host_change_dict.items():
-        report = ncsession(host,uname,passwd,commands,mode,commit_at_time,confirm_time)
-        print(report)
+    hosts = [host for host in host_change_dict if only is None or host in only]
+
+    # hosts the campus, role and model selectors rule out are left out without a session
+    hosts, dropped = selector.select(hosts)
+    for host, reason in dropped:
+        print(f'{host}: {reason}')
+
+    # hosts a resumed job has done already are left out too
+    hosts, done = journal.pending(hosts)
+    if journal.resume:
+        print(f'Resuming the job in {journal.path}: {len(done)} host(s) done already, {len(hosts)} to go.')
+
+    # call function ncsession on all hosts through the engine, canaries first
+    start = time.perf_counter()
+    results = []
+    rest = hosts
+    if canary > 0:
+        print(f'Canary rollout on {len(hosts[:canary])} host(s).')
+        results = rollout(engine, hosts[:canary], host_change_dict, uname, passwd, mode, commit_at_time, confirm_time, selector, journal)
+        rest = hosts[canary:]
+        failed = [r['host'] for r in results if r['status'] not in fireblade_config.SUCCESS + ['mismatched']]
+        if failed:
+            print('\033[31m' + f'Canary failed on {", ".join(failed)}, rollout to the other {len(rest)} host(s) aborted.' + '\033[0m\n')
+            results += [{'host': host, 'status': 'aborted', 'timings': {}} for host in rest]
+            rest = []
+    results += rollout(engine, rest, host_change_dict, uname, passwd, mode, commit_at_time, confirm_time, selector, journal)
+    journal.close()
+    results += [{'host': host, 'status': 'mismatched', 'timings': {}} for host, _ in dropped]
+    elapsed = time.perf_counter() - start
+
+    report(results)
+
+    # hosts per outcome, and the failed ones to run again with -l
+    for result in results:
+        tally.add(fireblade_result.Result(result['host'], result['status']), result.get('attempts', 1))
+    print()
+    tally.report()
+    print(f'{len(hosts)} host(s) in {elapsed:.1f} seconds with --workers {engine.limit}' +
+        (f' and --group_limit {engine.group_limit}' if engine.group_limit else '') + '.')
+
+    # dry run throughput estimate
+    if mode == 'testride':
+        checks = [r['timings']['commit_check'] for r in results if 'commit_check' in r['timings']]
+        if checks:
+            seconds = estimate(results, engine)
+            print(f'Commit check took {sum(checks) / len(checks):.1f} seconds on average, {max(checks):.1f} at most.')
+            print(f'Estimated time to commit on these {len(checks)} host(s) with the same limits: {seconds:.0f} seconds, ' +
+                f'{len(checks) / seconds * 60:.1f} hosts per minute.')
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
 
 if __name__ == '__main__':
     main()
@@ -1,9 +1,14 @@
 # fireblade.write.snapshot v1.0
 # features:
-# 1. 50 sessions in parallel
+# 1. 50 sessions in parallel by default, through fireblade_engine
 # 2. write snapshot to alternative partition on ex4300p non-mixed chassis
 # 3. write snapshot to P members one by one on ex4300mp mixed chassis
 # 4. write report from each host to a dedicated log file
+# 5. write snapshot to up to --member_limit P members of a mixed chassis at once,
+#    each over its own shell, with progress and timing per member
+# 6. journal the state of each host, so --resume skips the hosts done already
+# 7. retry hosts after transient session errors, and write the hosts that
+#    failed to a file for -l of a follow-up run
 
 import os
 import re
@@ -11,12 +16,18 @@ import sys
 import argparse
 from getpass import getpass
 from jnpr.junos import Device
-from jnpr.junos.exception import *
 from jnpr.junos.utils.start_shell import StartShell
 from jnpr.junos.utils.config import Config
-from utils import formatter, fireblade_hw
+from utils import formatter
+import fireblade_engine
+import fireblade_facts
+import fireblade_inventory
+import fireblade_journal
+import fireblade_result
+import fireblade_trace
 import concurrent.futures
 import datetime
+import time
 
 # get and process command line options
 def getArgs():
@@ -35,6 +46,28 @@ def getArgs():
     # arg 'runtime_log'
     parser.add_argument('-g', '--runtime_log', metavar="FILE", required=True, help='Directory to a runtime log for reports from all hosts')
 
+    # arg 'member_limit'
+    parser.add_argument('-m', '--member_limit', type=int, default=1, metavar='N',
+        help='Maximum P members of a mixed chassis written at once, each over its own shell.\nDefault to 1, one member at a time.')
+
+    # args 'workers', 'group_limit' and 'group_by' of the fan-out engine
+    fireblade_engine.add_arguments(parser, workers=50)
+
+    # args 'campus', 'role' and 'model', resolved before connecting
+    fireblade_inventory.add_arguments(parser)
+
+    # args 'facts_ttl' and 'refresh_facts' of the host facts cache
+    fireblade_facts.add_arguments(parser)
+
+    # args 'journal' and 'resume' of the job journal
+    fireblade_journal.add_arguments(parser, 'write.snapshot')
+
+    # arg 'trace' of the session phase timings
+    fireblade_trace.add_arguments(parser)
+
+    # arg 'failed_hosts' of the hosts to run again
+    fireblade_result.add_arguments(parser)
+
     # start taking and processing args
     args = parser.parse_args()
 
@@ -48,7 +81,11 @@ def getArgs():
     else:
         hosts = args.hosts
 
-    return hosts, args.runtime_log
+    if args.member_limit < 1:
+        parser.error('--member_limit takes a positive number')
+
+    facts = fireblade_facts.from_args(args)
+    return hosts, args.runtime_log, facts, fireblade_inventory.from_args(args, facts), args.member_limit, fireblade_journal.from_args(args, parser), fireblade_trace.from_args(args), fireblade_engine.from_args(args), fireblade_result.from_args(args)
 
 # process credential
 def getCredential():
@@ -71,52 +108,72 @@ def clock():
     timestamp = f'{now.strftime("%Y")}-{now.strftime("%m")}-{now.strftime("%d")} {now.strftime("%H")}:{now.strftime("%M")}'
     return timestamp
 
+# process fpc - write snapshot on one P member of a mixed chassis over a shell of its own,
+# returns the report of the member and the seconds it took
+def WriteMember(dev,pmember,host=''):
+
+    start = time.perf_counter()
+    print (f'{clock()} {host} fpc{pmember}: writing snapshot')
+    report = f'\n{bcolors.OKGREEN}----Writing snapshot on fpc{pmember}----------------------------------------------{bcolors.ENDC}\n'
+    with StartShell(dev) as dev_sh:
+        report += '\n'.join(
+            formatter.pop_first_last_lines(
+                dev_sh.run('rlogin -Ji fpc'+f'{pmember}')[1]
+                )
+            )
+        report += '\n'.join(
+            formatter.pop_first_last_lines(
+                dev_sh.run('request system snapshot local slice alternate',timeout=120)[1]
+                )
+            )
+        report += f'\n\n{bcolors.OKGREEN}----Partitions on fpc{pmember} after snapshot is written--------------------------{bcolors.ENDC}\n\n'
+        report += '\n'.join(
+            formatter.pop_first_last_lines(
+                dev_sh.run('show system snapshot local media internal')[1]
+                )
+            )
+        report += '\n'.join(
+            formatter.pop_first_last_lines(dev_sh.run('exit')[1])
+            )
+    seconds = time.perf_counter() - start
+    report += f'\n{bcolors.OKGREEN}----Writing snapshot on fpc{pmember} is completed in {seconds:.0f} seconds--------------------{bcolors.ENDC}'
+    print (f'{clock()} {host} fpc{pmember}: snapshot written in {seconds:.0f} seconds')
+    return report, seconds
+
 # process write - write snapshot to alternative slice on certain members
-def WriteSnapshot(dev,member):
+def WriteSnapshot(dev,member,member_limit=1,host=''):
 
     # initial report
     report = ''
 
     # write snapshot to P members in mixed chassis
     if member == 'mixed':
-         with StartShell(dev) as dev_sh:
+        with StartShell(dev) as dev_sh:
             # get all P members in the chassis
             pmembers = formatter.pop_first_last_lines(
                 dev_sh.run('cli -c "show virtual-chassis | match ex4300-48p | no-more"')[1]
                 )
-            report += f'\n{bcolors.OKGREEN}----This is a mixed chassis with below {len(pmembers)} FPCs of EX4300-48P---------------{bcolors.ENDC}\n\n'
-            report += '\n'.join(pmembers) + '\n'
-
-            # create a list of P fpcs
-            fpc = []
-            for line in pmembers:
-                match = re.search(r'\(FPC (\d+)\)', line)
-                if match:
-                    fpc.append(match.group(1))
-
-            # write snapshot on each pmember in list fpc
-            for pmember in fpc:
-                report += f'\n{bcolors.OKGREEN}----Writing snapshot on fpc{pmember}----------------------------------------------{bcolors.ENDC}\n'
-                report += '\n'.join(
-                    formatter.pop_first_last_lines(
-                        dev_sh.run('rlogin -Ji fpc'+f'{pmember}')[1]
-                        )
-                    )
-                report += '\n'.join(
-                    formatter.pop_first_last_lines(
-                        dev_sh.run('request system snapshot local slice alternate',timeout=120)[1]
-                        )
-                    )
-                report += f'\n\n{bcolors.OKGREEN}----Partitions on fpc{pmember} after snapshot is written--------------------------{bcolors.ENDC}\n\n'
-                report += '\n'.join(
-                    formatter.pop_first_last_lines(
-                        dev_sh.run('show system snapshot local media internal')[1]
-                        )
-                    )
-                report += '\n'.join(
-                    formatter.pop_first_last_lines(dev_sh.run('exit')[1])
-                    )
-                report += f'\n{bcolors.OKGREEN}----Writing snapshot on fpc{pmember} is completed---------------------------------{bcolors.ENDC}'
+        report += f'\n{bcolors.OKGREEN}----This is a mixed chassis with below {len(pmembers)} FPCs of EX4300-48P---------------{bcolors.ENDC}\n\n'
+        report += '\n'.join(pmembers) + '\n'
+
+        # create a list of P fpcs
+        fpc = []
+        for line in pmembers:
+            match = re.search(r'\(FPC (\d+)\)', line)
+            if match:
+                fpc.append(match.group(1))
+
+        # write snapshot on up to member_limit pmembers in list fpc at once, reports in fpc order
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=member_limit) as executor:
+            written = list(executor.map(lambda pmember: WriteMember(dev, pmember, host), fpc))
+        for member_report, seconds in written:
+            report += member_report
+
+        # timing of each member
+        report += f'\n\n{bcolors.OKGREEN}----Snapshot written on {len(fpc)} FPCs in {time.perf_counter() - start:.0f} seconds, {member_limit} at a time----{bcolors.ENDC}\n'
+        for pmember, (member_report, seconds) in zip(fpc, written):
+            report += f'fpc{pmember}: {seconds:.0f} seconds\n'
     # write snapshot to all members on a P chassis
     else:
         dev.timeout = 1200
@@ -137,35 +194,35 @@ def WriteSnapshot(dev,member):
                 )
     return report
 
-# process drive - drive the writing of snapshot if the chassis is a MP mixed or P non-mixed chassis
-def drive(host,uname,passwd):
+# process drive - drive the writing of snapshot if the chassis is a MP mixed or P non-mixed chassis;
+# returns its Result with the report of the host. Session errors are left to the engine, which
+# retries the transient ones after a backoff
+def drive(host,uname,passwd,facts,selector,member_limit,journal):
 
     # initial report
     report = f"{bcolors.OKBLUE}----------------------------------------------------------------------------------------{bcolors.ENDC}\nHost: {host}\n"
     report += f'Start: {clock()}\n'
 
-    try:
-        with Device(host=host, user=uname, password=passwd) as dev:
-            chassis = fireblade_hw.chassis(dev)
-            if chassis == 'EX4300-48P':
-                report += WriteSnapshot(dev,'all-member')
-            elif chassis == 'mixed':
-                report += WriteSnapshot(dev,'mixed')
-            else:
-                report += f'{host} does not contain any ex4300-48p members, skipped'
-
-        return f'{report}\n\nEnd: {clock()}\n'
-
-    except ConnectError as err:
-        print(f"{clock()} Cannot connect to device: {err}")
-    except ConnectAuthError as err:
-        print(f"{clock()} Cannot authenticate to device: {err}")
-    except ConnectTimeoutError as err:
-        print(f"{clock()} Connection to device timed out: {err}")
-    except ConnectRefusedError as err:
-        print(f"{clock()} Connection to device was refused: {err}, please check NETCONF configuration")
-    except RpcError as err:
-        print(f"{clock()} RPC error: {err}")
+    # no fact gathering when the chassis of the host is cached
+    status = 'skipped'
+    with Device(host=host, user=uname, password=passwd, **facts.device_args(host, ['chassis'] + selector.pending(host))) as dev:
+        journal.record(host, 'connected')
+        chassis = facts.get(dev, host, 'chassis')
+        reason = selector.check(host, dev)
+        if reason:
+            report += reason
+        elif chassis == 'EX4300-48P':
+            journal.record(host, 'writing', chassis=chassis)
+            report += WriteSnapshot(dev,'all-member')
+            status = 'written'
+        elif chassis == 'mixed':
+            journal.record(host, 'writing', chassis=chassis)
+            report += WriteSnapshot(dev,'mixed',member_limit,host)
+            status = 'written'
+        else:
+            report += f'{host} does not contain any ex4300-48p members, skipped'
+
+    return fireblade_result.Result(host, status, f'{report}\n\nEnd: {clock()}\n')
 
 def main():
 
@@ -174,33 +231,64 @@ def main():
         args = getArgs()
         hosts = args[0]
         runtime_log = args[1]
+        facts = args[2]
+        selector = args[3]
+        member_limit = args[4]
+        journal = args[5]
+        tracer = args[6]
+        engine = args[7]
+        tally = args[8]
 
     except argparse.ArgumentError as err:
         print(f"Error: {err}")
         return
 
+    # a resumed job has to be of the same member limit
+    journal.start(member_limit=member_limit)
+
     # credential
     credential = getCredential()
     uname = credential[0]
     passwd = credential[1]
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        futures = [executor.submit(drive, host, uname, passwd) for host in hosts]
+    # hosts the campus, role and model selectors rule out are skipped without a session
+    hosts, dropped = selector.select(hosts)
+
+    # hosts a resumed job has done already are skipped too
+    hosts, done = journal.pending(hosts)
+    if journal.resume:
+        print (f'Resuming the job in {journal.path}: {len(done)} host(s) done already, {len(hosts)} to go.')
+
+    with journal:
         results =''
 
         with open(runtime_log,'a') as fo:
-            for future in concurrent.futures.as_completed(futures):
+            for host, reason in dropped:
+                fo.write(f'Host: {host}\n{reason}\n')
+                results += f'Host: {host}\n{reason}\n'
+                tally.add(fireblade_result.Result(host, 'skipped', '', reason))
+            for future in engine.as_completed(drive, hosts, uname, passwd, facts, selector, member_limit, journal):
                 try:
                     result = future.result()
-                    fo.write(result + '\n')
-                    results += f'{result}\n'
+                    journal.record(future.host, 'done')
                 except Exception as err:
-                    print(err)
-                    fo.write(f'{err}\n')
-                    results += f'{err}\n'
+                    # no report at all after a session error, past its retries
+                    result = fireblade_result.error(future.host, err, f'Host: {future.host}\n{clock()} ')
+                    journal.record(future.host, 'failed', error=str(err))
+                    print(result.output, end='')
+                fo.write(result.output + '\n')
+                results += f'{result.output}\n'
+                tally.add(result, future.attempts)
 
             print (f'(Writing Snapshot on Hosts:\n{results}')
 
+    # hosts per outcome, and the failed ones to run again
+    tally.report()
+
+    # phase timings of all sessions
+    if tracer:
+        tracer.report()
+
 if __name__ == '__main__':
     main()
 
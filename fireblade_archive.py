@@ -0,0 +1,133 @@
+# fireblade_archive keeps the committed configuration of every host, in
+# 'display set' form, in a local store, so questions about the fleet's
+# configuration, such as its trunks or VLAN members, are answered offline
+# instead of logging into every switch again. It
+# 1. asks a host when its configuration last changed, junos:changed-seconds
+#    of a get-configuration reply filtered down to nothing, and fetches the
+#    whole configuration only if that differs from the archived one;
+# 2. stores each configuration once, zlib compressed, under the sha256 of its
+#    lines, so hosts and runs sharing a configuration share an object;
+# 3. indexes the current configuration of each host, and every change of it,
+#    in one SQLite file next to the objects, which fireblade_query indexes
+#    for questions about the fleet.
+# One Archive may be used from many threads, and many processes may share it.
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from lxml import etree
+
+DEFAULT_DIR = os.path.expanduser('~/.netauto/archive')
+
+# an empty filter, so a get-configuration reply carries only its attributes
+PROBE = '<configuration><version/></configuration>'
+
+# command line arguments of the archive, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--archive', metavar='DIR', default=DEFAULT_DIR,
+        help=f'Configuration archive. Default to {DEFAULT_DIR}')
+
+# archive built from parsed command line arguments
+def from_args(args):
+    return Archive(args.archive)
+
+# sha256 of configuration text, the name of its object
+def digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# configuration lines worth keeping, without comments and blank lines
+def normalize(text):
+    return '\n'.join(line.rstrip() for line in text.splitlines() if line.strip() and not line.startswith('#')) + '\n'
+
+# junos:changed-seconds of a get-configuration reply, None if missing
+def changed_seconds(reply):
+    for elm in [reply] + list(reply.iter('configuration')):
+        for key, value in elm.attrib.items():
+            if key.endswith('changed-seconds') and value.isdigit():
+                return int(value)
+    return None
+
+class Archive:
+
+    def __init__(self, path=DEFAULT_DIR):
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS heads ('
+            'host TEXT PRIMARY KEY, digest TEXT, changed INTEGER, fetched REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS history ('
+            'host TEXT, digest TEXT, changed INTEGER, fetched REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS history_by_host ON history (host, fetched)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _object(self, name):
+        return os.path.join(self.path, 'objects', name[:2], name)
+
+    # (digest, changed seconds, fetched time) of the archived configuration of a host, None if none
+    def head(self, host):
+        with self._lock:
+            return self._db.execute('SELECT digest, changed, fetched FROM heads WHERE host = ?', (host,)).fetchone()
+
+    # hosts with an archived configuration
+    def hosts(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute('SELECT host FROM heads ORDER BY host')]
+
+    # archive configuration text of a host; returns (digest, True if it changed)
+    def put(self, host, text, changed=None):
+        text = normalize(text)
+        name = digest(text)
+        path = self._object(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+            with open(tmp, 'wb') as fo:
+                fo.write(zlib.compress(text.encode(), 9))
+            os.replace(tmp, path)
+        head = self.head(host)
+        now = time.time()
+        with self._lock:
+            if head is None or head[0] != name:
+                self._db.execute('INSERT INTO history VALUES (?, ?, ?, ?)', (host, name, changed, now))
+            self._db.execute('INSERT OR REPLACE INTO heads VALUES (?, ?, ?, ?)', (host, name, changed, now))
+        return name, head is None or head[0] != name
+
+    # archived configuration text of a host, the current one or of 'name'
+    def text(self, host=None, name=None):
+        name = name or (self.head(host) or [None])[0]
+        if name is None:
+            return ''
+        with open(self._object(name), 'rb') as fo:
+            return zlib.decompress(fo.read()).decode()
+
+    def lines(self, host):
+        return self.text(host).splitlines()
+
+    # archive the committed configuration of an open Device, unless it has
+    # not changed since it was archived; returns 'new', 'changed' or 'unchanged'
+    def fetch(self, dev, host, refresh=False):
+        probe = dev.rpc.get_config(filter_xml=etree.XML(PROBE), options={'database': 'committed'})
+        changed = changed_seconds(probe)
+        head = self.head(host)
+        if head and not refresh and changed is not None and head[1] == changed:
+            with self._lock:
+                self._db.execute('UPDATE heads SET fetched = ? WHERE host = ?', (time.time(), host))
+            return 'unchanged'
+        config = dev.rpc.get_config(options={'format': 'set', 'database': 'committed'})
+        text = config.text if config.tag == 'configuration-set' else config.findtext('.//configuration-set')
+        _, is_new = self.put(host, text or '', changed)
+        return 'new' if head is None else 'changed' if is_new else 'unchanged'
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,63 @@
+# fireblade_cache is a small on-disk key/value store with a time to live,
+# shared by fireblade tools for whatever is costly to learn from a host and
+# rarely changes. Values are stored as json in one SQLite file, by namespace
+# and key, along with the time they were stored; a value older than the TTL
+# of its reader is treated as missing. One Cache may be used from many
+# threads, and many processes may share the file.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.path.expanduser('~/.netauto/cache.sqlite')
+
+class Cache:
+
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+            'namespace TEXT, key TEXT, value TEXT, stored REAL, PRIMARY KEY (namespace, key))')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # value of a key if stored less than 'ttl' seconds ago, else 'default'
+    def get(self, namespace, key, ttl=None, default=None):
+        with self._lock:
+            row = self._db.execute('SELECT value, stored FROM entries WHERE namespace = ? AND key = ?',
+                (namespace, key)).fetchone()
+        if row is None or (ttl is not None and time.time() - row[1] > ttl):
+            return default
+        return json.loads(row[0])
+
+    # {key: value} of the keys under a prefix stored less than 'ttl' seconds ago
+    def items(self, namespace, prefix='', ttl=None):
+        with self._lock:
+            rows = self._db.execute('SELECT key, value, stored FROM entries WHERE namespace = ? AND substr(key, 1, ?) = ?',
+                (namespace, len(prefix), prefix)).fetchall()
+        now = time.time()
+        return {key: json.loads(value) for key, value, stored in rows if ttl is None or now - stored <= ttl}
+
+    def put(self, namespace, key, value):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                (namespace, key, json.dumps(value), time.time()))
+
+    # drop the keys under a prefix, the whole namespace by default
+    def invalidate(self, namespace, prefix=''):
+        with self._lock:
+            self._db.execute('DELETE FROM entries WHERE namespace = ? AND substr(key, 1, ?) = ?',
+                (namespace, len(prefix), prefix))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
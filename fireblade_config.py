@@ -0,0 +1,112 @@
+# fireblade_config pushes configuration changes for fireblade tools. It
+# 1. loads all set/delete commands of a host in one load-configuration RPC,
+#    instead of one RPC per line;
+# 2. when that load fails, replays the commands line by line on a clean
+#    candidate to tell which lines were rejected, and why;
+# 3. times load, diff, commit_check and commit separately for every host.
+
+import time
+from contextlib import contextmanager
+from lxml import etree
+from jnpr.junos.exception import CommitError, ConfigLoadError
+from jnpr.junos.utils.config import Config
+
+PHASES = ['load', 'diff', 'commit_check', 'commit']
+
+# statuses of a change that let a rollout carry on
+SUCCESS = ['committed', 'commit scheduled', 'confirm pending', 'rolled back']
+
+# seconds spent per phase of a change, a dict that tools may add phases to
+class Timings(dict):
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = self.get(name, 0.0) + time.perf_counter() - start
+
+    def __str__(self):
+        return ', '.join(f'{phase} {self[phase]:.2f}s' for phase in PHASES if phase in self)
+
+def _message(err):
+    return (getattr(err, 'message', None) or str(err)).strip()
+
+# load commands into the candidate of 'cu' in one RPC and return [(command,
+# error message)] of the rejected lines, empty if all went in
+def load(cu, commands, timings=None):
+    timings = Timings() if timings is None else timings
+    with timings.phase('load'):
+        if not commands:
+            return []
+        try:
+            cu.load('\n'.join(commands), format='set', ignore_warning=True)
+            return []
+        except ConfigLoadError as err:
+            bulk_error = _message(err)
+
+        # attribute the failure to its lines
+        cu.rollback()
+        failures = []
+        for command in commands:
+            try:
+                cu.load(command, format='set', ignore_warning=True)
+            except ConfigLoadError as err:
+                failures.append((command, _message(err)))
+        cu.rollback()
+        return failures or [('(all commands)', bulk_error)]
+
+# apply commands on a host and return (print out, status). 'mode' is one of
+# commit, comconf/commitconfirm (with 'confirm' minutes), commit-at (with
+# 'at_time'); any other mode checks the change and rolls it back
+def change(dev, commands, mode, confirm=None, at_time=None, timings=None):
+    timings = Timings() if timings is None else timings
+    print_out = ''
+    with Config(dev, mode='exclusive') as cu:
+        failures = load(cu, commands, timings)
+        if failures:
+            for command, message in failures:
+                print_out += f'\033[31mError\033[0m in loading "{command}": {message}\n'
+            print_out += '\033[31m' + 'Changes not loaded.' + '\033[0m\n'
+            return print_out, 'load failed'
+
+        with timings.phase('diff'):
+            diff = cu.diff() if len(commands) != 0 else cu.diff(rb_id=1)
+        print_out += f'{diff}\n'
+
+        try:
+            with timings.phase('commit_check'):
+                cu.commit_check(timeout=600)
+            print_out += '\033[32m' + 'Changes passed commit check.' + '\033[0m\n'
+
+            if mode == 'commit':
+                with timings.phase('commit'):
+                    cu.commit(ignore_warning=True, timeout=600)
+                print_out += '\033[32m' + 'Changes committed.' + '\033[0m\n'
+                status = 'committed'
+
+            elif mode in ['comconf', 'commitconfirm']:
+                with timings.phase('commit'):
+                    cu.commit(ignore_warning=True, timeout=600, confirm=int(confirm))
+                print_out += '\033[93;1m' + f'Changes committed and will be rolled back in {confirm} minutes unless confirmed ' + '\033[0m\n'
+                status = 'confirm pending'
+
+            elif mode == 'commit-at':
+                with timings.phase('commit'):
+                    report = dev.rpc.commit_configuration(at_time=at_time, dev_timeout=600)
+                print_out += etree.tostring(report, pretty_print=True).decode()
+                status = 'commit scheduled'
+
+            else:
+                cu.rollback()
+                print_out += '\033[93;1m' + 'Changes rolled back.' + '\033[0m\n'
+                status = 'rolled back'
+
+        except CommitError as err:
+            cu.rollback()
+            print_out += f'\033[31mError\033[0m in commit check, rolled back with {err.message}\n'
+            status = 'check failed'
+
+    print_out += f'Timings: {timings}\n'
+    return print_out, status
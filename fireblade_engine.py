@@ -0,0 +1,451 @@
+# fireblade_engine is the fan-out engine shared by fireblade tools. An asyncio
+# loop schedules one job per host; blocking PyEZ jobs run on a thread pool no
+# larger than the global limit and coroutine jobs run on the loop itself. It
+# 1. caps concurrent jobs globally with 'limit';
+# 2. caps concurrent jobs per group, campus by default, with 'group_limit';
+# 3. hands finished jobs back through a bounded queue, so a slow consumer
+#    holds workers back instead of piling results up in memory;
+# 4. optionally keeps launches within 'window' hosts of the oldest unfinished
+#    one, so a consumer can restore host-list order with a bounded buffer;
+# 5. optionally adapts the global limit to the fleet as it goes, see Adaptive;
+# 6. retries a host whose job raised a transient session error, after a
+#    jittered exponential backoff during which the host holds no slot.
+#
+# Jobs come back as concurrent.futures.Future objects carrying 'host' and
+# 'attempts' attributes, so tools keep their usual future.result() handling.
+
+import os
+import sys
+import time
+import queue
+import random
+import asyncio
+import inspect
+import argparse
+import importlib
+import threading
+import collections
+import concurrent.futures
+
+# campus parsed from a hostname such as bby-acf111-edge-1.managenet.sfu.ca
+def campus(host):
+    return host.split('.')[0].split('-')[0].lower()
+
+# role parsed from a hostname such as bby-acf111-edge-1.managenet.sfu.ca
+def role(host):
+    fields = host.split('.')[0].split('-')
+    return fields[2].lower() if len(fields) > 2 else ''
+
+_DONE = object()
+
+# session error class name -> most retries of a host it gets within
+# --retries, None for --retries; the first class of an error's MRO found
+# counts. A refused session or an unknown host will not do better a second
+# time, and a rejected password is tried once more at most, so that a wrong
+# one never locks an account out. Errors of a session under way, such as a
+# dropped connection, are not retried, as the job may have changed the host.
+RETRIES = {
+    'ConnectRefusedError': 0,
+    'ConnectUnknownHostError': 0,
+    'ConnectNotMasterError': 0,
+    'ConnectClosedError': 0,
+    'ConnectAuthError': 1,
+    'ConnectTimeoutError': None,
+    'ConnectError': None,
+}
+
+# concurrency an adaptive run starts from
+START = 10
+
+# command line arguments of the engine, shared by fireblade tools; tools
+# whose sessions strain authentication servers or weak routing engines may
+# adapt their concurrency by default
+def add_arguments(parser, workers=50, adaptive=False):
+    parser.add_argument('--workers', type=int, default=workers,
+        help=f'Maximum simultaneous sessions. Default to {workers}.')
+    parser.add_argument('--group_limit', type=int,
+        help='Maximum simultaneous sessions per group of hosts. Unlimited by default.')
+    parser.add_argument('--group_by', choices=['campus', 'role'], default='campus',
+        help='Hostname field that groups hosts for --group_limit. Default to "campus".')
+    parser.add_argument('--adaptive', action=argparse.BooleanOptionalAction, default=adaptive,
+        help=f'Start from {START} simultaneous sessions and adapt up to --workers: grow while connects stay fast, ' +
+        'halve on timeouts, authentication failures and slow connects or RPCs. ' + ('On' if adaptive else 'Off') + ' by default.')
+    parser.add_argument('--retries', type=int, default=2,
+        help='Retries of a host whose session failed to open for a transient reason, ' +
+        'once at most for authentication failures. Default to 2.')
+    parser.add_argument('--backoff', type=float, default=2.0, metavar='SECONDS',
+        help='Backoff before the first retry of a host, doubled for every next one, with jitter. Default to 2.')
+
+# engine built from parsed command line arguments
+def from_args(args):
+    return Engine(limit=args.workers, group_limit=args.group_limit,
+        group_by=campus if args.group_by == 'campus' else role,
+        adaptive=Adaptive(args.workers) if args.adaptive else None,
+        retries=args.retries, backoff=args.backoff)
+
+# retries an error gets, 0 for errors that are not session errors
+def retries_for(err, retries):
+    for cls in type(err).__mro__:
+        if cls.__name__ in RETRIES:
+            limit = RETRIES[cls.__name__]
+            return retries if limit is None else min(limit, retries)
+    return 0
+
+# (module, attribute, signal) of the calls an Adaptive learns from: connect
+# and authentication time, session errors as the tools see them, and RPCs
+HOOKS = [
+    ('ncclient.manager', 'connect', 'connect'),
+    ('jnpr.junos.device', 'Device.open', 'open'),
+    ('jnpr.junos.device', 'Device.execute', 'rpc'),
+]
+
+# errors that tell the fleet, or what it authenticates against, is overrun
+OVERRUN = ['ConnectTimeoutError', 'ConnectAuthError', 'RpcTimeoutError']
+
+# AIMD limit of concurrent sessions between 1 and 'ceiling'. Every connect
+# within its usual time adds one session up to 'threshold', so the limit
+# doubles per round of sessions, then one session per round. A timeout, an
+# authentication failure, or a connect or an RPC slower than 'slow' times
+# its usual time halves the limit and the threshold, once for the sessions
+# started before the cut. No growth while the local CPUs are saturated, as
+# their queue would slow every session down.
+class Adaptive:
+
+    def __init__(self, ceiling, start=START, slow=3.0):
+        self.ceiling = ceiling
+        self.limit = min(start, ceiling)
+        self.threshold = ceiling
+        self.slow = slow
+        self.peak = self.limit
+        self.cuts = 0
+        self._credit = 0.0
+        self._cut_at = 0.0
+        # signal key -> (moving average of seconds, samples)
+        self._usual = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._saved = []
+
+    # call 'listener' after every change of the limit
+    def listen(self, listener):
+        self._listeners.append(listener)
+
+    def unlisten(self, listener):
+        self._listeners.remove(listener)
+
+    # wrap the calls of HOOKS that are importable here
+    def install(self):
+        for module_name, attribute, signal in HOOKS:
+            try:
+                owner = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            *path, name = attribute.split('.')
+            for part in path:
+                owner = getattr(owner, part, None)
+            func = getattr(owner, name, None) if owner is not None else None
+            if func is None:
+                continue
+            self._saved.append((owner, name, func))
+            setattr(owner, name, self._wrap(func, signal))
+
+    def uninstall(self):
+        while self._saved:
+            owner, name, func = self._saved.pop()
+            setattr(owner, name, func)
+
+    def _wrap(self, func, signal):
+        adaptive = self
+
+        def observed(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:
+                if type(err).__name__ in OVERRUN:
+                    adaptive.overrun(start)
+                raise
+            if signal != 'open':
+                key = signal if signal == 'connect' else f'rpc {getattr(args[1] if len(args) > 1 else None, "tag", "")}'
+                adaptive.observe(key, time.monotonic() - start, start)
+            return result
+
+        observed.__wrapped__ = func
+        return observed
+
+    # a call of 'key' that took 'seconds', started at 'start'
+    def observe(self, key, seconds, start):
+        with self._lock:
+            usual, samples = self._usual.get(key, (seconds, 0))
+            self._usual[key] = (0.8 * usual + 0.2 * seconds if samples else seconds, samples + 1)
+            slow = samples >= 5 and seconds > self.slow * usual
+        if slow:
+            self.overrun(start)
+        elif key == 'connect' and not cpu_saturated():
+            self._grow()
+
+    def _grow(self):
+        with self._lock:
+            if self.limit >= self.ceiling:
+                return
+            if self.limit < self.threshold:
+                self.limit += 1
+            else:
+                self._credit += 1 / self.limit
+                if self._credit < 1:
+                    return
+                self._credit -= 1
+                self.limit += 1
+            self.peak = max(self.peak, self.limit)
+        self._changed()
+
+    # halve the limit, unless cut for sessions started before 'start' already
+    def overrun(self, start):
+        with self._lock:
+            if start < self._cut_at:
+                return
+            self.threshold = self.limit = max(1, self.limit // 2)
+            self._credit = 0.0
+            self._cut_at = time.monotonic()
+            self.cuts += 1
+        self._changed()
+
+    def _changed(self):
+        for listener in list(self._listeners):
+            listener()
+
+# True if the 1-minute load is above the number of CPUs
+def cpu_saturated():
+    try:
+        return os.getloadavg()[0] > (os.cpu_count() or 1)
+    except OSError:
+        return False
+
+class Engine:
+
+    def __init__(self, limit=50, group_limit=None, group_by=campus, window=None, backlog=None, adaptive=None, retries=0, backoff=2.0):
+        self.limit = limit
+        self.group_limit = group_limit
+        self.group_by = group_by
+        self.window = window
+        self.backlog = backlog or limit
+        self.adaptive = adaptive
+        self.retries = retries
+        self.backoff = backoff
+        # host -> retries, and error class name -> retries, of the last run
+        self.retried = collections.Counter()
+        self._retried_by_error = collections.Counter()
+
+    # seconds before the next attempt at a host whose job raised 'err' on
+    # attempt 'attempt', the first being 1; None if it is not retried
+    def retry_delay(self, err, attempt):
+        if attempt > retries_for(err, self.retries):
+            return None
+        delay = self.backoff * 2 ** (attempt - 1)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # yield a Future per host as soon as its job finishes
+    def as_completed(self, func, hosts, *args, **kwargs):
+        handoff = queue.Queue(maxsize=self.backlog)
+        stop = threading.Event()
+        runner = threading.Thread(
+            target=asyncio.run,
+            args=(self._dispatch(func, hosts, args, kwargs, handoff, stop),),
+            daemon=True)
+        if self.adaptive:
+            self.adaptive.install()
+        runner.start()
+        try:
+            while True:
+                future = handoff.get()
+                if future is _DONE:
+                    break
+                yield future
+        finally:
+            # consumer went away early: stop launching and drain the workers
+            stop.set()
+            while runner.is_alive():
+                try:
+                    handoff.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            runner.join()
+            if self.adaptive:
+                self.adaptive.uninstall()
+            self.report()
+
+    # how concurrency adapted and hosts were retried, on stderr clear of a
+    # tool's own output on stdout
+    def report(self):
+        lines = []
+        if self.adaptive:
+            lines.append(f'Adaptive concurrency: {self.adaptive.limit} session(s) at the end, {self.adaptive.peak} at most ' +
+                f'of --workers {self.limit}, {self.adaptive.cuts} back-off(s).')
+        if self.retried:
+            lines.append(f'Retried {sum(self.retried.values())} time(s) on {len(self.retried)} host(s): ' +
+                ', '.join(f'{name} {count}' for name, count in self._retried_by_error.items()) + '.')
+        if lines:
+            sys.stderr.write('\n' + '\n'.join(lines) + '\n')
+
+    # run func on every host and return the Futures in host-list order
+    def map(self, func, hosts, *args, **kwargs):
+        hosts = list(hosts)
+        futures = [None] * len(hosts)
+        for future in self.as_completed(func, hosts, *args, **kwargs):
+            futures[future.index] = future
+        return futures
+
+    async def _dispatch(self, func, hosts, args, kwargs, handoff, stop):
+        loop = asyncio.get_running_loop()
+        executor = None if inspect.iscoroutinefunction(func) else \
+            concurrent.futures.ThreadPoolExecutor(max_workers=self.limit)
+        source = enumerate(hosts)
+        exhausted = False
+        # pending hosts per group, in host-list order
+        pending = collections.OrderedDict()
+        n_pending = 0
+        active = collections.Counter()
+        unfinished = set()
+        running = set()
+        wakeup = asyncio.Event()
+        # hosts waiting out their backoff, and attempts per host index
+        backing_off = 0
+        attempts = collections.Counter()
+        self.retried.clear()
+        self._retried_by_error.clear()
+
+        def retire(task):
+            running.discard(task)
+            wakeup.set()
+
+        def limit():
+            return self.adaptive.limit if self.adaptive else self.limit
+
+        def grown():
+            loop.call_soon_threadsafe(wakeup.set)
+
+        def put(future):
+            # blocking put with a way out once the consumer has stopped
+            while not stop.is_set():
+                try:
+                    handoff.put(future, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        # the Future of an attempt, None and the delay if it is to be retried
+        def settle(future, err):
+            delay = self.retry_delay(err, future.attempts)
+            if delay is None:
+                future.set_exception(err)
+                return future, None
+            self.retried[future.host] += 1
+            self._retried_by_error[type(err).__name__] += 1
+            return None, delay
+
+        def new_future(index, host):
+            future = concurrent.futures.Future()
+            future.host = host
+            future.index = index
+            future.attempts = attempts[index]
+            future.set_running_or_notify_cancel()
+            return future
+
+        def call(index, host):
+            future = new_future(index, host)
+            try:
+                future.set_result(func(host, *args, **kwargs))
+            except BaseException as err:
+                future, delay = settle(future, err)
+                if future is None:
+                    return delay
+            put(future)
+            return None
+
+        async def acall(index, host):
+            future = new_future(index, host)
+            try:
+                future.set_result(await func(host, *args, **kwargs))
+            except Exception as err:
+                future, delay = settle(future, err)
+                if future is None:
+                    return delay
+            await loop.run_in_executor(None, put, future)
+            return None
+
+        def requeue(index, host, group):
+            nonlocal backing_off, n_pending
+            backing_off -= 1
+            # ahead of the hosts of its group, which were all read after it
+            pending.setdefault(group, collections.deque()).appendleft((index, host))
+            n_pending += 1
+            wakeup.set()
+
+        async def job(index, host, group):
+            nonlocal backing_off
+            delay = None
+            attempts[index] += 1
+            try:
+                if executor is None:
+                    delay = await acall(index, host)
+                else:
+                    delay = await loop.run_in_executor(executor, call, index, host)
+            finally:
+                active[group] -= 1
+                if delay is None:
+                    unfinished.discard(index)
+            if delay is not None:
+                backing_off += 1
+                loop.call_later(delay, requeue, index, host, group)
+
+        if self.adaptive:
+            self.adaptive.listen(grown)
+        try:
+            while not stop.is_set():
+                # read ahead a bounded number of hosts into the group queues
+                while not exhausted and n_pending < self.backlog + self.limit:
+                    try:
+                        index, host = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.setdefault(self.group_by(host), collections.deque()).append((index, host))
+                    n_pending += 1
+
+                # launch the oldest host whose group has room, until the limit is hit
+                while len(running) < limit():
+                    floor = min(unfinished) if unfinished else None
+                    best = None
+                    for group, items in pending.items():
+                        if not items:
+                            continue
+                        if self.group_limit and active[group] >= self.group_limit:
+                            continue
+                        if best is None or items[0][0] < pending[best][0][0]:
+                            best = group
+                    if best is None:
+                        break
+                    index, host = pending[best][0]
+                    if self.window and floor is not None and index >= floor + self.window:
+                        break
+                    pending[best].popleft()
+                    n_pending -= 1
+                    active[best] += 1
+                    unfinished.add(index)
+                    task = asyncio.ensure_future(job(index, host, best))
+                    running.add(task)
+                    task.add_done_callback(retire)
+
+                if not running and not n_pending and not backing_off and exhausted:
+                    break
+                wakeup.clear()
+                await wakeup.wait()
+
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            if self.adaptive:
+                self.adaptive.unlisten(grown)
+            if executor is not None:
+                executor.shutdown(wait=True)
+            await loop.run_in_executor(None, put, _DONE)
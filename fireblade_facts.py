@@ -0,0 +1,84 @@
+# fireblade_facts keeps what fireblade tools learn about a host's hardware,
+# such as its model, chassis composition, campus and role, in fireblade_cache,
+# so that later runs skip PyEZ fact gathering. It
+# 1. returns a cached fact while it is younger than the TTL;
+# 2. otherwise works the fact out on the open Device and caches it;
+# 3. tells whether every fact a tool needs is cached, in which case the tool
+#    opens its Device with gather_facts=False.
+
+import fireblade_cache
+from utils import fireblade_hw
+
+NAMESPACE = 'facts'
+DEFAULT_TTL_HOURS = 7 * 24
+
+# fact name -> function working it out on an open Device
+FACTS = {
+    'campus': fireblade_hw.campus,
+    'role': fireblade_hw.role,
+    'model': fireblade_hw.model,
+    'chassis': fireblade_hw.chassis,
+    'hw_dict': fireblade_hw.hw_dict,
+    'hostname': lambda dev: dev.facts['hostname'],
+    'device_model': lambda dev: dev.facts['model'],
+    'model_info': lambda dev: dev.facts['model_info'],
+}
+
+# command line arguments of the facts cache, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--facts_ttl', type=float, default=DEFAULT_TTL_HOURS, metavar='HOURS',
+        help=f'Hours a cached host fact stays valid. Default to {DEFAULT_TTL_HOURS}.')
+    parser.add_argument('--refresh_facts', action='store_true',
+        help='Ignore cached host facts, gather and cache them again.')
+
+# facts cache built from parsed command line arguments
+def from_args(args):
+    return Facts(ttl=args.facts_ttl * 3600, refresh=args.refresh_facts)
+
+class Facts:
+
+    def __init__(self, cache=None, ttl=DEFAULT_TTL_HOURS * 3600, refresh=False):
+        self.cache = cache or fireblade_cache.Cache()
+        self.ttl = ttl
+        self.refresh = refresh
+
+    # cached fact of a host, None if missing or expired
+    def cached(self, host, name):
+        if self.refresh:
+            return None
+        return self.cache.get(NAMESPACE, f'{host}/{name}', ttl=self.ttl)
+
+    # True if all named facts of a host are cached
+    def warm(self, host, names):
+        return all(self.cached(host, name) is not None for name in names)
+
+    # cached facts of all hosts in one read, as {host: {name: value}}
+    def table(self):
+        if self.refresh:
+            return {}
+        table = {}
+        for key, value in self.cache.items(NAMESPACE, ttl=self.ttl).items():
+            host, _, name = key.rpartition('/')
+            table.setdefault(host, {})[name] = value
+        return table
+
+    # Device arguments for a session that needs the named facts of a host
+    def device_args(self, host, names):
+        return {'gather_facts': False} if self.warm(host, names) else {}
+
+    # fact of a host, worked out on 'dev' and cached on a miss
+    def get(self, dev, host, name):
+        value = self.cached(host, name)
+        if value is None:
+            value = FACTS[name](dev)
+            if value is not None:
+                self.cache.put(NAMESPACE, f'{host}/{name}', value)
+        return value
+
+    # store a fact learned elsewhere
+    def put(self, host, name, value):
+        self.cache.put(NAMESPACE, f'{host}/{name}', value)
+
+    # drop the cached facts of a host, of all hosts by default
+    def invalidate(self, host=None):
+        self.cache.invalidate(NAMESPACE, f'{host}/' if host else '')
@@ -0,0 +1,203 @@
+# fireblade_files stages files, such as JUNOS packages, on hosts for fireblade
+# tools. It
+# 1. computes the md5 of a local file once per run, however many hosts take it;
+# 2. asks a host for the md5 of its copy with get-checksum-information, the way
+#    fireblade.ii checks its agent, and skips the upload when it matches;
+# 3. uploads over scp within a bandwidth budget shared by all hosts of a run,
+#    a token bucket refilled at the rate of the budget;
+# 4. verifies the md5 of an upload before a tool relies on it;
+# 5. optionally remembers, in fireblade_cache, which hosts hold a verified
+#    copy of a file, so later runs within a TTL skip the checks altogether.
+#    Only files that stay put belong there, i.e. op scripts, not packages
+#    that an installation removes.
+
+import os
+import time
+import hashlib
+import threading
+import fireblade_cache
+from jnpr.junos.exception import RpcError
+from jnpr.junos.utils.scp import SCP
+
+DEFAULT_DIR = '/var/tmp'
+
+NAMESPACE = 'deploy'
+DEFAULT_TTL_HOURS = 24
+
+# command line arguments of file staging, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--upload_limit', type=float, metavar='MBPS',
+        help='Total upload bandwidth of all hosts in Mbit/s. Unlimited by default.')
+
+# upload budget built from parsed command line arguments, None for no limit
+def from_args(args):
+    return Budget(args.upload_limit * 125000) if args.upload_limit else None
+
+# command line arguments of the deployment state, shared by fireblade tools
+def add_state_arguments(parser):
+    parser.add_argument('--deploy_ttl', type=float, default=DEFAULT_TTL_HOURS, metavar='HOURS',
+        help=f'Hours a verified deployment stays trusted without checking the host. Default to {DEFAULT_TTL_HOURS}.')
+    parser.add_argument('--redeploy', action='store_true',
+        help='Ignore recorded deployments, check every host and upload where needed.')
+
+# deployment state built from parsed command line arguments
+def state_from_args(args):
+    return DeployState(ttl=args.deploy_ttl * 3600, refresh=args.redeploy)
+
+# hosts known to hold a verified copy of a file, as (md5, local mtime) under
+# key 'host:remote path'
+class DeployState:
+
+    def __init__(self, cache=None, ttl=DEFAULT_TTL_HOURS * 3600, refresh=False):
+        self.cache = cache or fireblade_cache.Cache()
+        self.ttl = ttl
+        self.refresh = refresh
+
+    # True if the host was found with this md5 of the file within the TTL
+    def verified(self, host, remote, checksum):
+        if self.refresh:
+            return False
+        entry = self.cache.get(NAMESPACE, f'{host}:{remote}', ttl=self.ttl)
+        return entry is not None and entry['md5'] == checksum
+
+    def put(self, host, remote, local):
+        self.cache.put(NAMESPACE, f'{host}:{remote}', {'md5': md5(local), 'mtime': os.path.getmtime(local)})
+
+    # forget the deployments of a host, of all hosts by default
+    def invalidate(self, host=None):
+        self.cache.invalidate(NAMESPACE, f'{host}:' if host else '')
+
+# bytes per second shared by the uploads of many threads. An upload takes
+# tokens for every chunk it sends and sleeps off any shortfall, so all
+# uploads together never run faster than 'rate' beyond a 'burst' of bytes
+class Budget:
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, n):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+_md5s = {}
+_md5_lock = threading.Lock()
+
+# md5 of a local file, computed once per path, size and modification time
+def md5(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _md5_lock:
+        if key not in _md5s:
+            md5_hash = hashlib.md5()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    md5_hash.update(chunk)
+            _md5s[key] = md5_hash.hexdigest()
+        return _md5s[key]
+
+# md5 of a file on a host, None if it is missing or cannot be read
+def remote_md5(dev, path):
+    try:
+        report = dev.rpc.get_checksum_information(path=path, dev_timeout=600)
+    except RpcError:
+        return None
+    checksum_elm = report.find('.//checksum')
+    return checksum_elm.text.strip() if checksum_elm is not None and checksum_elm.text else None
+
+# a local file read by scp, within the budget, reporting every 10%
+class _Reader:
+
+    def __init__(self, fo, name, size, budget, progress):
+        self.fo = fo
+        self.name = name
+        self.size = size
+        self.budget = budget
+        self.progress = progress
+        self.sent = 0
+        self.reported = 0
+
+    def read(self, n):
+        data = self.fo.read(n)
+        if self.budget and data:
+            self.budget.consume(len(data))
+        self.sent += len(data)
+        pct = self.sent * 100 // self.size if self.size else 100
+        if pct // 10 > self.reported // 10:
+            self.reported = pct
+            self.progress(f'{self.name}: {self.sent} / {self.size} ({pct}%)')
+        return data
+
+    # scp tells how far it got from the position of the file it sends
+    def tell(self):
+        return self.sent
+
+# upload 'local' to 'remote' within 'budget' and verify it; returns (ok, message)
+def upload(dev, local, remote, budget=None, report=None):
+    report = report or (lambda text: None)
+    start = time.perf_counter()
+    size = os.path.getsize(local)
+    with open(local, 'rb') as fo, SCP(dev) as scp:
+        scp.putfo(_Reader(fo, os.path.basename(local), size, budget, report), remote, size=size)
+    seconds = time.perf_counter() - start
+
+    if remote_md5(dev, remote) != md5(local):
+        return False, f'md5 of {remote} mismatched after upload'
+    report(f'{remote} uploaded and verified in {seconds:.0f} seconds')
+    return True, f'{remote} uploaded in {seconds:.0f} seconds'
+
+# make sure the local files sit in 'remote_dir' of the host, or at the remote
+# paths of a {local file: remote path} dict; returns (ok, message). Copies
+# with the same md5 are kept. If any file is to be uploaded, storage is
+# cleaned up first when 'cleanfs', which may remove kept copies too, so they
+# are checked again. 'progress' takes (dev, report), as PyEZ progress
+# callbacks do. With a DeployState 'state', hosts recorded with the same md5
+# are not asked at all, and verified hosts are recorded
+def stage(dev, files, remote_dir=DEFAULT_DIR, budget=None, progress=None, cleanfs=True, state=None):
+    report = (lambda text: progress(dev, text)) if progress else (lambda text: None)
+    remotes = files if isinstance(files, dict) else \
+        {local: f'{remote_dir}/{os.path.basename(local)}' for local in files}
+
+    if state and all(state.verified(dev.hostname, remote, md5(local)) for local, remote in remotes.items()):
+        return True, f'{", ".join(remotes.values())} recorded as deployed'
+    ok, message = _stage(dev, remotes, budget, report, cleanfs)
+    if state and ok:
+        for local, remote in remotes.items():
+            state.put(dev.hostname, remote, local)
+    return ok, message
+
+# stage on the host, local file -> remote path in 'remotes'
+def _stage(dev, remotes, budget, report, cleanfs):
+
+    def missing():
+        return [local for local, remote in remotes.items() if remote_md5(dev, remote) != md5(local)]
+
+    uploads = missing()
+    if not uploads:
+        report(f'{", ".join(remotes.values())} verified by md5, upload skipped')
+        return True, f'{", ".join(remotes.values())} already staged'
+
+    if cleanfs:
+        report('cleaning up storage before upload')
+        dev.rpc.request_system_storage_cleanup(dev_timeout=600)
+        uploads = missing()
+    for local in remotes:
+        if local not in uploads:
+            report(f'{remotes[local]} verified by md5 {md5(local)}, upload skipped')
+
+    messages = []
+    for local in uploads:
+        ok, message = upload(dev, local, remotes[local], budget, report)
+        messages.append(message)
+        if not ok:
+            return False, message
+    return True, ', '.join(messages)
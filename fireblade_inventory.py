@@ -0,0 +1,113 @@
+# fireblade_inventory resolves the campus, role and model selectors of
+# fireblade tools before any session is opened. It
+# 1. indexes hosts by the campus and role fields of their hostnames, such as
+#    bby-acf111-edge-1.managenet.sfu.ca, and by the facts fireblade_facts has
+#    cached for them, cached facts first;
+# 2. drops the hosts a selector rules out, with the reason, without connecting;
+# 3. keeps the hosts it cannot tell, i.e. a model selector on a host whose
+#    model is not cached yet, for the tool to check on the open Device, which
+#    caches the fact for the next run.
+
+import fireblade_engine
+import fireblade_facts
+
+CAMPUSES = ['bby', 'sry', 'van']
+ROLES = ['core', 'edge', 'dc', 'ext', 'mgmt']
+MODELS = {'c': 'EX2300-C-12P', 'p': 'EX4300-48P', 'mp': 'EX4300-48MP'}
+
+# selector name -> hostname field it may be read from, with its known values
+HOSTNAME_FIELDS = {
+    'campus': (fireblade_engine.campus, CAMPUSES),
+    'role': (fireblade_engine.role, ROLES),
+}
+
+# reason for dropping a host whose value of a selector mismatched
+REASONS = {
+    'campus': lambda value: f"This host is on campus {value.upper()}, campus mismatched, skipping",
+    'role': lambda value: f"This host is a '{value.upper()}' switch, chassis role mismatched, skipping.",
+    'model': lambda value: f"This host is an '{value.upper()}' chassis, model mismatched, skipping.",
+}
+
+# command line arguments of the selectors, shared by fireblade tools; tools
+# whose short options are taken already get the long options only
+def add_arguments(parser, short=True):
+
+    # arg 'campus'
+    parser.add_argument(*(['-p'] if short else []), '--campus', choices=CAMPUSES,
+        help='Campus: self-explanatory. All campuses are covered if no option of campus is provided.')
+
+    # arg 'role'
+    parser.add_argument(*(['-r'] if short else []), '--role', default='all',
+        choices=['all'] + ROLES,
+        help='Chassis role: Default to "all" for all chassis. Other choices are: ' +
+        '\n"core" for CORE switches;' +
+        '\n"edge" for EDGE switches;' +
+        '\n"ext" for EXTENSION switches; ' +
+        '\"dc" for DATACENTRE switches, and "mgmt" for MANAGEMENT network.')
+
+    # arg 'model'
+    parser.add_argument(*(['-d'] if short else []), '--model', default='all', choices=['all'] + list(MODELS) + ['m'],
+        help='Chassis model: Default to "all" for all models,other choices are:' +
+        ''.join(f'\n"{key}" for "{value}",' for key, value in MODELS.items()) +
+        '\nand "m" for manual input.')
+
+# selector built from parsed command line arguments, on the facts cache of
+# the tool if it has one
+def from_args(args, facts=None):
+    model = MODELS.get(args.model) or (input("Please key in specific model: ") if args.model == 'm' else 'all')
+    return Selector(campus=args.campus, role=args.role, model=model, facts=facts)
+
+class Selector:
+
+    def __init__(self, campus=None, role='all', model='all', facts=None):
+        self.facts = facts or fireblade_facts.Facts()
+        # selector name -> wanted value, for the selectors in use only
+        self.wanted = {name: value for name, value in
+            [('campus', campus), ('role', role), ('model', model)] if value not in [None, 'all']}
+        # cached facts of all hosts, read once
+        self._index = self.facts.table() if self.wanted else {}
+
+    # value of a selector for a host from the index, None if unknown
+    def known(self, host, name):
+        value = self._index.get(host, {}).get(name)
+        if value is None and name in HOSTNAME_FIELDS:
+            parse, values = HOSTNAME_FIELDS[name]
+            field = parse(host)
+            value = field if field in values else None
+        return value
+
+    # names of the selectors a host cannot be told on without a session
+    def pending(self, host):
+        return [name for name in self.wanted if self.known(host, name) is None]
+
+    # reason for dropping a host on its values of the selectors, None to keep it
+    def _reason(self, host, value_of):
+        for name, value in self.wanted.items():
+            actual = value_of(host, name)
+            if actual is not None and actual != value:
+                return REASONS[name](actual)
+        return None
+
+    # reason for dropping a host, None to keep it. Facts missing from the
+    # index are read from the cache again, as a tool may have cached them
+    # since; with an open Device they are worked out on it
+    def check(self, host, dev=None):
+        def value_of(host, name):
+            value = self.known(host, name)
+            if value is None:
+                value = self.facts.get(dev, host, name) if dev is not None else self.facts.cached(host, name)
+            return value
+        return self._reason(host, value_of)
+
+    # split hosts into (kept hosts, [(dropped host, reason)]) on the index
+    # alone; kept hosts include those still to be checked on a session
+    def select(self, hosts):
+        kept = []
+        dropped = []
+        for host in hosts:
+            reason = self._reason(host, self.known)
+            if reason:
+                dropped.append((host, reason))
+            else:
+                kept.append(host)
+        return kept, dropped
@@ -0,0 +1,124 @@
+# fireblade_journal is an append-only job journal for long-running fleet
+# operations, so that a job cut short, i.e. by a dead terminal, can be resumed
+# without redoing the hosts it finished. It
+# 1. appends one json line per state change of a host, e.g. queued,
+#    connected, installing, done or failed, and syncs it to disk at once;
+# 2. marks the start of every run with the parameters of its job, i.e. the
+#    mode and a digest of the change; a fresh run starts a new job, a run with
+#    --resume carries on the job of the runs before it, if of the same
+#    parameters;
+# 3. tells a resumed run which hosts are done already.
+#
+# A journal reads as a log, one record per line:
+# {"time": "2025-09-02 01:15:32", "host": "bby-acf111-edge-1.managenet.sfu.ca", "state": "installing"}
+
+import os
+import json
+import hashlib
+import datetime
+import threading
+
+DEFAULT_DIR = os.path.expanduser('~/.netauto/journal')
+
+# states of a host that a resumed run skips
+FINAL = ['done']
+
+# command line arguments of the journal, shared by fireblade tools
+def add_arguments(parser, name):
+    default = os.path.join(DEFAULT_DIR, f'{name}.jsonl')
+    parser.add_argument('--journal', metavar='FILE', default=default,
+        help=f'Job journal, one line per state change of a host. Default to {default}')
+    parser.add_argument('--resume', action='store_true',
+        help='Carry on the job in --journal, skipping the hosts it finished.')
+
+# journal built from parsed command line arguments; a resumed job of other
+# parameters is reported by 'parser'
+def from_args(args, parser=None):
+    return Journal(args.journal, resume=args.resume, error=parser.error if parser else None)
+
+# digest of the lines of a change, a job parameter that tells changes apart
+def digest(lines):
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+class Journal:
+
+    def __init__(self, path, resume=False, error=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.resume = resume
+        self._error = error
+        self._lock = threading.Lock()
+        # parameters of the job so far, None for a fresh job or one started without them
+        self.job = None
+        # last state of each host of the job so far, empty for a fresh job
+        self.states = self._load() if resume else {}
+        self._fo = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # last state of each host since the latest fresh start in the file
+    def _load(self):
+        states = {}
+        if not os.path.isfile(self.path):
+            return states
+        with open(self.path, 'r') as fo:
+            for line in fo:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by a crash
+                    continue
+                if record.get('host') is None:
+                    if record.get('state') == 'started':
+                        states = {}
+                        self.job = record.get('job')
+                    continue
+                states[record['host']] = record['state']
+        return states
+
+    # append records and sync them to disk, with one sync for many records
+    def _write(self, *records):
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        lines = ''.join(json.dumps(dict(time=now, **record)) + '\n' for record in records)
+        with self._lock:
+            self._fo.write(lines)
+            self._fo.flush()
+            os.fsync(self._fo.fileno())
+
+    # mark the start of a run of a job of parameters 'job'; resuming a job of
+    # other parameters would skip hosts done with another change, an error
+    def start(self, **job):
+        job = json.loads(json.dumps(job))
+        if self.resume and self.job is not None and job != self.job:
+            changed = ', '.join(key for key in sorted(set(job) | set(self.job)) if job.get(key) != self.job.get(key))
+            message = f'the job in {self.path} has another {changed}, run without --resume to start a new job'
+            if self._error is None:
+                raise ValueError(message)
+            self._error(message)
+        self._write({'host': None, 'state': 'resumed' if self.resume else 'started', 'job': job})
+
+    # record the state of a host, with any detail worth keeping
+    def record(self, host, state, **detail):
+        with self._lock:
+            self.states[host] = state
+        self._write(dict(host=host, state=state, **detail))
+
+    def state(self, host):
+        return self.states.get(host)
+
+    # split hosts into (hosts to run, hosts done already) and queue the former
+    def pending(self, hosts):
+        todo = [host for host in hosts if self.states.get(host) not in FINAL]
+        done = [host for host in hosts if self.states.get(host) in FINAL]
+        with self._lock:
+            self.states.update((host, 'queued') for host in todo)
+        self._write(*({'host': host, 'state': 'queued'} for host in todo))
+        return todo, done
+
+    def close(self):
+        with self._lock:
+            self._fo.close()
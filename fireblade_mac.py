@@ -0,0 +1,75 @@
+# fireblade_mac keeps the last ethernet-switching table of each host in a
+# local snapshot store and reports only what changed since, so repeated NAC
+# sweeps hand the MAC mapping just the deltas. For each host it
+# 1. fetches the table through the get-ethernet-switching-table RPC;
+# 2. compares (vlan, mac) -> interface with the stored snapshot;
+# 3. emits added, removed and moved entries as csv rows whose first four
+#    columns follow mac.map.csv (mac,host,interface,original vlan);
+# 4. replaces the snapshot, one gzip'd tab separated file per host.
+
+import io
+import os
+import csv
+import gzip
+import tempfile
+import fireblade_rpc
+
+HEADER = 'mac,host,interface,original vlan,change,previous interface'
+COMMAND = 'show ethernet-switching table'
+DEFAULT_STORE = os.path.expanduser('~/.netauto/mac')
+
+class SnapshotStore:
+
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, host):
+        return os.path.join(self.root, f'{host}.mac.gz')
+
+    # last table of a host as {(vlan, mac): interface}, None if never collected
+    def load(self, host):
+        try:
+            with gzip.open(self.path(host), 'rt') as fo:
+                return {(vlan, mac): interface for vlan, mac, interface in
+                    (line.rstrip('\n').split('\t') for line in fo)}
+        except FileNotFoundError:
+            return None
+
+    # replace the table of a host, atomically so a crash keeps the old one
+    def save(self, host, table):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f'.{host}.')
+        with gzip.open(os.fdopen(fd, 'wb'), 'wt') as fo:
+            for (vlan, mac), interface in sorted(table.items()):
+                fo.write(f'{vlan}\t{mac}\t{interface}\n')
+        os.replace(tmp, self.path(host))
+
+# {(vlan, mac): interface} from fireblade_rpc records, interface without unit .0
+def table(records):
+    return {(r['vlan'], r['mac']): r['interface'].removesuffix('.0') for r in records}
+
+# changes from old to new table as (change, vlan, mac, interface, previous interface)
+def diff(old, new):
+    changes = []
+    for key, interface in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append(('added', *key, interface, ''))
+        elif previous != interface:
+            changes.append(('moved', *key, interface, previous))
+    for key, previous in old.items():
+        if key not in new:
+            changes.append(('removed', *key, previous, ''))
+    return sorted(changes, key=lambda c: (c[1], c[2]))
+
+# collect the table of a host and return its delta rows as csv
+def collect(dev, host, store):
+    _, records = fireblade_rpc.query(dev, COMMAND)
+    new = table(records)
+    changes = diff(store.load(host) or {}, new)
+    store.save(host, new)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for change, vlan, mac, interface, previous in changes:
+        writer.writerow([mac, host, interface, vlan, change, previous])
+    return out.getvalue()
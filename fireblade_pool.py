@@ -0,0 +1,184 @@
+# fireblade_pool keeps one authenticated NETCONF session, and one shell on
+# top of it, per host so that every inquiry and configuration change made on
+# a host during a run reuses the same SSH handshake. It
+# 1. opens a Device on first use of a host and lends it to one caller at a time;
+# 2. keeps idle sessions alive with SSH keepalives;
+# 3. evicts sessions that stay idle longer than idle_timeout;
+# 4. caps open sessions at max_sessions, closing the least recently used
+#    idle session to make room, or waiting for one to be returned.
+
+import time
+import threading
+from contextlib import contextmanager
+from jnpr.junos import Device
+from jnpr.junos.utils.start_shell import StartShell
+
+# one pooled host
+class _Entry:
+
+    def __init__(self, host):
+        self.host = host
+        self.dev = None
+        self.shell = None
+        self.busy = True
+        self.last_used = time.monotonic()
+
+# set ssh keepalive on a paramiko transport, if the transport is reachable
+def _set_keepalive(transport, interval):
+    if transport is not None and interval:
+        transport.set_keepalive(interval)
+
+# close shell and device of an entry, ignoring errors from dead sessions
+def _close_entry(entry):
+    if entry.shell is not None:
+        try:
+            entry.shell.close()
+        except Exception:
+            pass
+    if entry.dev is not None:
+        try:
+            entry.dev.close()
+        except Exception:
+            pass
+
+class SessionPool:
+
+    def __init__(self, uname, passwd, max_sessions=50, idle_timeout=300, keepalive=30, **device_args):
+        self.uname = uname
+        self.passwd = passwd
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.device_args = device_args
+        self._entries = {}
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._reaper = threading.Thread(target=self._reap, daemon=True)
+        self._reaper.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # lend the pooled Device of a host, opening it on first use with
+    # 'device_args' on top of the pool's own, i.e. gather_facts=False
+    @contextmanager
+    def session(self, host, **device_args):
+        entry = self._acquire(host, device_args)
+        try:
+            yield entry.dev
+        finally:
+            self._release(entry)
+
+    # the open shell of a Device lent by this pool, started on first use
+    def shell(self, dev):
+        entry = self._entry_of(dev)
+        chan = getattr(entry.shell, '_chan', None)
+        if entry.shell is None or chan is None or chan.closed:
+            entry.shell = StartShell(dev)
+            entry.shell.open()
+            client = getattr(entry.shell, '_client', None)
+            _set_keepalive(client.get_transport() if client else None, self.keepalive)
+        return entry.shell
+
+    # close and forget the session of a host
+    def evict(self, host):
+        with self._cond:
+            entry = self._entries.get(host)
+            if entry is None or entry.busy:
+                return
+            del self._entries[host]
+            self._cond.notify_all()
+        _close_entry(entry)
+
+    # close every pooled session
+    def close(self):
+        self._closed.set()
+        with self._cond:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._cond.notify_all()
+        for entry in entries:
+            _close_entry(entry)
+
+    def _entry_of(self, dev):
+        with self._cond:
+            for entry in self._entries.values():
+                if entry.dev is dev:
+                    return entry
+        raise ValueError('Device is not lent by this pool')
+
+    def _acquire(self, host, device_args=None):
+        victims = []
+        with self._cond:
+            while True:
+                if self._closed.is_set():
+                    raise RuntimeError('session pool is closed')
+                entry = self._entries.get(host)
+                if entry is not None:
+                    if entry.busy:
+                        self._cond.wait()
+                        continue
+                    if entry.dev.connected:
+                        entry.busy = True
+                        return entry
+                    # dropped by the far end since last use
+                    del self._entries[host]
+                    victims.append(entry)
+                    continue
+                if len(self._entries) < self.max_sessions:
+                    entry = _Entry(host)
+                    self._entries[host] = entry
+                    break
+                idle = [e for e in self._entries.values() if not e.busy]
+                if idle:
+                    victim = min(idle, key=lambda e: e.last_used)
+                    del self._entries[victim.host]
+                    victims.append(victim)
+                    continue
+                self._cond.wait()
+
+        for victim in victims:
+            _close_entry(victim)
+
+        # open the session outside the lock, the handshake is the slow part
+        try:
+            dev = Device(host=host, user=self.uname, password=self.passwd, **{**self.device_args, **(device_args or {})})
+            dev.open()
+        except Exception:
+            with self._cond:
+                self._entries.pop(host, None)
+                self._cond.notify_all()
+            raise
+        session = getattr(getattr(dev, '_conn', None), '_session', None)
+        _set_keepalive(getattr(session, '_transport', None), self.keepalive)
+        entry.dev = dev
+        return entry
+
+    def _release(self, entry):
+        broken = entry.dev is None or not entry.dev.connected
+        with self._cond:
+            entry.busy = False
+            entry.last_used = time.monotonic()
+            if broken and self._entries.get(entry.host) is entry:
+                del self._entries[entry.host]
+            self._cond.notify_all()
+        if broken:
+            _close_entry(entry)
+
+    # evict sessions idle longer than idle_timeout
+    def _reap(self):
+        interval = max(1, min(self.idle_timeout, self.keepalive or self.idle_timeout) / 2)
+        while not self._closed.wait(interval):
+            now = time.monotonic()
+            with self._cond:
+                stale = [e for e in self._entries.values()
+                    if not e.busy and now - e.last_used > self.idle_timeout]
+                for entry in stale:
+                    del self._entries[entry.host]
+                if stale:
+                    self._cond.notify_all()
+            for entry in stale:
+                _close_entry(entry)
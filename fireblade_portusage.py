@@ -0,0 +1,119 @@
+# fireblade_portusage parses the output of the portusage.slax agent into typed
+# per-interface records, the parsing engine of fireblade.ii. It
+# 1. reads the structured mode of the agent, 'op portusage format xml', in one
+#    pass over the XML, with the seconds since the last flap as reported by
+#    Junos; the text mode, which fireblade.ii falls back to on older agents,
+#    goes through one precompiled regex over the whole output instead of three
+#    searches per line;
+# 2. keeps ge, mge and xe interfaces, or the kinds a tool asks for;
+# 3. tells the inactive interfaces, last flapped as long ago as the chassis
+#    booted, to the day;
+# 4. exports records as CSV, or as Parquet when pyarrow is installed.
+
+import re
+import csv
+from collections import namedtuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# a down interface of a host; 'flapped_seconds' is None if it never flapped
+Port = namedtuple('Port', 'host name kind admin_status oper_status last_flapped flapped_seconds description inactive')
+
+KINDS = ['ge', 'mge', 'xe']
+
+COMMAND = 'op portusage format xml'
+
+# the text mode, all that older agents know
+TEXT_COMMAND = 'op portusage'
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+UNITS = {'week': WEEK, 'day': DAY, 'hour': HOUR, 'minute': MINUTE, 'second': 1}
+
+# uptime of a member in hw_dict, i.e. '23 weeks, 1 day, 4 hours, 2 minutes, 10 seconds'
+UPTIME = re.compile(r'(\d+)\s*(week|day|hour|minute|second)s?')
+
+# a line of the text mode: type, interface, admin/oper status, last flapped, description
+LINE = re.compile(r'^(\S+)\s*\t\s*(\S+)\s*\t\s*([^/\s]+)/(\S+)\s*\t\s*(.*?)\s*\t\s?(.*?)\s*$', re.M)
+
+# time since the last flap of the text mode, i.e. '(4w6d 21:50 ago)' or '(21:28:00 ago)'
+AGO = re.compile(r'\((?:(\d+)w)?(?:(\d+)d)?\s*(\d+):(\d+)(?::(\d+))? ago\)')
+
+def uptime_seconds(text):
+    return sum(int(n) * UNITS[unit] for n, unit in UPTIME.findall(text))
+
+# weeks and days of a duration as Junos shows them, i.e. '23w0d' or '6d'
+def wd(seconds):
+    weeks, rest = divmod(seconds, WEEK)
+    days = rest // DAY
+    return f'{days}d' if weeks == 0 else f'{weeks}w{days}d'
+
+def ago_seconds(text):
+    match = AGO.search(text)
+    if not match:
+        return None
+    weeks, days, hours, minutes, seconds = (int(field or 0) for field in match.groups())
+    return weeks * WEEK + days * DAY + hours * HOUR + minutes * MINUTE + seconds
+
+# kind of an interface by the prefix of its name, None for other interfaces
+def kind(name):
+    prefix = name.split('-', 1)[0]
+    return prefix if '-' in name and prefix in KINDS else None
+
+# records of the structured mode, from the reply element
+def parse_xml(root, host='', boot_seconds=None, kinds=KINDS):
+    for elm in root.iter('interface'):
+        name = elm.findtext('name', '').strip()
+        k = kind(name)
+        if k not in kinds:
+            continue
+        seconds = elm.findtext('flapped-seconds', '').strip()
+        seconds = int(seconds) if seconds.isdigit() else None
+        yield Port(host, name, k, elm.findtext('admin-status', '').strip(), elm.findtext('oper-status', '').strip(),
+            elm.findtext('last-flapped', '').strip(), seconds, elm.findtext('description', '').strip(),
+            inactive(seconds, boot_seconds))
+
+# True if 'text' is the text mode of the agent rather than an error, by its header line
+def is_text(text):
+    return 'Last Flapped' in text
+
+# records of the text mode, from the whole output
+def parse_text(text, host='', boot_seconds=None, kinds=KINDS):
+    for _, name, admin, oper, flapped, description in LINE.findall(text):
+        k = kind(name)
+        if k not in kinds:
+            continue
+        seconds = ago_seconds(flapped)
+        yield Port(host, name, k, admin, oper, flapped, seconds, description, inactive(seconds, boot_seconds))
+
+# True if an interface last flapped as long ago as the chassis booted, to the day
+def inactive(flapped_seconds, boot_seconds):
+    if flapped_seconds is None or boot_seconds is None:
+        return False
+    return wd(flapped_seconds) == wd(boot_seconds)
+
+def write_csv(records, path):
+    with open(path, 'w', newline='') as fo:
+        writer = csv.writer(fo)
+        writer.writerow(Port._fields)
+        writer.writerows(records)
+
+def write_parquet(records, path):
+    records = list(records)
+    columns = {field: [getattr(record, field) for record in records] for field in Port._fields}
+    schema = pyarrow.schema([(field, pyarrow.int64() if field == 'flapped_seconds' else
+        pyarrow.bool_() if field == 'inactive' else pyarrow.string()) for field in Port._fields])
+    pyarrow.parquet.write_table(pyarrow.table(columns, schema=schema), path)
+
+# export records as Parquet if the path ends with .parquet, as CSV otherwise
+def export(records, path):
+    if path.endswith('.parquet'):
+        write_parquet(records, path)
+    else:
+        write_csv(records, path)
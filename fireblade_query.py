@@ -0,0 +1,198 @@
+# fireblade_query is an index over the 'display set' configurations of
+# fireblade_archive, so questions about the configuration of the whole fleet
+# are answered in milliseconds, without a session. It
+# 1. parses every archived configuration once, by the digest of its object,
+#    into its lines keyed by hierarchy, i.e. section 'interfaces' and name
+#    'ge-0/0/0', into VLAN members of interfaces and into trunk and LAG
+#    member interfaces, kept in the SQLite file of the archive;
+# 2. answers the questions on the current configuration of each host, so an
+#    unchanged host is never parsed again;
+# 3. matches lines against a pattern as Junos 'match' does, a regular
+#    expression, case insensitive; literal patterns and alternations of
+#    literals are looked up in a trigram index first, and only the lines it
+#    finds are tested;
+# 4. turns lines into the command sets fireblade.mss builds for 'replace
+#    pattern' and mode 'intdesc'.
+
+import os
+import re
+import sqlite3
+import threading
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS indexed (digest TEXT PRIMARY KEY)',
+    'CREATE TABLE IF NOT EXISTS lines ('
+        'id INTEGER PRIMARY KEY, digest TEXT, n INTEGER, section TEXT, name TEXT, line TEXT)',
+    'CREATE INDEX IF NOT EXISTS lines_by_path ON lines (digest, section, name)',
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lines_text USING fts5 (line, content='lines', content_rowid='id', tokenize='trigram')",
+    'CREATE TABLE IF NOT EXISTS members (digest TEXT, n INTEGER, interface TEXT, vlan TEXT)',
+    'CREATE INDEX IF NOT EXISTS members_by_vlan ON members (vlan, digest)',
+    'CREATE INDEX IF NOT EXISTS members_by_digest ON members (digest)',
+    'CREATE TABLE IF NOT EXISTS trunks (digest TEXT, n INTEGER, interface TEXT, kind TEXT)',
+    'CREATE INDEX IF NOT EXISTS trunks_by_digest ON trunks (digest, interface)',
+]
+
+# host count up to which 'match' scans the lines of the hosts instead of the trigram index
+FEW_HOSTS = 20
+
+# characters that make a pattern more than a literal
+REGEX = re.compile(r'[\\^$.*+?()\[\]{}]')
+
+# (section, name) of a 'set' line, i.e. ('interfaces', 'ge-0/0/0')
+def path(line):
+    words = line.split(None, 3)
+    return (words[1] if len(words) > 1 else '', words[2] if len(words) > 2 else '')
+
+# ('trunk' or 'lag', interface) of a line of a trunk or a LAG member, None otherwise
+def trunk(line, section, name):
+    if section != 'interfaces':
+        return None
+    if 'interface-mode trunk' in line or 'port-mode trunk' in line:
+        return 'trunk', name
+    if 'ether-options 802.3ad' in line:
+        return 'lag', name
+    return None
+
+# (interface, vlan) of a line of a VLAN member, None otherwise
+def member(line, section, name):
+    if section == 'interfaces' and 'vlan members' in line:
+        return name, line.split('members ', 1)[-1].strip()
+    return None
+
+# trigram query of a pattern made of literals, None if the index cannot narrow it down
+def fts_query(pattern):
+    alternatives = pattern.split('|')
+    if any(len(alt) < 3 or REGEX.search(alt) for alt in alternatives):
+        return None
+    return ' OR '.join('"' + alt.replace('"', '""') + '"' for alt in alternatives)
+
+# commands equivalent to 'replace pattern <old> with <new>' on matched lines
+def replace_commands(lines, old_pattern, new_pattern):
+    commands = []
+    for line in lines:
+        commands.append('delete' + line.strip()[3:] if line.startswith('set ') else line.strip())
+        commands.append(line.replace(old_pattern, new_pattern).strip())
+    return commands
+
+# commands setting the description of interfaces to their vlan
+def intdesc_commands(interfaces, vlan):
+    return [f'set interfaces {interface} description {vlan}' for interface in interfaces]
+
+class Index:
+
+    def __init__(self, archive):
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(archive.path, 'index.sqlite'), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._fresh = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # parse the current configurations not indexed yet; returns how many
+    def refresh(self):
+        with self._refresh_lock:
+            with self._lock:
+                digests = [row[0] for row in self._db.execute(
+                    'SELECT DISTINCT digest FROM heads WHERE digest NOT IN (SELECT digest FROM indexed)')]
+            for digest in digests:
+                self._add(digest, self.archive.text(name=digest).splitlines())
+            self._fresh = True
+        return len(digests)
+
+    def _add(self, digest, lines):
+        rows, members, trunks = [], [], []
+        for n, line in enumerate(lines):
+            section, name = path(line)
+            rows.append((digest, n, section, name, line))
+            found = member(line, section, name)
+            if found:
+                members.append((digest, n) + found)
+            found = trunk(line, section, name)
+            if found:
+                trunks.append((digest, n, found[1], found[0]))
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                # indexed by another process meanwhile
+                if self._db.execute('SELECT 1 FROM indexed WHERE digest = ?', (digest,)).fetchone():
+                    self._db.execute('ROLLBACK')
+                    return
+                first = self._db.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM lines').fetchone()[0]
+                self._db.executemany('INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?)',
+                    ((first + i,) + row for i, row in enumerate(rows)))
+                self._db.executemany('INSERT INTO lines_text (rowid, line) VALUES (?, ?)',
+                    ((first + i, row[4]) for i, row in enumerate(rows)))
+                self._db.executemany('INSERT INTO members VALUES (?, ?, ?, ?)', members)
+                self._db.executemany('INSERT INTO trunks VALUES (?, ?, ?, ?)', trunks)
+                self._db.execute('INSERT INTO indexed VALUES (?)', (digest,))
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _query(self, query, params):
+        if not self._fresh:
+            self.refresh()
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+
+    # SQL filter and parameters of the current configurations of 'hosts', all by default
+    def _heads(self, hosts):
+        if not hosts:
+            return '', []
+        return f' AND h.host IN ({", ".join("?" * len(hosts))})', list(hosts)
+
+    # [(host, line)] of lines matching a pattern, in configuration order, of
+    # one section, i.e. 'interfaces', or of all
+    def match(self, pattern, hosts=None, section=None):
+        regex = re.compile(pattern, re.I)
+        where, params = self._heads(hosts)
+        if section:
+            where += ' AND l.section = ?'
+            params.append(section)
+        # the lines of a few hosts are fewer than the index finds fleet-wide
+        fts = fts_query(pattern) if not hosts or len(hosts) > FEW_HOSTS else None
+        if fts:
+            where += ' AND l.id IN (SELECT rowid FROM lines_text WHERE lines_text MATCH ?)'
+            params.append(fts)
+        rows = self._query('SELECT h.host, l.line FROM heads h JOIN lines l ON l.digest = h.digest '
+            f'WHERE 1 {where} ORDER BY h.host, l.n', params)
+        return [(host, line) for host, line in rows if regex.search(line)]
+
+    # [(host, interface)] of trunks and LAG members, in configuration order
+    def trunks(self, hosts=None):
+        where, params = self._heads(hosts)
+        return self._query('SELECT h.host, t.interface FROM heads h JOIN trunks t ON t.digest = h.digest '
+            f'WHERE 1 {where} GROUP BY h.host, t.interface ORDER BY h.host, MIN(t.n)', params)
+
+    # [(host, interface, vlan)] of access interfaces that are members of one
+    # of 'vlans', of any VLAN by default, trunks left out
+    def vlan_members(self, vlans=None, hosts=None):
+        where, params = self._heads(hosts)
+        if vlans:
+            where += f' AND m.vlan IN ({", ".join("?" * len(vlans))})'
+            params += list(vlans)
+        return self._query('SELECT h.host, m.interface, m.vlan FROM heads h JOIN members m ON m.digest = h.digest '
+            f"WHERE m.vlan != 'trunk' {where} AND NOT EXISTS (SELECT 1 FROM trunks t "
+            "WHERE t.digest = m.digest AND t.interface = m.interface AND t.kind = 'trunk') "
+            'ORDER BY h.host, m.n', params)
+
+    # lines of a host under a hierarchy, i.e. ('interfaces', 'ge-0/0/0')
+    def lines(self, host, section, name=None):
+        where, params = self._heads([host])
+        where += ' AND l.section = ?' + (' AND l.name = ?' if name else '')
+        params += [section] + ([name] if name else [])
+        return [row[0] for row in self._query('SELECT l.line FROM heads h JOIN lines l ON l.digest = h.digest '
+            f'WHERE 1 {where} ORDER BY l.n', params)]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,175 @@
+# fireblade_result is the outcome of a host's session in fireblade tools, so
+# that tools running hosts in parallel report them alike. It
+# 1. carries the host, a status, the output block of the host and a short
+#    detail as a Result;
+# 2. tells session errors apart by PyEZ exception class, the most specific
+#    class first, as ConnectAuthError, ConnectTimeoutError and
+#    ConnectRefusedError are all ConnectErrors;
+# 3. classes every status as ok, skipped, transient or permanent. Transient
+#    errors keep a session from opening and may pass on their own, and
+#    fireblade_engine retries the sessions that raised them within --retries;
+#    permanent ones, including errors of a session under way such as a
+#    locked configuration, come back on the next run unless the host or the
+#    change is fixed. A status no list knows is permanent, so a host never
+#    passes as ok by a status a tool made up;
+# 4. counts results per status as hosts finish, and prints the per-host table
+#    and the session and change counters of a run;
+# 5. prints a table of the outcomes of a run by status, and writes the hosts
+#    that failed to a file that -l takes, so a follow-up run takes them only.
+
+import sys
+import collections
+from jnpr.junos.exception import ConnectError, ConnectAuthError, ConnectTimeoutError, ConnectRefusedError, RpcError, LockError, UnlockError
+
+# status of a host, its output block and a one-line detail for the table
+Result = collections.namedtuple('Result', 'host status output detail', defaults=('', ''))
+
+# (exception class, status, message) of session errors, most specific first
+ERRORS = [
+    (ConnectAuthError, 'auth error', 'Cannot authenticate to device: {}'),
+    (ConnectTimeoutError, 'timeout', 'Connection to device timed out: {}'),
+    (ConnectRefusedError, 'refused', 'Connection to device was refused: {}, please check NETCONF configuration'),
+    (ConnectError, 'connect error', 'Cannot connect to device: {}'),
+    (LockError, 'lock error', 'Unable to lock the configuration: {}'),
+    (UnlockError, 'unlock error', 'Unable to unlock the configuration: {}'),
+    (RpcError, 'rpc error', 'RPC error: {}'),
+]
+
+SESSION_ERRORS = ['auth error', 'timeout', 'refused', 'connect error', 'rpc error', 'error']
+
+# statuses of hosts that did what was asked, and of hosts left alone
+OK = ['committed', 'rolled back', 'confirm pending', 'commit scheduled', 'no diff', 'shown', 'probed', 'installed',
+    'written', 'new', 'changed', 'unchanged', 'deployed', 'inventoried']
+SKIPPED = ['skipped', 'mismatched']
+
+# statuses of hosts a follow-up run has to take again, by class
+TRANSIENT = ['timeout', 'connect error', 'auth error']
+PERMANENT = ['refused', 'rpc error', 'error', 'load failed', 'check failed', 'lock error', 'unlock error', 'failed',
+    'aborted', 'commit failed']
+
+# file the failed hosts of a run are written to by default
+FAILED_HOSTS = 'failed.hosts'
+
+# hosts named per status in the outcome table
+EXAMPLES = 3
+
+# command line arguments of run results, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--failed_hosts', default=FAILED_HOSTS, metavar='FILE',
+        help='File the hosts that failed are written to, one per line, to run again with -l. ' +
+        f'Default to "{FAILED_HOSTS}", "" for none.')
+
+# tally of a run built from parsed command line arguments
+def from_args(args):
+    return Tally(failed_hosts=args.failed_hosts)
+
+# 'ok', 'skipped', 'transient' or 'permanent', the latter for statuses of no list
+def classify(status):
+    if status in OK:
+        return 'ok'
+    if status in SKIPPED:
+        return 'skipped'
+    return 'transient' if status in TRANSIENT else 'permanent'
+
+# whether a host of 'status' failed, for a follow-up run to take again
+def failure(status):
+    return classify(status) in ('transient', 'permanent')
+
+# result of a session that raised 'err', with 'output' of the host so far
+def error(host, err, output=''):
+    for cls, status, message in ERRORS:
+        if isinstance(err, cls):
+            break
+    else:
+        status, message = 'error', 'An error occurred: {}'
+    message = message.format(err)
+    return Result(host, status, f'{output}{message}\n', message)
+
+# results of a run, counted per status as hosts finish
+class Tally:
+
+    def __init__(self, failed_hosts=None):
+        self.results = []
+        self.counts = collections.Counter()
+        # status -> hosts that took more than one attempt
+        self.retried = collections.Counter()
+        self.failed_hosts = failed_hosts
+
+    # the result of a host after 'attempts' sessions
+    def add(self, result, attempts=1):
+        self.results.append(result)
+        self.counts[result.status] += 1
+        if attempts > 1:
+            self.retried[result.status] += 1
+
+    # hosts that failed, in the order they finished
+    def failed(self):
+        return [result.host for result in self.results if failure(result.status)]
+
+    # one line per host, in the order hosts finished
+    def table(self):
+        lines = ['Hostname,Status,Detail']
+        lines += [f'{result.host},{result.status},{result.detail.replace(",", ";")}' for result in self.results]
+        return '\n'.join(lines) + '\n'
+
+    # session counters, and change counters if 'change'
+    def summary(self, change=False):
+        n_session = len(self.results) - self.counts['skipped']
+        n_error = sum(self.counts[status] for status in SESSION_ERRORS)
+        rows = [
+            ('Session Counter Summary', None),
+            ('Total Number of Sessions:', n_session),
+            ('Connected Sessions:', n_session - n_error),
+            ('Connection Error Sessions:', self.counts['connect error']),
+            ('Authentication Error Sessions:', self.counts['auth error']),
+            ('Timeout Sessions:', self.counts['timeout']),
+            ('Connection Refused Sessions:', self.counts['refused']),
+            ('RPC Error Sessions:', self.counts['rpc error']),
+            ('Other Error Sessions:', self.counts['error']),
+            ('Skipped Hosts:', self.counts['skipped']),
+        ]
+        if change:
+            rows += [
+                ('', None),
+                ('Configuration Change Summary', None),
+                ('Total Number of Change Sessions:', n_session - n_error),
+                ('Committed Sessions:', self.counts['committed']),
+                ('Rolled Back Sessions:', self.counts['rolled back']),
+                ('Commit Error Sessions:', self.counts['check failed'] + self.counts['commit failed']),
+                ('Load Error Sessions:', self.counts['load failed']),
+                ('Lock Error Sessions:', self.counts['lock error'] + self.counts['unlock error']),
+                ('No Difference in Change:', self.counts['no diff']),
+            ]
+        return ''.join(f'{label}\n' if value is None else f'{label:<40}{value}\n' for label, value in rows)
+
+    # hosts per status, ok and skipped first, then transient and permanent failures,
+    # with how many of them were retried and the first few of the failed
+    def outcomes(self):
+        order = {'ok': 0, 'skipped': 1, 'transient': 2, 'permanent': 3}
+        statuses = sorted(self.counts, key=lambda status: (order[classify(status)], -self.counts[status], status))
+        lines = ['Outcome Summary', f'{"Status":<16}{"Class":<12}{"Hosts":>8}{"Retried":>9}  Hosts']
+        for status in statuses:
+            examples = ''
+            if failure(status):
+                hosts = [result.host for result in self.results if result.status == status]
+                examples = ' '.join(hosts[:EXAMPLES]) + (f' (+{len(hosts) - EXAMPLES})' if len(hosts) > EXAMPLES else '')
+            lines.append(f'{status:<16}{classify(status):<12}{self.counts[status]:>8}{self.retried[status]:>9}  {examples}'.rstrip())
+        return '\n'.join(lines) + '\n'
+
+    # write the failed hosts to 'failed_hosts', an empty file if none failed;
+    # returns how many
+    def write_failed(self):
+        hosts = self.failed()
+        if self.failed_hosts:
+            with open(self.failed_hosts, 'w') as fo:
+                fo.writelines(f'{host}\n' for host in hosts)
+        return len(hosts)
+
+    # the outcome table and where the failed hosts went, on 'out'
+    def report(self, out=sys.stdout):
+        n_failed = self.write_failed()
+        print (self.outcomes(), file=out)
+        if n_failed and self.failed_hosts:
+            print (f'{n_failed} failed host(s) written to {self.failed_hosts}, run them again with -l {self.failed_hosts}', file=out)
+        elif n_failed:
+            print (f'{n_failed} failed host(s)', file=out)
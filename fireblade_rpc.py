@@ -0,0 +1,149 @@
+# fireblade_rpc maps common show commands to their Junos XML RPCs and returns
+# parsed records instead of screen text, so no shell is started on the host
+# and no output trimming is needed. Supported commands and their records:
+#
+# show ethernet-switching table [vlan-name V] [interface I]  vlan,mac,flags,age,interface
+# show arp [no-resolve] [interface I]                         mac,ip,hostname,interface
+# show interfaces [I] [terse]                                 interface,admin,oper,description,flapped,speed
+# show configuration [hierarchy ...]                          line (in 'display set' format)
+#
+# Pipes '| match R', '| except R' and '| trim N' are applied to the records
+# locally; '| display set' and '| no-more' are accepted and ignored.
+
+import io
+import re
+import csv
+import json
+
+# command -> (rpc, record xpath, {field: child element}, {option: (rpc argument, takes value)})
+TABLES = {
+    'show ethernet-switching table': (
+        'get_ethernet_switching_table_information', './/l2ng-mac-entry',
+        {'vlan': 'l2ng-l2-mac-vlan-name', 'mac': 'l2ng-l2-mac-address', 'flags': 'l2ng-l2-mac-flags',
+         'age': 'l2ng-l2-mac-age', 'interface': 'l2ng-l2-mac-logical-interface'},
+        {'vlan-name': ('vlan_name', True), 'interface': ('interface_name', True)}),
+    'show arp': (
+        'get_arp_table_information', './/arp-table-entry',
+        {'mac': 'mac-address', 'ip': 'ip-address', 'hostname': 'hostname', 'interface': 'interface-name'},
+        {'no-resolve': ('no_resolve', False), 'interface': ('interface', True)}),
+    'show interfaces': (
+        'get_interface_information', './/physical-interface',
+        {'interface': 'name', 'admin': 'admin-status', 'oper': 'oper-status', 'description': 'description',
+         'flapped': 'interface-flapped', 'speed': 'speed'},
+        {'terse': ('terse', False)}),
+}
+CONFIG = 'show configuration'
+CONFIG_FIELDS = ['line']
+IGNORED_PIPES = ['display set', 'no-more']
+
+# split a command on pipes that are not inside quotes
+def split_pipes(command):
+    parts, current, quote = [], '', None
+    for char in command:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '"\'':
+            quote = char
+        elif char == '|':
+            parts.append(current.strip())
+            current = ''
+            continue
+        current += char
+    parts.append(current.strip())
+    return parts[0], parts[1:]
+
+# parse a command into (table, rpc arguments, trailing words, pipes), ValueError if unsupported
+def parse(command):
+    base, pipes = split_pipes(command)
+    for pipe in pipes:
+        if not (pipe.split()[0] in ['match', 'except', 'trim'] or pipe in IGNORED_PIPES):
+            raise ValueError(f'unsupported pipe "{pipe}" in command: {command}')
+    base = ' '.join(base.split())
+    names = [CONFIG] + list(TABLES)
+    name = next((n for n in names if base == n or base.startswith(n + ' ')), None)
+    if name is None:
+        raise ValueError(f'no structured form for command: {command}')
+    words = base.split()[len(name.split()):]
+    if name == CONFIG:
+        return name, {}, words, pipes
+
+    options = TABLES[name][3]
+    kwargs = {}
+    while words:
+        word = words.pop(0)
+        if word in options:
+            argument, takes_value = options[word]
+            kwargs[argument] = words.pop(0) if takes_value and words else True
+        elif name == 'show interfaces' and 'interface_name' not in kwargs:
+            kwargs['interface_name'] = word
+        else:
+            raise ValueError(f'unsupported option "{word}" in command: {command}')
+    return name, kwargs, [], pipes
+
+# the table a command maps to, or None if it has no structured form
+def lookup(command):
+    try:
+        return parse(command)[0]
+    except ValueError:
+        return None
+
+# record fields of a command
+def fields(command):
+    name = lookup(command)
+    return CONFIG_FIELDS if name == CONFIG else list(TABLES[name][2])
+
+def _unquote(text):
+    return text.strip().strip('"\'')
+
+# apply match/except/trim pipes on records
+def _pipe(records, pipes):
+    for pipe in pipes:
+        verb, _, arg = pipe.partition(' ')
+        if verb == 'match':
+            pattern = re.compile(_unquote(arg))
+            records = [r for r in records if pattern.search(' '.join(r.values()))]
+        elif verb == 'except':
+            pattern = re.compile(_unquote(arg))
+            records = [r for r in records if not pattern.search(' '.join(r.values()))]
+        elif verb == 'trim' and 'line' in (records[0] if records else {}):
+            width = int(arg)
+            records = [{'line': r['line'][width:]} for r in records]
+    return records
+
+# run a command through its RPC and return (fields, records)
+def query(dev, command):
+    name, kwargs, words, pipes = parse(command)
+
+    if name == CONFIG:
+        kwargs = {'options': {'format': 'set'}}
+        if words:
+            kwargs['filter_xml'] = f'<{words[0]}/>'
+        reply = dev.rpc.get_config(**kwargs)
+        prefix = ' '.join(['set'] + words)
+        text = reply.text if reply.tag == 'configuration-set' else reply.findtext('.//configuration-set', '')
+        records = [{'line': line.strip()} for line in (text or '').splitlines()
+            if line.strip() == prefix or line.strip().startswith(prefix + ' ')]
+        return CONFIG_FIELDS, _pipe(records, pipes)
+
+    rpc, xpath, columns, options = TABLES[name]
+    reply = getattr(dev.rpc, rpc)(**kwargs)
+    records = [{field: (item.findtext(child) or '').strip() for field, child in columns.items()}
+        for item in reply.iterfind(xpath)]
+    return list(columns), _pipe(records, pipes)
+
+# csv header of a command's records
+def csv_header(command):
+    return ','.join(['host'] + fields(command))
+
+# records of all commands on a host, as json lines or csv rows
+def render(dev, host, commands, output_format):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for command in commands:
+        columns, records = query(dev, command)
+        for record in records:
+            if output_format == 'json':
+                out.write(json.dumps({'host': host, 'command': command, **record}) + '\n')
+            else:
+                writer.writerow([host] + [record[c] for c in columns])
+    return out.getvalue()
@@ -0,0 +1,1016 @@
+# fireblade_sim simulates a fleet of Junos switches on this machine, so that
+# fireblade tools can be tested and benchmarked without real switches. It
+# 1. listens on one local port per simulated host and serves there what tools
+#    open on a switch: NETCONF over SSH (subsystem 'netconf', base:1.0
+#    framing), the CLI and csh of StartShell, and scp uploads;
+# 2. makes up each switch from its hostname, a virtual chassis of one to four
+#    EX4300-48P/48MP members or an EX2300-C-12P, with access ports in VLANs,
+#    trunks, an uplink LAG, MAC and ARP entries and down ports, the same for a
+#    hostname and seed on every run;
+# 3. answers the RPCs of PyEZ fact gathering, 'show' and 'op portusage'
+#    commands as XML or text, get-configuration, file checksums and package
+#    installation, and keeps a shared candidate configuration per switch for
+#    lock, load, diff, commit check, commit and rollback;
+# 4. delays the handshake, every RPC or command and every commit by
+#    configurable seconds times a log-normal jitter, and injects failures by
+#    host at configurable rates: refused connections, rejected passwords,
+#    stalled handshakes, dropped sessions, RPC errors, rejected loads, failed
+#    commit checks and slow hosts, and rejects passwords fleet-wide while
+#    more sessions authenticate at once than its authentication server takes;
+# 5. records every connection of a host with its start, its last reply
+#    other than to close-session, and its end, in memory and as json lines,
+#    so a benchmark can tell the latency of each host as the tool saw it.
+# redirect() makes the hostnames of a fleet resolve to their ports within a
+# tool process, so tools run unchanged, with their own hostnames.
+#
+# The fleet keeps its state, configurations and uploaded files, for as long
+# as it runs, as a real one does. Files are kept as md5 and size only,
+# configurations in 'display set' form only, and a 'commit confirmed' is never
+# rolled back for want of a confirmation.
+
+import re
+import json
+import time
+import logging
+import queue
+import shlex
+import random
+import socket
+import hashlib
+import resource
+import selectors
+import threading
+import collections
+from xml.sax.saxutils import escape
+import paramiko
+from lxml import etree
+import fireblade_rpc
+
+FAULTS = ['refused', 'auth', 'stall', 'drop', 'rpc', 'load', 'commit', 'slow']
+
+# how much slower a 'slow' host answers
+SLOW = 10
+
+EOM = ']]>]]>'
+HELLO = ('<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+    '<capability>urn:ietf:params:netconf:base:1.0</capability>'
+    '<capability>urn:ietf:params:netconf:capability:candidate:1.0</capability>'
+    '<capability>urn:ietf:params:netconf:capability:confirmed-commit:1.0</capability>'
+    '<capability>urn:ietf:params:netconf:capability:validate:1.0</capability>'
+    '<capability>http://xml.juniper.net/netconf/junos/1.0</capability>'
+    '<capability>http://xml.juniper.net/dmi/system/1.0</capability>'
+    '</capabilities><session-id>{}</session-id></hello>' + EOM)
+REPLY = ('<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" '
+    'xmlns:junos="http://xml.juniper.net/junos/21.4R0/junos" message-id="{}">{}</rpc-reply>' + EOM)
+OK = '<ok/>'
+
+# member model -> (product model, ports per member, kind of ports 0-23, of ports 24-47)
+MODELS = {
+    'EX4300-48P': ('ex4300-48p', 48, 'ge', 'ge'),
+    'EX4300-48MP': ('ex4300-48mp', 48, 'mge', 'ge'),
+    'EX2300-C-12P': ('ex2300-c-12p', 12, 'ge', 'ge'),
+}
+VERSION = '21.4R3-S5.4'
+
+# access VLANs with their ids and weights, and the management VLAN
+VLANS = [('DATA', 100, 60), ('VOICE', 110, 15), ('PRINTER', 120, 5), ('BMS', 130, 10), ('NAC-UNPRIV', 140, 10)]
+AP_VLAN = ('WIRELESS-AP', 150)
+MGMT_VLAN = ('MANAGEMENT', 10)
+
+# directories scp may upload into by name
+DIRS = ['/var/tmp', '/var/db/scripts/op']
+
+# statements that hold one value, replaced rather than added to by 'set'
+SINGLE = ['description', 'interface-mode', 'vlan-id', 'host-name', 'domain-name', 'mtu', 'speed']
+
+# command line arguments of the simulator, shared by benchmarks
+def add_arguments(parser):
+    parser.add_argument('--handshake', type=float, default=0.2,
+        help='Seconds a simulated host takes before its SSH handshake. Default to 0.2.')
+    parser.add_argument('--rpc', type=float, default=0.05,
+        help='Seconds a simulated host takes per RPC or command. Default to 0.05.')
+    parser.add_argument('--commit', type=float, default=1.0,
+        help='Seconds a simulated host takes per commit check, commit or package installation. Default to 1.0.')
+    parser.add_argument('--jitter', type=float, default=0.3, metavar='SIGMA',
+        help='Sigma of the log-normal factor on every delay. Default to 0.3, 0 for none.')
+    parser.add_argument('--faults', type=parse_faults, default={}, metavar='KIND=RATE,...',
+        help='Share of hosts failing per kind, i.e. "auth=0.01,drop=0.02". Kinds are: ' + ', '.join(FAULTS) + '.')
+    parser.add_argument('--auth_capacity', type=int, metavar='SESSIONS',
+        help='Sessions the authentication server of a fleet process takes at once; passwords of more are ' +
+        'rejected, as an overrun TACACS server does. Unlimited by default.')
+    parser.add_argument('--seed', type=int, default=0,
+        help='Seed of the switches and of the hosts picked to fail. Default to 0.')
+
+# keyword arguments of Fleet from parsed command line arguments
+def from_args(args):
+    return {'handshake': args.handshake, 'rpc': args.rpc, 'commit': args.commit, 'jitter': args.jitter,
+        'faults': args.faults, 'auth_capacity': args.auth_capacity, 'seed': args.seed}
+
+# {kind: rate} of 'kind=rate,...', ValueError on unknown kinds
+def parse_faults(text):
+    faults = {}
+    for item in filter(None, text.split(',')):
+        kind, _, rate = item.partition('=')
+        if kind not in FAULTS:
+            raise ValueError(f'unknown fault "{kind}", expecting one of {", ".join(FAULTS)}')
+        faults[kind] = float(rate)
+    return faults
+
+# make the hostnames of a fleet, {host: port}, resolve to their local ports
+# in this process, whatever port a tool connects to: 830 for NETCONF, 22 for
+# StartShell and scp
+def redirect(ports):
+    resolve = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host in ports:
+            return resolve('127.0.0.1', ports[host], *args, **kwargs)
+        return resolve(host, port, *args, **kwargs)
+
+    socket.getaddrinfo = getaddrinfo
+    raise_fd_limit()
+
+# as many open files as the hard limit allows, one socket per session and listener
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def _local(elm):
+    return etree.QName(elm).localname
+
+# Junos uptime text, i.e. '23 weeks, 1 day, 4 hours, 2 minutes, 10 seconds'
+def uptime_text(seconds):
+    parts = []
+    for unit, size in [('week', 604800), ('day', 86400), ('hour', 3600), ('minute', 60), ('second', 1)]:
+        n, seconds = divmod(seconds, size)
+        if n or parts:
+            parts.append(f'{n} {unit}' + ('s' if n != 1 else ''))
+    return ', '.join(parts) or '0 seconds'
+
+# Junos 'interface-flapped' text of 'ago' seconds before 'now'
+def flapped_text(now, ago):
+    if ago is None:
+        return 'Never'
+    weeks, rest = divmod(ago, 604800)
+    days, rest = divmod(rest, 86400)
+    hours, rest = divmod(rest, 3600)
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S %Z', time.localtime(now - ago))
+    return f'{stamp} ({weeks}w{days}d {hours:02d}:{rest // 60:02d} ago)' if weeks or days else \
+        f'{stamp} ({hours:02d}:{rest // 60:02d}:{rest % 60:02d} ago)'
+
+# an RPC that fails, with Junos' rpc-error fields
+class Fault(Exception):
+
+    def __init__(self, message, severity='error', bad_element=None, tag='operation-failed'):
+        super().__init__(message)
+        self.message = message
+        self.severity = severity
+        self.bad_element = bad_element
+        self.tag = tag
+
+    def xml(self):
+        info = f'<error-info><bad-element>{escape(self.bad_element)}</bad-element></error-info>' if self.bad_element else ''
+        return (f'<rpc-error><error-type>protocol</error-type><error-tag>{self.tag}</error-tag>'
+            f'<error-severity>{self.severity}</error-severity><error-message>{escape(self.message)}</error-message>{info}</rpc-error>')
+
+# an interface of a simulated switch
+Interface = collections.namedtuple('Interface', 'name kind admin oper flapped description')
+
+# apply set/delete commands on configuration lines; returns the warnings,
+# raises Fault on a command that is not set, delete, activate or deactivate
+def apply(lines, commands):
+    warnings = []
+    for command in commands:
+        command = command.strip()
+        if not command or command.startswith('#'):
+            continue
+        verb, _, rest = command.partition(' ')
+        statement = f'set {rest}'
+        if verb == 'set':
+            words = rest.split()
+            if len(words) > 1 and words[-2] in SINGLE:
+                prefix = 'set ' + ' '.join(words[:-1]) + ' '
+                lines[:] = [line for line in lines if not line.startswith(prefix)]
+            if statement not in lines:
+                lines.append(statement)
+        elif verb == 'delete':
+            kept = [line for line in lines if line != statement and not line.startswith(statement + ' ')]
+            if len(kept) == len(lines):
+                warnings.append(f'statement not found: {rest}')
+            lines[:] = kept
+        elif verb not in ['activate', 'deactivate']:
+            raise Fault('syntax error', bad_element=verb)
+    return warnings
+
+# Junos style diff of two configurations, None if they are the same
+def diff(old, new):
+    removed = [line for line in old if line not in set(new)]
+    added = [line for line in new if line not in set(old)]
+    if not removed and not added:
+        return None
+    out, last = [], None
+    for sign, line in [('-', line) for line in removed] + [('+', line) for line in added]:
+        words = line.split()
+        path, statement = ' '.join(words[1:3]), ' '.join(words[3:]) or words[-1]
+        if path != last:
+            out.append(f'[edit {path}]')
+            last = path
+        out.append(f'{sign}   {statement};')
+    return '\n' + '\n'.join(out) + '\n'
+
+# apply Junos pipes, '| match R', '| except R', '| count', '| last N', '| trim N',
+# on text; '| no-more' and '| display set' change nothing here
+def pipe(text, pipes):
+    lines = text.splitlines()
+    for item in pipes:
+        verb, _, arg = item.partition(' ')
+        arg = arg.strip().strip('"\'')
+        if verb == 'match':
+            lines = [line for line in lines if re.search(arg, line, re.I)]
+        elif verb == 'except':
+            lines = [line for line in lines if not re.search(arg, line, re.I)]
+        elif verb == 'count':
+            lines = [f'Count: {len(lines)} lines']
+        elif verb == 'last' and arg.isdigit():
+            lines = lines[-int(arg):]
+        elif verb == 'trim' and arg.isdigit():
+            lines = [line[int(arg):] for line in lines]
+    return ''.join(line + '\n' for line in lines)
+
+class Switch:
+
+    def __init__(self, host, seed=0, faults=None):
+        self.host = host
+        self.name = host.split('.')[0]
+        self.domain = host.partition('.')[2] or 'local'
+        rnd = random.Random(f'{seed}:{host}')
+        self.faults = set(faults or [])
+        self.drop_after = rnd.randint(1, 8)
+        self.serial = f'PE{rnd.randrange(16 ** 10):010X}'
+
+        # chassis composition
+        r = rnd.random()
+        if r < 0.05:
+            self.members = ['EX2300-C-12P']
+        elif r < 0.15:
+            self.members = ['EX4300-48MP'] * rnd.randint(1, 4)
+        elif r < 0.25:
+            self.members = ['EX4300-48P', 'EX4300-48MP'] + [rnd.choice(['EX4300-48P', 'EX4300-48MP']) for _ in range(rnd.randint(0, 2))]
+        else:
+            self.members = ['EX4300-48P'] * rnd.randint(1, 4)
+        self.boot = rnd.randint(86400, 60 * 604800)
+        self.started = time.time()
+
+        # interfaces: access ports, AP trunks, and an uplink LAG on xe-<m>/2/0
+        self.interfaces = []
+        self.vlan_of = {}
+        self.ap_ports = []
+        for m, model in enumerate(self.members):
+            _, ports, low, high = MODELS[model]
+            for p in range(ports):
+                name = f'{low if p < 24 else high}-{m}/0/{p}'
+                oper = 'up' if rnd.random() < 0.55 else 'down'
+                inactive = oper == 'down' and rnd.random() < 0.6
+                flapped = None if inactive and rnd.random() < 0.2 else self.boot if inactive else rnd.randint(60, self.boot)
+                description = rnd.choice(['', '', f'{rnd.randint(1000, 9999)}-{rnd.randint(1, 40)}'])
+                self.interfaces.append(Interface(name, name.split('-')[0], 'up', oper, flapped, description))
+                if rnd.random() < 0.04:
+                    self.ap_ports.append(name)
+                else:
+                    self.vlan_of[name] = rnd.choices([v[0] for v in VLANS], [v[2] for v in VLANS])[0]
+        self.uplinks = [f'xe-{m}/2/0' for m in sorted({0, len(self.members) - 1})]
+        for name in self.uplinks:
+            self.interfaces.append(Interface(name, 'xe', 'up', 'up', rnd.randint(60, self.boot), 'uplink'))
+
+        # MAC and ARP entries of the ports that are up
+        self.macs = []
+        for interface in self.interfaces:
+            if interface.oper == 'up' and interface.name in self.vlan_of:
+                for _ in range(rnd.randint(1, 3)):
+                    mac = ':'.join(f'{rnd.randrange(256):02x}' for _ in range(6))
+                    self.macs.append((self.vlan_of[interface.name], mac, interface.name + '.0'))
+        self.mgmt_ip = f'10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randint(2, 250)}'
+        self.arps = [(mac, f'10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randint(2, 250)}', f'irb.{MGMT_VLAN[1]} [{ifl}]')
+            for _, mac, ifl in self.macs[:rnd.randint(0, 4)]]
+
+        # committed configuration, its rollbacks, the shared candidate and its lock
+        self.committed = self._config()
+        self.rollbacks = [list(self.committed)]
+        self.changed = int(self.started - rnd.randint(3600, 30 * 86400))
+        self.candidate = None
+        self.locked_by = None
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def _config(self):
+        lines = [f'set version {VERSION}', f'set system host-name {self.name}', f'set system domain-name {self.domain}']
+        for interface in self.interfaces:
+            if interface.kind == 'xe':
+                lines.append(f'set interfaces {interface.name} ether-options 802.3ad ae0')
+                continue
+            if interface.description:
+                lines.append(f'set interfaces {interface.name} description {interface.description}')
+            family = f'set interfaces {interface.name} unit 0 family ethernet-switching'
+            if interface.name in self.ap_ports:
+                lines.append(f'{family} interface-mode trunk')
+                lines += [f'{family} vlan members {AP_VLAN[0]}', f'{family} native-vlan-id {AP_VLAN[1]}']
+            else:
+                lines += [f'{family} interface-mode access', f'{family} vlan members {self.vlan_of[interface.name]}']
+        lines += ['set interfaces ae0 aggregated-ether-options lacp active',
+            'set interfaces ae0 unit 0 family ethernet-switching interface-mode trunk']
+        lines += [f'set interfaces ae0 unit 0 family ethernet-switching vlan members {name}' for name, _, _ in VLANS]
+        lines += [f'set interfaces ae0 unit 0 family ethernet-switching vlan members {AP_VLAN[0]}',
+            f'set interfaces irb unit {MGMT_VLAN[1]} family inet address {self.mgmt_ip}/24']
+        lines += [f'set vlans {name} vlan-id {vid}' for name, vid, _ in VLANS]
+        lines += [f'set vlans {AP_VLAN[0]} vlan-id {AP_VLAN[1]}', f'set vlans {MGMT_VLAN[0]} vlan-id {MGMT_VLAN[1]}',
+            f'set vlans {MGMT_VLAN[0]} l3-interface irb.{MGMT_VLAN[1]}', 'set protocols lldp interface all']
+        return lines
+
+    def uptime(self):
+        return int(self.boot + time.time() - self.started)
+
+    # candidate configuration, the committed one unless changed
+    def current(self):
+        return self.candidate if self.candidate is not None else list(self.committed)
+
+    def rollback(self, n):
+        if n >= len(self.rollbacks):
+            raise Fault(f'rollback {n} does not exist', bad_element=str(n))
+        return list(self.rollbacks[n])
+
+    def commit(self):
+        self.committed = self.current()
+        self.candidate = None
+        self.rollbacks.insert(0, list(self.committed))
+        del self.rollbacks[50:]
+        self.changed = int(time.time())
+
+    # --- XML of operational RPCs ---
+
+    def software_information(self, m=0):
+        return (f'<software-information><host-name>{self.name}</host-name>'
+            f'<product-model>{MODELS[self.members[m]][0]}</product-model><product-name>{MODELS[self.members[m]][0]}</product-name>'
+            f'<junos-version>{VERSION}</junos-version></software-information>')
+
+    def show_version(self):
+        return '<multi-routing-engine-results>' + ''.join(
+            f'<multi-routing-engine-item><re-name>fpc{m}</re-name>{self.software_information(m)}</multi-routing-engine-item>'
+            for m in range(len(self.members))) + '</multi-routing-engine-results>'
+
+    def route_engine_information(self):
+        uptime = self.uptime()
+        return '<route-engine-information>' + ''.join(
+            f'<route-engine><slot>{m}</slot><mastership-state>{"master" if m == 0 else "backup"}</mastership-state>'
+            f'<status>OK</status><model>{self.members[m]}</model>'
+            f'<up-time junos:seconds="{uptime}">{uptime_text(uptime)}</up-time>'
+            '<last-reboot-reason>Router rebooted after a normal shutdown.</last-reboot-reason></route-engine>'
+            for m in range(min(2, len(self.members)))) + '</route-engine-information>'
+
+    def virtual_chassis_information(self):
+        roles = ['Master*', 'Backup'] + ['Linecard'] * 2
+        return ('<virtual-chassis-information><virtual-chassis-id-information junos:style="normal">'
+            f'<virtual-chassis-id>{self.serial}</virtual-chassis-id><virtual-chassis-mode>Enabled</virtual-chassis-mode>'
+            '</virtual-chassis-id-information><member-list junos:style="normal">' + ''.join(
+            f'<member><member-status>Prsnt</member-status><member-id>{m}</member-id><fpc-slot>(FPC {m})</fpc-slot>'
+            f'<member-serial-number>{self.serial[:-1]}{m}</member-serial-number><member-model>{MODELS[model][0]}</member-model>'
+            f'<member-priority>{129 if m < 2 else 0}</member-priority><member-role>{roles[m]}</member-role></member>'
+            for m, model in enumerate(self.members)) + '</member-list></virtual-chassis-information>')
+
+    # internal routing instance names of the members, as /etc/hosts.junos holds them
+    def hosts_junos(self):
+        return '\n128.0.0.1\tmaster\n' + ''.join(f'128.0.0.{16 + m}\tfpc{m}\n' for m in range(len(self.members)))
+
+    # interfaces of __juniper_private1__, whose addresses tell PyEZ the current RE
+    def private_interfaces(self):
+        return ('<interface-information junos:style="terse"><physical-interface><name>em0</name>'
+            '<logical-interface><name>em0.0</name><address-family><address-family-name>inet</address-family-name>'
+            '<interface-address><ifa-local>128.0.0.1/2</ifa-local></interface-address>'
+            '<interface-address><ifa-local>128.0.0.16/2</ifa-local></interface-address>'
+            '</address-family></logical-interface></physical-interface></interface-information>')
+
+    def chassis_inventory(self):
+        return (f'<chassis-inventory><chassis junos:style="inventory"><name>Chassis</name><serial-number>{self.serial}</serial-number>'
+            '<description>Virtual Chassis</description>' + ''.join(
+            f'<chassis-module><name>FPC {m}</name><version>REV 10</version><serial-number>{self.serial[:-1]}{m}</serial-number>'
+            f'<model-number>{model}</model-number><description>{model}</description></chassis-module>'
+            for m, model in enumerate(self.members)) + '</chassis></chassis-inventory>')
+
+    def interface_information(self, name=None, terse=False):
+        now = time.time()
+        out = []
+        for interface in self._interfaces(name):
+            out.append(f'<physical-interface><name>{interface.name}</name><admin-status>{interface.admin}</admin-status>'
+                f'<oper-status>{interface.oper}</oper-status>')
+            if not terse:
+                ago = None if interface.flapped is None else interface.flapped + int(now - self.started)
+                seconds = f' junos:seconds="{ago}"' if ago is not None else ''
+                out.append(f'<description>{escape(interface.description)}</description><speed>1000mbps</speed>'
+                    f'<interface-flapped{seconds}>{flapped_text(now, ago)}</interface-flapped>')
+            out.append('</physical-interface>')
+        return '<interface-information junos:style="' + ('terse' if terse else 'normal') + '">' + ''.join(out) + '</interface-information>'
+
+    def _interfaces(self, name):
+        if not name:
+            return self.interfaces
+        pattern = re.compile(fnmatch_regex(name))
+        return [interface for interface in self.interfaces if pattern.fullmatch(interface.name)]
+
+    def mac_table(self, vlan=None, interface=None):
+        entries = [(v, mac, ifl) for v, mac, ifl in self.macs
+            if (not vlan or v == vlan) and (not interface or ifl.split('.')[0] == interface.split('.')[0])]
+        return ('<l2ng-l2ald-rtb-macdb><l2ng-l2ald-mac-entry-vlan junos:style="brief-rtb">'
+            f'<mac-count-global>{len(entries)}</mac-count-global><learnt-mac-count>{len(entries)}</learnt-mac-count>'
+            '<l2ng-l2-mac-routing-instance>default-switch</l2ng-l2-mac-routing-instance>' + ''.join(
+            f'<l2ng-mac-entry><l2ng-l2-mac-vlan-name>{v}</l2ng-l2-mac-vlan-name><l2ng-l2-mac-address>{mac}</l2ng-l2-mac-address>'
+            '<l2ng-l2-mac-flags>D</l2ng-l2-mac-flags><l2ng-l2-mac-age>-</l2ng-l2-mac-age>'
+            f'<l2ng-l2-mac-logical-interface>{ifl}</l2ng-l2-mac-logical-interface></l2ng-mac-entry>'
+            for v, mac, ifl in entries) + '</l2ng-l2ald-mac-entry-vlan></l2ng-l2ald-rtb-macdb>')
+
+    def arp_table(self):
+        return '<arp-table-information>' + ''.join(
+            f'<arp-table-entry><mac-address>{mac}</mac-address><ip-address>{ip}</ip-address><hostname>{ip}</hostname>'
+            f'<interface-name>{escape(ifname)}</interface-name></arp-table-entry>'
+            for mac, ip, ifname in self.arps) + '</arp-table-information>'
+
+    # down interfaces as portusage.slax reports them in 'format xml'
+    def port_usage(self):
+        now = time.time()
+        out = []
+        for interface in self.interfaces:
+            if interface.oper != 'down':
+                continue
+            ago = None if interface.flapped is None else interface.flapped + int(now - self.started)
+            out.append(f'<interface><name>{interface.name}</name><admin-status>{interface.admin}</admin-status>'
+                f'<oper-status>{interface.oper}</oper-status><last-flapped>{flapped_text(now, ago)}</last-flapped>'
+                f'<flapped-seconds>{"" if ago is None else ago}</flapped-seconds>'
+                f'<description>{escape(interface.description)}</description></interface>')
+        return '<port-usage>' + ''.join(out) + '</port-usage>'
+
+    # --- text of CLI commands ---
+
+    def text(self, command):
+        now = time.time()
+        if command.startswith('show version'):
+            return ''.join(f'fpc{m}:\n' + '-' * 74 + f'\nHostname: {self.name}\nModel: {MODELS[model][0]}\nJunos: {VERSION}\n\n'
+                for m, model in enumerate(self.members))
+        if command.startswith('show configuration'):
+            words = command.split()[2:]
+            prefix = ' '.join(['set'] + words)
+            return ''.join(line + '\n' for line in self.committed if line == prefix or line.startswith(prefix + ' '))
+        if command.startswith('show interfaces'):
+            words = [w for w in command.split()[2:] if w not in ['terse', 'descriptions', 'detail', 'extensive']]
+            out = 'Interface               Admin Link Proto    Local                 Remote\n'
+            for interface in self._interfaces(words[0] if words else None):
+                out += f'{interface.name:<24}{interface.admin:<6}{interface.oper:<5}\n'
+                if interface.name in self.vlan_of or interface.name in self.ap_ports:
+                    out += f'{interface.name + ".0":<24}{interface.admin:<6}{interface.oper:<5}eth-switch\n'
+            return out
+        if command.startswith('show ethernet-switching table'):
+            out = (f'\nMAC flags (S - static MAC, D - dynamic MAC, L - locally learned, P - Persistent static, C - Control MAC\n'
+                '           SE - statistics enabled, NM - non configured MAC, R - remote PE MAC, O - ovsdb MAC)\n\n\n'
+                f'Ethernet switching table : {len(self.macs)} entries, {len(self.macs)} learned\nRouting instance : default-switch\n'
+                '    Vlan                MAC                 MAC         Age    Logical                NH        RTR\n'
+                '    name                address             flags              interface              Index     ID\n')
+            return out + ''.join(f'    {vlan:<20}{mac}   D             -   {ifl:<23}0         0       \n' for vlan, mac, ifl in self.macs)
+        if command.startswith('show arp'):
+            return 'MAC Address       Address         Interface                Flags\n' + ''.join(
+                f'{mac} {ip:<15} {ifname:<24} none\n' for mac, ip, ifname in self.arps) + f'Total entries: {len(self.arps)}\n'
+        if command.startswith('show chassis hardware'):
+            return 'Hardware inventory:\nItem             Version  Part number  Serial number     Description\n' + \
+                f'Chassis                                {self.serial}      Virtual Chassis\n' + ''.join(
+                f'FPC {m:<13}REV 10   650-044936   {self.serial[:-1]}{m}      {model}\n' for m, model in enumerate(self.members))
+        if command.startswith('show system uptime'):
+            return 'fpc0:\n' + '-' * 74 + f'\nSystem booted: {time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(now - self.uptime()))}\n'
+        if command.startswith('op portusage'):
+            out = 'Type      \t Interface       \t Status    \t Last Flapped         \t Interface Description\n'
+            for interface in self.interfaces:
+                if interface.oper == 'down':
+                    ago = None if interface.flapped is None else interface.flapped + int(now - self.started)
+                    out += (f'{interface.kind:<10}\t {interface.name:<16}\t {interface.admin + "/" + interface.oper:<10}\t '
+                        f'{flapped_text(now, ago):<21}\t {interface.description}\n')
+            return out
+        raise Fault('syntax error, expecting <command>.', bad_element=command.split()[0] if command.split() else '')
+
+# regex of a Junos interface name pattern, i.e. 'ge-0/0/*'
+def fnmatch_regex(name):
+    return ''.join('.*' if char == '*' else re.escape(char) for char in name)
+
+# the SSH side of one simulated host
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, fleet, switch):
+        self.fleet = fleet
+        self.switch = switch
+        self.user = None
+        self.requests = queue.Queue()
+        self.authenticating = True
+
+    # no longer authenticating, once
+    def release(self):
+        with self.fleet._lock:
+            if self.authenticating:
+                self.authenticating = False
+                self.fleet._authenticating -= 1
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        overrun = self.fleet.authenticated()
+        self.release()
+        if 'auth' in self.switch.faults or password != self.fleet.password or overrun:
+            return paramiko.AUTH_FAILED
+        self.user = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.requests.put(('shell', channel, None))
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode() if isinstance(command, bytes) else command
+        if not command.startswith('scp -t') and not command.startswith('scp -'):
+            return False
+        self.requests.put(('scp', channel, command))
+        return True
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name != 'netconf':
+            return False
+        self.requests.put(('netconf', channel, None))
+        return True
+
+# close a channel whose client may have gone already
+def _close(channel):
+    try:
+        channel.close()
+    except (OSError, EOFError):
+        pass
+
+# a connection of a host as the fleet records it
+class Record(dict):
+
+    def touch(self):
+        self['last'] = time.time()
+
+class Fleet:
+
+    def __init__(self, hosts, password='sim', handshake=0.0, rpc=0.0, commit=0.0, jitter=0.0, faults=None, auth_capacity=None,
+            seed=0, log=None):
+        self.password = password
+        self.auth_capacity = auth_capacity
+        # sessions between their connect and their authentication
+        self._authenticating = 0
+        self.handshake = handshake
+        self.rpc = rpc
+        self.commit = commit
+        self.jitter = jitter
+        self.log = log
+        self.records = []
+        self.switches = {}
+        for host in hosts:
+            # the same hosts fail for a seed, however the fleet is split
+            rnd = random.Random(f'{seed}:{host}:faults')
+            picked = [kind for kind, rate in sorted((faults or {}).items()) if rnd.random() < rate]
+            self.switches[host] = Switch(host, seed, picked)
+        self.ports = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stopped = threading.Event()
+        self._selector = selectors.DefaultSelector()
+        self._sessions = 0
+        self._key = paramiko.ECDSAKey.generate()
+        self._log = open(log, 'a') if log else None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # listen for every host, a closed port for hosts that refuse; returns {host: port}
+    def start(self):
+        raise_fd_limit()
+        # clients hanging up are routine here, not worth paramiko's tracebacks
+        logging.getLogger('paramiko.transport').addHandler(logging.NullHandler())
+        for host, switch in self.switches.items():
+            listener = socket.socket()
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(('127.0.0.1', 0))
+            self.ports[host] = listener.getsockname()[1]
+            if 'refused' in switch.faults:
+                listener.close()
+                continue
+            listener.listen(128)
+            listener.setblocking(False)
+            self._selector.register(listener, selectors.EVENT_READ, switch)
+            self._listeners.append(listener)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return dict(self.ports)
+
+    def stop(self):
+        self._stopped.set()
+        for listener in self._listeners:
+            self._selector.unregister(listener)
+            listener.close()
+        self._listeners = []
+        if self._log:
+            with self._lock:
+                self._log.close()
+                self._log = None
+
+    # hosts of each injected fault
+    def faulted(self):
+        faulted = collections.defaultdict(list)
+        for host, switch in self.switches.items():
+            for kind in switch.faults:
+                faulted[kind].append(host)
+        return dict(faulted)
+
+    # a session authenticates; returns True if the authentication server is
+    # overrun, by sessions that connected and have not authenticated yet
+    def authenticated(self):
+        with self._lock:
+            return bool(self.auth_capacity) and self._authenticating > self.auth_capacity
+
+    # seconds of a delay of 'base' on a switch, with jitter
+    def delay(self, switch, base):
+        seconds = base * (SLOW if 'slow' in switch.faults else 1)
+        if self.jitter and seconds:
+            seconds *= random.lognormvariate(0, self.jitter)
+        if seconds:
+            time.sleep(seconds)
+
+    def record(self, record):
+        record['end'] = time.time()
+        with self._lock:
+            self.records.append(record)
+            if self._log:
+                self._log.write(json.dumps(record) + '\n')
+                self._log.flush()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                events = self._selector.select(timeout=0.5)
+            except (OSError, ValueError):
+                continue
+            for key, _ in events:
+                try:
+                    sock, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                sock.setblocking(True)
+                threading.Thread(target=self._connection, args=(sock, key.data), daemon=True).start()
+
+    # one SSH connection, serving its channels until the client closes it
+    def _connection(self, sock, switch):
+        record = Record(host=switch.host, kind='ssh', start=time.time(), last=time.time(), requests=0, error=None)
+        if 'stall' in switch.faults:
+            # accept and never speak, until the client gives up
+            try:
+                while not self._stopped.is_set() and sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+            sock.close()
+            record['error'] = 'stall'
+            self.record(record)
+            return
+
+        with self._lock:
+            self._authenticating += 1
+        self.delay(switch, self.handshake)
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self._key)
+        server = _Server(self, switch)
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError) as err:
+            server.release()
+            record['error'] = str(err)
+            self.record(record)
+            return
+        while transport.is_active() and not self._stopped.is_set():
+            try:
+                kind, channel, command = server.requests.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            record['kind'] = kind
+            target = {'netconf': self._netconf, 'shell': self._shell, 'scp': self._scp}[kind]
+            threading.Thread(target=target, args=(channel, switch, server, record, command, transport), daemon=True).start()
+        transport.close()
+        server.release()
+        if server.user is None:
+            record['error'] = 'auth'
+        self.record(record)
+
+    # NETCONF over a channel, base:1.0 framing
+    def _netconf(self, channel, switch, server, record, command, transport):
+        with self._lock:
+            self._sessions += 1
+            session_id = self._sessions
+        session = object()
+        channel.sendall(HELLO.format(session_id).encode())
+        buffer = b''
+        try:
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                while EOM.encode() in buffer:
+                    message, buffer = buffer.split(EOM.encode(), 1)
+                    root = etree.fromstring(message.strip())
+                    if _local(root) != 'rpc':
+                        continue
+                    operation = root[0] if len(root) else None
+                    name = _local(operation) if operation is not None else ''
+                    record['requests'] += 1
+                    if 'drop' in switch.faults and record['requests'] > switch.drop_after:
+                        record['error'] = 'drop'
+                        transport.close()
+                        return
+                    body = self._rpc(switch, session, server.user, name, operation)
+                    channel.sendall(REPLY.format(escape(root.get('message-id', ''), {'"': '&quot;'}), body).encode())
+                    # a session pooled until the end of a run is done with its host before it closes
+                    if name == 'close-session':
+                        return
+                    record.touch()
+        except (OSError, EOFError, etree.XMLSyntaxError) as err:
+            record['error'] = record['error'] or str(err)
+        finally:
+            # a session going away lets go of its lock and, as with 'configure exclusive', of its changes
+            with switch.lock:
+                if switch.locked_by is session:
+                    switch.locked_by = None
+                    switch.candidate = None
+            _close(channel)
+
+    # body of the rpc-reply of an RPC
+    def _rpc(self, switch, session, user, name, elm):
+        if name in ['close-session', 'lock-configuration', 'unlock-configuration', 'open-configuration', 'close-configuration']:
+            return self._session_rpc(switch, session, user, name)
+        self.delay(switch, self.commit if name in ['commit-configuration', 'request-package-add'] else self.rpc)
+        try:
+            if 'rpc' in switch.faults:
+                raise Fault('Remote procedure call failed', bad_element=name)
+            return self._operation(switch, session, user, name, elm)
+        except Fault as fault:
+            return fault.xml()
+
+    def _session_rpc(self, switch, session, user, name):
+        with switch.lock:
+            if name == 'lock-configuration':
+                if switch.locked_by not in [None, session]:
+                    return Fault(f'configuration database locked by:\n  {user} terminal pts/0 (pid 4242) on since '
+                        f'{time.strftime("%Y-%m-%d %H:%M:%S %Z")}\n    exclusive [edit]', tag='lock-denied').xml()
+                switch.locked_by = session
+            elif name == 'unlock-configuration' and switch.locked_by is session:
+                switch.locked_by = None
+        return OK
+
+    def _operation(self, switch, session, user, name, elm):
+        args = {_local(child): (child.text or '').strip() for child in elm}
+
+        if name == 'get-software-information':
+            return switch.software_information()
+        if name == 'get-route-engine-information':
+            return switch.route_engine_information()
+        if name == 'get-virtual-chassis-information':
+            return switch.virtual_chassis_information()
+        if name == 'get-chassis-inventory':
+            return switch.chassis_inventory()
+        if name == 'get-interface-information':
+            if args.get('routing-instance'):
+                return switch.private_interfaces()
+            return switch.interface_information(args.get('interface-name'), 'terse' in args)
+        if name == 'get-ethernet-switching-table-information':
+            return switch.mac_table(args.get('vlan-name'), args.get('interface-name') or args.get('interface'))
+        if name == 'get-arp-table-information':
+            return switch.arp_table()
+        if name == 'command':
+            return self._command(switch, elm.text or '', elm.get('format', 'xml'))
+        if name == 'get-configuration':
+            return self._get_configuration(switch, elm)
+        if name == 'load-configuration':
+            return self._load_configuration(switch, elm)
+        if name == 'commit-configuration':
+            return self._commit_configuration(switch, args)
+        if name == 'get-checksum-information':
+            path = args.get('path', '')
+            if path not in switch.files:
+                raise Fault(f'Could not resolve file: {path}', bad_element=path)
+            return (f'<checksum-information><file-checksum><computation-method>MD5</computation-method>'
+                f'<input-file>{escape(path)}</input-file><checksum>{switch.files[path][0]}</checksum></file-checksum></checksum-information>')
+        if name == 'file-show':
+            if args.get('filename') != '/etc/hosts.junos':
+                raise Fault(f'could not resolve file: {args.get("filename")}', bad_element=args.get('filename'))
+            return f'<file-content filename="/etc/hosts.junos">{escape(switch.hosts_junos())}</file-content>'
+        if name == 'file-list':
+            return f'<directory-list><directory><directory-name>/var/home/{escape(user or "")}/</directory-name></directory></directory-list>'
+        if name == 'request-system-storage-cleanup':
+            with switch.lock:
+                for path in [path for path in switch.files if path.startswith('/var/tmp/')]:
+                    del switch.files[path]
+            return '<system-storage-cleanup-information><success/></system-storage-cleanup-information>'
+        if name == 'request-package-add':
+            packages = [child.text.strip() for child in elm if _local(child) in ['package-name', 'set'] and child.text]
+            missing = [path for path in packages if path not in switch.files]
+            if missing:
+                return f'<output>ERROR: package: {escape(missing[0])} is not found or empty</output><package-result>1</package-result>'
+            return (f'<output>Installing package \'{escape(", ".join(packages))}\' ...\n'
+                'Reboot is required to complete the installation.</output><package-result>0</package-result>')
+        if name == 'request-package-rollback':
+            return '<output>Rollback to software package: previous version</output>'
+        if name == 'request-reboot':
+            when = args.get('at') or (f'in {args["in"]} minutes' if args.get('in') else 'now')
+            return f'<request-reboot-results><request-reboot-status>Shutdown {escape(when)}</request-reboot-status></request-reboot-results>'
+        raise Fault('syntax error', bad_element=name, tag='operation-not-supported')
+
+    # 'command' RPC: the XML of the command's RPC, or its text in <output>
+    def _command(self, switch, command, output_format):
+        base, pipes = fireblade_rpc.split_pipes(command.strip())
+        base = ' '.join(base.split())
+        if output_format == 'text':
+            return f'<output>{escape(pipe(switch.text(base), pipes))}</output>'
+        words = base.split()
+        if base.startswith('show version'):
+            return switch.show_version() if 'invoke-on' in words or 'all-members' in words else switch.software_information()
+        if base.startswith('show interfaces'):
+            names = [w for w in words[2:] if w not in ['terse', 'detail', 'extensive']]
+            return switch.interface_information(names[0] if names else None, 'terse' in words)
+        if base.startswith('show ethernet-switching table'):
+            return switch.mac_table()
+        if base.startswith('show arp'):
+            return switch.arp_table()
+        if base.startswith('show chassis hardware'):
+            return switch.chassis_inventory()
+        if base.startswith('show virtual-chassis'):
+            return switch.virtual_chassis_information()
+        if base.startswith('show chassis routing-engine'):
+            return switch.route_engine_information()
+        if base.startswith('op portusage'):
+            if '/var/db/scripts/op/portusage.slax' not in switch.files:
+                raise Fault('invalid command: op portusage, script not found', bad_element='portusage')
+            return switch.port_usage()
+        raise Fault('syntax error, expecting <command>.', bad_element=words[0] if words else '')
+
+    def _get_configuration(self, switch, elm):
+        with switch.lock:
+            if elm.get('compare') == 'rollback':
+                text = diff(switch.rollback(int(elm.get('rollback', '0'))), switch.current())
+                return f'<configuration-information><configuration-output>{escape(text or chr(10))}</configuration-output></configuration-information>'
+            lines = list(switch.committed) if elm.get('database') == 'committed' else switch.current()
+            changed = switch.changed
+
+        # the hierarchy of a filter, i.e. <configuration><interfaces><interface><name>ge-0/0/1</name>...
+        words = []
+        node = elm.find('{*}configuration')
+        if node is None:
+            node = elm.find('configuration')
+        while node is not None and len(node):
+            node = node[0]
+            name = node.findtext('name')
+            if name:
+                words.append(name.strip())
+                break
+            words.append(_local(node))
+        prefix = ' '.join(['set'] + words)
+        lines = [line for line in lines if line == prefix or line.startswith(prefix + ' ')]
+
+        if elm.get('format') in ['set', 'text']:
+            return f'<configuration-set>{escape("".join(line + chr(10) for line in lines))}</configuration-set>'
+        # xml: the attributes, and leaf statements of the filter
+        leaf = ''
+        for line in lines:
+            value = line[len(prefix):].strip()
+            if words and value and ' ' not in value:
+                leaf = ''.join(f'<{w}>' for w in words) + escape(value) + ''.join(f'</{w}>' for w in reversed(words))
+                break
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S %Z', time.localtime(changed))
+        return f'<configuration junos:changed-seconds="{changed}" junos:changed-localtime="{stamp}">{leaf}</configuration>'
+
+    def _load_configuration(self, switch, elm):
+        with switch.lock:
+            if elm.get('rollback') is not None:
+                switch.candidate = switch.rollback(int(elm.get('rollback')))
+                return '<load-configuration-results><ok/></load-configuration-results>'
+            text = elm.findtext('configuration-set') or elm.findtext('configuration-text') or ''
+            commands = text.splitlines()
+            if 'load' in switch.faults:
+                raise Fault('syntax error', bad_element=commands[0].split()[-1] if commands and commands[0].split() else '')
+            candidate = switch.current()
+            warnings = apply(candidate, commands)
+            switch.candidate = candidate
+        return ''.join(Fault(message, severity='warning').xml() for message in warnings) + \
+            '<load-configuration-results><ok/></load-configuration-results>'
+
+    def _commit_configuration(self, switch, args):
+        if 'commit' in switch.faults:
+            raise Fault('configuration check-out failed', bad_element='commit')
+        result = '<commit-results><routing-engine junos:style="normal"><name>fpc0</name>{}</routing-engine></commit-results>'
+        if 'check' in args:
+            return result.format('<commit-check-success/>')
+        if 'at-time' in args:
+            return result.format('<commit-check-success/>') + f'<output>commit at will be executed at {escape(args["at-time"])}</output>'
+        with switch.lock:
+            switch.commit()
+        return result.format('<commit-success/>')
+
+    # interactive CLI, and csh after 'start shell', as StartShell drives them
+    def _shell(self, channel, switch, server, record, command, transport):
+        prompt = f'{server.user}@{switch.name}> '
+        channel.sendall(f'\r\n--- JUNOS {VERSION} Kernel 64-bit\r\n{{master:0}}\r\n{prompt}'.encode())
+        shell, rc, buffer = False, 0, b''
+        try:
+            while True:
+                data = channel.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b'\n' in buffer:
+                    raw, buffer = buffer.split(b'\n', 1)
+                    line = raw.decode(errors='replace').strip('\r').strip()
+                    record['requests'] += 1
+                    if line in ['exit', 'logout', 'quit']:
+                        return
+                    if not shell and line.startswith('start shell'):
+                        shell = True
+                        channel.sendall(f'{line}\r\n% '.encode())
+                        continue
+                    if shell and line == 'echo $?':
+                        out = f'{rc}\n'
+                    elif shell and line.startswith('cli -c'):
+                        self.delay(switch, self.rpc)
+                        out, rc = self._cli(switch, shlex.split(line)[2] if len(shlex.split(line)) > 2 else '')
+                    elif shell:
+                        out, rc = (f'{line.split()[0]}: Command not found.\n', 1) if line else ('', 0)
+                    else:
+                        self.delay(switch, self.rpc)
+                        out, rc = self._cli(switch, line)
+                    channel.sendall((line + '\r\n' + out.replace('\n', '\r\n') + ('% ' if shell else prompt)).encode())
+                    record.touch()
+        except (OSError, EOFError, ValueError) as err:
+            record['error'] = record['error'] or str(err)
+        finally:
+            _close(channel)
+
+    # text of a CLI command line with its pipes, and its exit code
+    def _cli(self, switch, line):
+        base, pipes = fireblade_rpc.split_pipes(line)
+        base = ' '.join(base.split())
+        if 'rpc' in switch.faults:
+            return 'error: Remote procedure call failed\n', 1
+        if base.startswith('op portusage') and '/var/db/scripts/op/portusage.slax' not in switch.files:
+            return 'error: invalid command: op portusage\n', 1
+        try:
+            return pipe(switch.text(base), pipes), 0
+        except Fault as fault:
+            return f'{" " * 8}^\n{fault.message}\n', 1
+
+    # 'scp -t <path>', the sink side of scp: files are kept as md5 and size
+    def _scp(self, channel, switch, server, record, command, transport):
+        target = shlex.split(command)[-1].rstrip('/')
+        reader = channel.makefile('rb')
+        try:
+            channel.sendall(b'\0')
+            while True:
+                header = reader.readline()
+                if not header:
+                    break
+                if header[:1] != b'C':
+                    channel.sendall(b'\0')
+                    continue
+                _, size, name = header[1:].decode().rstrip('\n').split(' ', 2)
+                channel.sendall(b'\0')
+                md5, left = hashlib.md5(), int(size)
+                while left:
+                    chunk = reader.read(min(left, 1 << 16))
+                    if not chunk:
+                        raise EOFError('scp upload cut short')
+                    md5.update(chunk)
+                    left -= len(chunk)
+                reader.read(1)
+                path = f'{target}/{name}' if target in DIRS else target
+                with switch.lock:
+                    switch.files[path] = (md5.hexdigest(), int(size))
+                record['requests'] += 1
+                channel.sendall(b'\0')
+                record.touch()
+            channel.send_exit_status(0)
+        except (OSError, EOFError, ValueError) as err:
+            record['error'] = record['error'] or str(err)
+        finally:
+            _close(channel)
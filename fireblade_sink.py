@@ -0,0 +1,55 @@
+# fireblade_sink writes each host's output block to stdout or a file as soon
+# as the host completes, so a fleet-wide run never holds every host's output
+# in memory. In ordered mode blocks are released in host-list order; blocks
+# that finish early wait in a buffer, which fireblade_engine keeps within the
+# reorder window by never launching a host more than 'window' hosts ahead of
+# the oldest unfinished one.
+
+import sys
+
+class OutputSink:
+
+    def __init__(self, path=None, ordered=False, header=None, buffering=1 << 16):
+        self.ordered = ordered
+        self.out = open(path, 'w', buffering=buffering) if path else sys.stdout
+        if header:
+            self.out.write(header + '\n')
+        self.pending = {}
+        self.next_index = 0
+        self.peak = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # write the block of host number 'index' in the host list, None for no output
+    def write(self, index, block):
+        if not self.ordered:
+            self._emit(block)
+            return
+        self.pending[index] = block
+        self.peak = max(self.peak, len(self.pending))
+        while self.next_index in self.pending:
+            self._emit(self.pending.pop(self.next_index))
+            self.next_index += 1
+
+    # write a block that belongs to no host of the list, right away
+    def note(self, block):
+        self._emit(block)
+
+    def _emit(self, block):
+        if block:
+            self.out.write(block)
+            # let a downstream pipe see every finished host right away
+            self.out.flush()
+
+    # release whatever is still held back, i.e. after a host raised, and close the file
+    def close(self):
+        for index in sorted(self.pending):
+            self._emit(self.pending.pop(index))
+        if self.out is not sys.stdout:
+            self.out.close()
+        else:
+            self.out.flush()
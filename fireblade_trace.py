@@ -0,0 +1,183 @@
+# fireblade_trace times the phases of every NETCONF session of a fireblade tool
+# run, so a slow fleet run tells whether connect, authentication, fact
+# gathering, shell commands or commit checks are to blame. It
+# 1. wraps Device.open, ncclient's connect, paramiko's authentication,
+#    Device.facts_refresh, RPC and CLI calls, StartShell and Config methods,
+#    only when tracing is on, and puts them back afterwards;
+# 2. times each phase by host, exclusive of the phases it contains, i.e. the
+#    connect inside open, or the authentication inside connect. Calls made
+#    inside another phase that are not phases of their own, such as the RPCs
+#    of a commit, count towards the outer phase;
+# 3. writes one json line per host with its seconds per phase, and prints the
+#    p50, p95 and p99 of each phase across hosts at the end of a run.
+#
+# A trace reads as one record per line:
+# {"host": "bby-acf111-edge-1.managenet.sfu.ca", "session": 9.41, "phases": {"connect": 0.62, "auth": 1.83, ...}, "calls": {...}}
+
+import sys
+import json
+import math
+import time
+import importlib
+import threading
+import collections
+
+# (module, attribute, phase, recorded inside another phase) of the wrapped calls
+HOOKS = [
+    ('jnpr.junos.device', 'Device.open', 'open', True),
+    ('ncclient.manager', 'connect', 'connect', True),
+    ('paramiko', 'Transport.auth_password', 'auth', True),
+    ('paramiko', 'Transport.auth_publickey', 'auth', True),
+    ('jnpr.junos.device', 'Device.facts_refresh', 'facts', True),
+    ('jnpr.junos.device', 'Device.execute', 'rpc', False),
+    ('jnpr.junos.device', 'Device.cli', 'cli', False),
+    ('jnpr.junos.device', 'Device.close', 'close', False),
+    ('jnpr.junos.utils.start_shell', 'StartShell.open', 'shell_open', False),
+    ('jnpr.junos.utils.start_shell', 'StartShell.run', 'shell_run', False),
+    ('jnpr.junos.utils.config', 'Config.lock', 'lock', False),
+    ('jnpr.junos.utils.config', 'Config.load', 'load', False),
+    ('jnpr.junos.utils.config', 'Config.diff', 'diff', False),
+    ('jnpr.junos.utils.config', 'Config.commit_check', 'commit_check', False),
+    ('jnpr.junos.utils.config', 'Config.commit', 'commit', False),
+    ('jnpr.junos.utils.config', 'Config.rollback', 'rollback', False),
+    ('jnpr.junos.utils.config', 'Config.unlock', 'unlock', False),
+]
+
+PERCENTILES = [50, 95, 99]
+
+# command line arguments of the tracer, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--trace', metavar='FILE',
+        help='Time the phases of every session, write one json line per host to FILE and print ' +
+        'p50/p95/p99 per phase at the end. Off by default.')
+
+# tracer built from parsed command line arguments, installed; None if off
+def from_args(args):
+    if not args.trace:
+        return None
+    tracer = Tracer(args.trace)
+    tracer.install()
+    return tracer
+
+# value at percentile 'p' of sorted values, nearest rank
+def percentile(values, p):
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+# host of a wrapped call: a Device, a utility bound to one, or ncclient's 'host'
+def _host(obj, kwargs):
+    if 'host' in kwargs:
+        return kwargs['host']
+    for dev in [obj, getattr(obj, '_dev', None), getattr(obj, '_nc', None)]:
+        host = getattr(dev, 'hostname', None)
+        if isinstance(host, str):
+            return host
+    return None
+
+class Tracer:
+
+    def __init__(self, path=None):
+        self.path = path
+        # host -> seconds per phase, calls per phase, first and last time seen
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._saved = []
+
+    # wrap the calls of HOOKS that are importable here
+    def install(self):
+        for module_name, attribute, phase, nested in HOOKS:
+            try:
+                owner = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            *path, name = attribute.split('.')
+            for part in path:
+                owner = getattr(owner, part, None)
+            func = getattr(owner, name, None) if owner is not None else None
+            if func is None:
+                continue
+            self._saved.append((owner, name, func))
+            setattr(owner, name, self._wrap(func, phase, nested))
+
+    def uninstall(self):
+        while self._saved:
+            owner, name, func = self._saved.pop()
+            setattr(owner, name, func)
+
+    def _wrap(self, func, phase, nested):
+        tracer = self
+
+        def traced(*args, **kwargs):
+            stack = tracer._stack()
+            if stack and not nested:
+                return func(*args, **kwargs)
+            host = _host(args[0] if args else None, kwargs) or (stack[-1][1] if stack else None)
+            # [phase, host, seconds of the phases inside]
+            frame = [phase, host, 0.0]
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                stack.pop()
+                if stack:
+                    stack[-1][2] += end - start
+                tracer.record(host, phase, end - start - frame[2], start, end)
+
+        traced.__wrapped__ = func
+        return traced
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    # add 'seconds' of a phase to a host, seen from 'start' to 'end'
+    def record(self, host, phase, seconds, start, end):
+        if host is None:
+            return
+        with self._lock:
+            entry = self.hosts.setdefault(host, {'phases': collections.Counter(), 'calls': collections.Counter(),
+                'start': start, 'end': end})
+            entry['phases'][phase] += seconds
+            entry['calls'][phase] += 1
+            entry['start'] = min(entry['start'], start)
+            entry['end'] = max(entry['end'], end)
+
+    # one json line per host
+    def write(self, path):
+        with self._lock, open(path, 'w') as fo:
+            for host, entry in self.hosts.items():
+                fo.write(json.dumps({
+                    'host': host,
+                    'session': round(entry['end'] - entry['start'], 4),
+                    'phases': {phase: round(seconds, 4) for phase, seconds in entry['phases'].items()},
+                    'calls': dict(entry['calls']),
+                }) + '\n')
+
+    # p50/p95/p99 and max of each phase across hosts, and the fleet total
+    def summary(self):
+        with self._lock:
+            per_phase = collections.defaultdict(list)
+            for entry in self.hosts.values():
+                per_phase['session'].append(entry['end'] - entry['start'])
+                for phase, seconds in entry['phases'].items():
+                    per_phase[phase].append(seconds)
+        order = ['session'] + list(dict.fromkeys(phase for _, _, phase, _ in HOOKS))
+        lines = ['Phase,Hosts,' + ','.join(f'p{p}' for p in PERCENTILES) + ',Max,Total']
+        for phase in order:
+            values = sorted(per_phase.get(phase, []))
+            if values:
+                lines.append(f'{phase},{len(values)},' + ','.join(f'{percentile(values, p):.2f}s' for p in PERCENTILES) +
+                    f',{values[-1]:.2f}s,{sum(values):.2f}s')
+        return '\n'.join(lines) + '\n'
+
+    # put the calls back, write the trace and print the summary on stderr,
+    # clear of a tool's own output on stdout
+    def report(self):
+        self.uninstall()
+        if self.path:
+            self.write(self.path)
+        sys.stderr.write(f'\nSession phase timings of {len(self.hosts)} host(s)' +
+            (f', per host in {self.path}' if self.path else '') + ':\n' + self.summary())
@@ -0,0 +1,128 @@
+# fireblade_trend keeps the history of fireblade.ii inventories in one SQLite
+# file, so that inactivity across months is a query rather than a walk through
+# the daily log directories. It
+# 1. numbers each inventory run and appends one row per host, with its campus,
+#    role, boot time, number of interfaces and of inactive interfaces, and one
+#    row per down interface, with its kind, seconds since last flap and
+#    whether it was inactive;
+# 2. indexes interface rows by host and name, so a query reads only the runs
+#    of the hosts it asks about;
+# 3. tells the interfaces inactive in each of the last N runs of their host;
+# 4. sums inactive interfaces per run and campus, the trend of port capacity.
+# One Trend may be used from many threads, and many processes may share the file.
+
+import os
+import datetime
+import sqlite3
+import threading
+
+DEFAULT_PATH = os.path.expanduser('~/.netauto/trend.sqlite')
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs ('
+        'run INTEGER PRIMARY KEY AUTOINCREMENT, started TEXT, kinds TEXT)',
+    'CREATE TABLE IF NOT EXISTS hosts ('
+        'run INTEGER, host TEXT, campus TEXT, role TEXT, boot_seconds INTEGER, total INTEGER, inactive INTEGER, '
+        'PRIMARY KEY (run, host))',
+    'CREATE TABLE IF NOT EXISTS ports ('
+        'run INTEGER, host TEXT, name TEXT, kind TEXT, flapped_seconds INTEGER, inactive INTEGER, description TEXT, '
+        'PRIMARY KEY (run, host, name))',
+    'CREATE INDEX IF NOT EXISTS hosts_by_host ON hosts (host, run)',
+    'CREATE INDEX IF NOT EXISTS ports_by_host ON ports (host, name, run)',
+]
+
+# command line arguments of the trend store, shared by fireblade tools
+def add_arguments(parser):
+    parser.add_argument('--trend', metavar='FILE', default=DEFAULT_PATH,
+        help=f'Trend store of inventory runs. Default to {DEFAULT_PATH}')
+
+# trend store built from parsed command line arguments
+def from_args(args):
+    return Trend(args.trend)
+
+class Trend:
+
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        # number of the run being recorded, see start()
+        self.run = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # start recording a run that counts interfaces of 'kinds'; returns its number
+    def start(self, kinds):
+        now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self.run = self._db.execute('INSERT INTO runs (started, kinds) VALUES (?, ?)',
+                (now, ' '.join(kinds))).lastrowid
+        return self.run
+
+    # record a host of the current run, with its fireblade_portusage records,
+    # in one transaction
+    def add(self, host, campus, role, boot_seconds, total, inactive, ports):
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.execute('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (self.run, host, campus, role, boot_seconds, total, inactive))
+                self._db.executemany('INSERT OR REPLACE INTO ports VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    ((self.run, host, port.name, port.kind, port.flapped_seconds, int(port.inactive), port.description)
+                    for port in ports))
+                self._db.execute('COMMIT')
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+
+    # [(run, started, kinds, number of hosts)] of all runs, oldest first
+    def runs(self):
+        with self._lock:
+            return self._db.execute('SELECT run, started, kinds, (SELECT COUNT(*) FROM hosts WHERE hosts.run = runs.run) '
+                'FROM runs ORDER BY run').fetchall()
+
+    # [(host, interface, kind, seconds since last flap)] of the interfaces
+    # inactive in each of the last 'n' runs of their host. A host recorded in
+    # fewer runs has none
+    def inactive_runs(self, n, campus=None, role=None, kinds=None):
+        where, params = self._filter(campus, role)
+        kind_filter = f'AND p.kind IN ({", ".join("?" * len(kinds))})' if kinds else ''
+        query = ('WITH recent AS ('
+                'SELECT run, host, ROW_NUMBER() OVER (PARTITION BY host ORDER BY run DESC) AS nth '
+                f'FROM hosts {where}) '
+            'SELECT p.host, p.name, p.kind, MAX(p.flapped_seconds) '
+            'FROM recent r JOIN ports p ON p.run = r.run AND p.host = r.host '
+            f'WHERE r.nth <= ? AND p.inactive = 1 {kind_filter} '
+            'GROUP BY p.host, p.name HAVING COUNT(*) = ? ORDER BY p.host, p.name')
+        with self._lock:
+            return self._db.execute(query, params + [n] + list(kinds or []) + [n]).fetchall()
+
+    # [(run, started, campus, hosts, total, inactive)] per run and campus,
+    # oldest first, of runs started on or after 'since' ('yyyy-mm-dd')
+    def campus_trend(self, campus=None, role=None, since=None):
+        where, params = self._filter(campus, role, 'h.')
+        if since:
+            where += (' AND ' if where else 'WHERE ') + 'r.started >= ?'
+            params.append(since)
+        query = ('SELECT r.run, r.started, h.campus, COUNT(*), SUM(h.total), SUM(h.inactive) '
+            f'FROM runs r JOIN hosts h ON h.run = r.run {where} '
+            'GROUP BY r.run, h.campus ORDER BY r.run, h.campus')
+        with self._lock:
+            return self._db.execute(query, params).fetchall()
+
+    # WHERE clause and parameters of the campus and role filters
+    def _filter(self, campus, role, prefix=''):
+        terms = [(f'{prefix}{name} = ?', value) for name, value in [('campus', campus), ('role', role)] if value]
+        return ('WHERE ' + ' AND '.join(term for term, _ in terms) if terms else ''), [value for _, value in terms]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,79 @@
+# ninja.hostinfo.processor.py tests the IPs of an ARP file against the static
+# IP ranges of a range file and enriches every entry with its switch,
+# interface and VLAN from a MAC map, as ninja.hostinfo.processor.sh does. The
+# ranges are loaded once into sorted interval arrays (see ninja_staticip) and
+# all IPs of the ARP file are classified in one batch.
+#
+# Output (-t) follows ninja.hostinfo.processor.sh:
+#   mac,ip,hostname,static,switch,interface,original vlan,new vlan
+# where static is 'yes' (in any static range), 'no' (in a subnet but not in
+# any static range) or 'n/a' (not in any subnet). switch, interface, original
+# vlan and new vlan are 'n/a' if the MAC is not in the MAC map; otherwise new
+# vlan keeps the original vlan for a static IP and is 'NAC-UNPRIV' for others.
+#
+# Example: ninja.hostinfo.processor.py -r tc.static.ip.ranges.csv -i 142.58.6.150
+# Example: ninja.hostinfo.processor.py -r tc.static.ip.ranges.csv -t tc.arp.sample.csv -o results.csv -m tc.mac.map.sample.csv
+
+import os
+import sys
+import argparse
+import ninja_nac
+import ninja_staticip
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(
+        description = 'Tests IP addresses against all static IP ranges in the range file and enriches ARP data with MAC mapping information.')
+
+    parser.add_argument('-r', '--range_file', required=True,
+        help='Path to the static IP range file (CSV format: cidr,start_ip,end_ip).')
+    parser.add_argument('-t', '--arp_file',
+        help='Path to the ARP file (CSV format: mac,ip,hostname). Requires -o and -m.')
+    parser.add_argument('-o', '--output_file',
+        help='Path to the output file for ARP processing results.')
+    parser.add_argument('-m', '--mac_map_file',
+        help='Path to the MAC mapping file (CSV format: mac,host,interface,original_vlan).')
+    parser.add_argument('-i', '--test_ip',
+        help='Single IP address to test against static ranges.')
+
+    args = parser.parse_args()
+
+    if args.arp_file and not (args.output_file and args.mac_map_file):
+        parser.error('Flags -t requires -o and -m')
+    if args.test_ip and args.arp_file:
+        parser.error('Flags -i and -t are mutually exclusive')
+    if not args.test_ip and not args.arp_file:
+        parser.error('Must provide either arp file (-t) with -o and -m or single test IP (-i)')
+    for label, path in [('Range', args.range_file), ('ARP', args.arp_file), ('MAC map', args.mac_map_file)]:
+        if path and not os.path.isfile(path):
+            parser.error(f"{label} file '{path}' not found")
+
+    return args.range_file, args.arp_file, args.output_file, args.mac_map_file, args.test_ip
+
+def main():
+
+    range_file, arp_file, output_file, mac_map_file, test_ip = getArgs()
+
+    table = ninja_staticip.load(range_file)
+    if not table.ranges:
+        print (f"Error: No valid IP ranges found in '{range_file}'")
+        sys.exit(1)
+
+    if test_ip:
+        if not ninja_staticip.valid_ip(test_ip):
+            print (f"Error: Invalid test IP address: {test_ip}")
+            sys.exit(1)
+        print (table.classify([test_ip])[0])
+
+    if arp_file:
+        mac_info = ninja_nac.load_mac_map(mac_map_file)
+        entries = ninja_nac.load_arp(arp_file)
+        results = table.classify([ip for _, ip, _ in entries])
+
+        with open(output_file, 'w', buffering=1 << 20) as fo:
+            fo.write(ninja_nac.HOSTS_HEADER + '\n')
+            fo.writelines(','.join(row) + '\n' for row in ninja_nac.host_rows(entries, results, mac_info))
+
+if __name__ == '__main__':
+    main()
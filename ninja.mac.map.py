@@ -0,0 +1,59 @@
+# ninja.mac.map.py maps MAC addresses to their origin network locations, the
+# network edge interfaces where the hosts are associated to. It takes the same
+# input and writes the same MAC_MAP_CSV as ninja.mac.map.sh, and in addition
+# 1. filters several VLANs in one pass with -n VLAN1,VLAN2,...;
+# 2. reads only the changes of a sweep from the csv of
+#    fireblade.mss.py -m macdelta with -d, instead of a whole raw log.
+#
+# See ninja.mac.map.sh for the formats of RAW_MAC_LOG, TRUNK_INT_CSV and
+# MAC_MAP_CSV.
+
+import os
+import argparse
+import ninja_mac
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(
+        description = 'Parses a log file to extract MAC address and origin network interface information.')
+
+    # group arg_input
+    arg_input = parser.add_mutually_exclusive_group()
+    arg_input.add_argument('-m', '--raw_mac_log', metavar="RAW_MAC_LOG", default='macdata.log',
+        help='Path to the input log file. Defaults to \'macdata.log\'.')
+    arg_input.add_argument('-d', '--mac_delta', metavar="MAC_DELTA_CSV",
+        help='Path to a csv of fireblade.mss.py -m macdelta, in place of a raw log.')
+
+    parser.add_argument('-t', '--trunk_int_csv', metavar="TRUNK_INT_CSV", default='sfu.all.trunk.int.csv',
+        help='Input file with host and trunk interface data. Defaults to \'sfu.all.trunk.int.csv\'.')
+    parser.add_argument('-o', '--mac_map_csv', metavar="MAC_MAP_CSV", default='mac.map.csv',
+        help='Path for the output file. Defaults to \'mac.map.csv\'.')
+    parser.add_argument('-n', '--vlan_name', action='append', default=[],
+        help='(Optional) VLAN name(s) to search for, comma separated or repeated. If omitted, all VLANs will be processed.')
+
+    args = parser.parse_args()
+
+    source = args.mac_delta or args.raw_mac_log
+    if not os.path.isfile(source) or not os.path.isfile(args.trunk_int_csv):
+        parser.error(f"Both input files ('{source}' and '{args.trunk_int_csv}') must exist.")
+
+    vlans = {vlan for item in args.vlan_name for vlan in item.split(',') if vlan}
+
+    return source, bool(args.mac_delta), args.trunk_int_csv, args.mac_map_csv, vlans
+
+def main():
+
+    source, delta, trunk_int_csv, mac_map_csv, vlans = getArgs()
+
+    trunks = ninja_mac.load_trunks(trunk_int_csv)
+    print (ninja_mac.HEADER)
+
+    with open(source, 'r', errors='replace') as fo:
+        entries = ninja_mac.parse_delta(fo) if delta else ninja_mac.parse(fo)
+        count = ninja_mac.write(ninja_mac.mapping(entries, trunks, vlans), mac_map_csv)
+
+    print (f"Parsing complete. {count} entries saved to '{mac_map_csv}'.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# ninja.nac.pipeline.py runs the NAC data processing of README.NAC.md in one
+# command. It
+# 1. loads the trunk interfaces, as a csv or a trimmed trunk log, into a set;
+# 2. maps MACs to their edge interfaces from the raw MAC log (or a macdelta
+#    csv) into a MAC index, skipping the trunk set;
+# 3. loads the static IP ranges into sorted interval arrays and classifies
+#    every IP of the ARP csv in one batch;
+# 4. joins ARP entries with the MAC index, and the edge interfaces of the raw
+#    edge interface log with the static results of their hosts;
+# 5. writes the VLAN change matrix for fireblade.vlan.flip.py,
+#    host,interface,original vlan,new vlan
+# Intermediate files of the shell scripts (trunk.int.csv, mac.map.csv,
+# hosts.map.csv, edge.int.csv) are written only with -k CORENAME.
+#
+# Example: ninja.nac.pipeline.py -t sfu.all.trunk.int.csv -m <corename>.mac.rawdata.log \
+#   -a <corename>.arp.csv -r <corename>.static.ip.ranges.csv \
+#   -e <corename>.edge.interfaces.rawdata.log -s on -o <corename>.nac.int.csv
+
+import os
+import sys
+import time
+import argparse
+import ninja_mac
+import ninja_nac
+import ninja_staticip
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(
+        description = 'NAC data processing pipeline, from raw data to the VLAN change matrix of fireblade.vlan.flip.py.',
+        formatter_class=argparse.RawTextHelpFormatter
+        )
+
+    # group arg_trunk
+    arg_trunk = parser.add_mutually_exclusive_group()
+    arg_trunk.add_argument('-t', '--trunk_int_csv', metavar="TRUNK_INT_CSV", default='sfu.all.trunk.int.csv',
+        help='Trunk interfaces, csv of hostname,interfacename. Defaults to \'sfu.all.trunk.int.csv\'.')
+    arg_trunk.add_argument('-T', '--trunk_log', metavar="TRUNK_LOG",
+        help='Trunk interfaces as a trimmed trunk log, in place of TRUNK_INT_CSV.')
+
+    # group arg_mac
+    arg_mac = parser.add_mutually_exclusive_group(required=True)
+    arg_mac.add_argument('-m', '--raw_mac_log', metavar="RAW_MAC_LOG",
+        help='Raw MAC log of fireblade.mss.py -c "show ethernet-switching table".')
+    arg_mac.add_argument('-d', '--mac_delta', metavar="MAC_DELTA_CSV",
+        help='csv of fireblade.mss.py -m macdelta, in place of a raw MAC log.')
+
+    parser.add_argument('-n', '--vlan_name', action='append', default=[],
+        help='(Optional) VLAN name(s) of interest, comma separated or repeated. If omitted, all VLANs will be processed.')
+    parser.add_argument('-a', '--arp_csv', metavar="ARP_CSV", required=True,
+        help='ARP entries, csv of mac,ip,hostname with header.')
+    parser.add_argument('-r', '--range_file', metavar="RANGE_FILE", required=True,
+        help='Static IP ranges, csv of cidr,start_ip,end_ip.')
+    parser.add_argument('-e', '--edge_log', metavar="EDGE_LOG", required=True,
+        help='Raw edge interface log of fireblade.mss.py -c "show configuration interfaces | display set | trim 15 | match ...".')
+    parser.add_argument('-s', '--switch_mode', choices=['on', 'off'], required=True,
+        help='"on" to keep the original VLAN of an interface if any of its hosts is static;\n' +
+        '"off" to flip it to NAC-UNPRIV if any of its hosts is not static.')
+    parser.add_argument('-o', '--output_file', metavar="NAC_INT_CSV", default='nac.int.csv',
+        help='VLAN change matrix. Defaults to \'nac.int.csv\'.')
+    parser.add_argument('-k', '--keep', metavar="CORENAME",
+        help='(Optional) Also write the intermediate files <CORENAME>.trunk.int.csv, .mac.map.csv, .hosts.map.csv and .edge.int.csv.')
+
+    args = parser.parse_args()
+
+    trunk = args.trunk_log or args.trunk_int_csv
+    mac = args.mac_delta or args.raw_mac_log
+    for path in [trunk, mac, args.arp_csv, args.range_file, args.edge_log]:
+        if not os.path.isfile(path):
+            parser.error(f"Input file '{path}' not found.")
+
+    vlans = {vlan for item in args.vlan_name for vlan in item.split(',') if vlan}
+
+    return args, vlans
+
+# write rows as a csv, with a header if any
+def save(path, rows, header=None):
+    with open(path, 'w', buffering=1 << 20) as fo:
+        if header:
+            fo.write(header + '\n')
+        fo.writelines(','.join(row) + '\n' for row in rows)
+
+def main():
+
+    args, vlans = getArgs()
+    keep = args.keep
+    timings = []
+    start = time.perf_counter()
+
+    def lap(stage, count):
+        nonlocal start
+        now = time.perf_counter()
+        timings.append((stage, count, now - start))
+        start = now
+
+    # 1. trunk set
+    if args.trunk_log:
+        with open(args.trunk_log, 'r') as fo:
+            trunks = set(ninja_nac.parse_trunk_log(fo))
+        if keep:
+            save(f'{keep}.trunk.int.csv', sorted(trunks), ninja_nac.TRUNK_HEADER)
+    else:
+        trunks = ninja_mac.load_trunks(args.trunk_int_csv)
+    lap('trunk interfaces', len(trunks))
+
+    # 2. MAC index
+    with open(args.mac_delta or args.raw_mac_log, 'r', errors='replace') as fo:
+        entries = ninja_mac.parse_delta(fo) if args.mac_delta else ninja_mac.parse(fo)
+        rows = ninja_mac.mapping(entries, trunks, vlans)
+        if keep:
+            rows = list(rows)
+            ninja_mac.write(rows, f'{keep}.mac.map.csv')
+        mac_info = ninja_nac.mac_index(rows)
+    lap('mapped MACs', len(mac_info))
+
+    # 3. range index and static results of all ARP entries
+    table = ninja_staticip.load(args.range_file)
+    if not table.ranges:
+        print (f"Error: No valid IP ranges found in '{args.range_file}'")
+        sys.exit(1)
+    arp = ninja_nac.load_arp(args.arp_csv)
+    results = table.classify([ip for _, ip, _ in arp])
+    lap('ARP entries', len(arp))
+
+    # 4. joins
+    hosts = list(ninja_nac.host_rows(arp, results, mac_info))
+    if keep:
+        save(f'{keep}.hosts.map.csv', hosts, ninja_nac.HOSTS_HEADER)
+    statics = ninja_nac.statics_index(hosts)
+    with open(args.edge_log, 'r', errors='replace') as fo:
+        edges = list(ninja_nac.parse_edge(fo))
+    if keep:
+        save(f'{keep}.edge.int.csv', edges)
+    lap('edge interfaces', len(edges))
+
+    # 5. VLAN change matrix
+    changes = list(ninja_nac.matrix(edges, statics, args.switch_mode))
+    save(args.output_file, changes)
+    lap('matrix rows', len(changes))
+
+    for stage, count, seconds in timings:
+        print (f'{stage:<18}{count:>10}{seconds:>10.2f}s')
+    flipped = sum(1 for change in changes if change[3] == ninja_nac.NAC_VLAN)
+    print (f"Pipeline complete. {len(changes)} interfaces ({flipped} to {ninja_nac.NAC_VLAN}) saved to '{args.output_file}'.")
+
+if __name__ == '__main__':
+    main()
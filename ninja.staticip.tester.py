@@ -0,0 +1,85 @@
+# ninja.staticip.tester.py tests IP addresses against the static IP ranges of
+# a range file (cidr,start_ip,end_ip), as ninja.staticip.tester.sh does. The
+# ranges are loaded once into sorted interval arrays (see ninja_staticip), so
+# a whole ARP table is classified in one batch instead of looping over every
+# range for every IP.
+#
+# Output follows ninja.staticip.tester.sh: '<ip>,yes|no|n/a' lines with -t/-o,
+# a one line verdict with -i. An IP is 'yes' when any static range holds it.
+#
+# Example: ninja.staticip.tester.py -f tc.static.ip.range.csv -t test_ips.txt -o results.txt
+# Example: ninja.staticip.tester.py -f tc.static.ip.range.csv -i 142.58.6.150
+
+import os
+import sys
+import argparse
+import ninja_staticip
+
+# get and process command line options
+def getArgs():
+
+    parser = argparse.ArgumentParser(
+        description = 'Tests IP addresses against the static IP ranges of a range file.')
+
+    parser.add_argument('-f', '--range_file', required=True,
+        help='Static IP range file, csv of cidr,start_ip,end_ip.')
+    parser.add_argument('-t', '--test_ip_file',
+        help='File of IPs to test, one per line. Requires -o.')
+    parser.add_argument('-o', '--output_file',
+        help='Output file of <ip>,yes|no|n/a lines. Requires -t.')
+    parser.add_argument('-i', '--test_ip',
+        help='Single IP to test.')
+
+    args = parser.parse_args()
+
+    if bool(args.test_ip_file) != bool(args.output_file):
+        parser.error('Flags -t and -o are mutually dependent')
+    if args.test_ip and args.test_ip_file:
+        parser.error('Flags -i and -t are mutually exclusive')
+    if not args.test_ip and not args.test_ip_file:
+        parser.error('Must provide either test IP file (-t) with -o or single test IP (-i)')
+    if not os.path.isfile(args.range_file):
+        parser.error(f"Range file '{args.range_file}' not found")
+    if args.test_ip_file and not os.path.isfile(args.test_ip_file):
+        parser.error(f"Test IP file '{args.test_ip_file}' not found")
+
+    return args.range_file, args.test_ip_file, args.output_file, args.test_ip
+
+def main():
+
+    range_file, test_ip_file, output_file, test_ip = getArgs()
+
+    table = ninja_staticip.load(range_file)
+    if not table.ranges:
+        print (f"Error: No valid IP ranges found in '{range_file}'")
+        sys.exit(1)
+
+    if test_ip:
+        if not ninja_staticip.valid_ip(test_ip):
+            print (f"Error: Invalid test IP address: {test_ip}")
+            sys.exit(1)
+        result, r = table.lookup(test_ip)
+        if result == 'yes':
+            print (f"yes (in range: {r.name}, {r.start_ip}-{r.end_ip} within {r.cidr})")
+        elif result == 'no':
+            print (f"no (in subnet {r.cidr} but not in static range {r.start_ip}-{r.end_ip})")
+        else:
+            print ("n/a (not in any subnet)")
+
+    if test_ip_file:
+        ips = []
+        with open(test_ip_file, 'r') as fo:
+            for line in fo:
+                ip = line.replace('\r', '').rstrip('\n')
+                if not ip:
+                    continue
+                if not ninja_staticip.valid_ip(ip):
+                    print (f"Warning: Invalid test IP in '{test_ip_file}': {ip}")
+                    continue
+                ips.append(ip)
+
+        with open(output_file, 'w') as fo:
+            fo.writelines(f'{ip},{result}\n' for ip, result in zip(ips, table.classify(ips)))
+
+if __name__ == '__main__':
+    main()
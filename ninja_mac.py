@@ -0,0 +1,85 @@
+# ninja_mac maps MAC addresses to their origin edge interfaces, the Python
+# engine behind ninja.mac.map.py. It reads the raw output of
+# fireblade.mss.py -c "show ethernet-switching table" (or the csv of
+# fireblade.mss.py -m macdelta) line by line through generators, drops
+# entries learned on a (host, interface) of the trunk set, keeps the VLANs of
+# interest in the same pass and writes mac.map.csv rows in buffered batches.
+# Parsing follows ninja.mac.map.sh so both produce the same rows.
+
+import re
+import csv
+
+HEADER = 'mac,host,interface,original vlan'
+SEPARATOR = '------------------------------------------------'
+
+# physical interface names, as /^(ge|mge|xe|et)-.\/.\/.*$/ in ninja.mac.map.sh
+INTERFACE = re.compile(r'(?:ge|mge|xe|et)-./.\/')
+PREFIXES = ('ge-', 'mge-', 'xe-', 'et-')
+
+# table header lines in a host block
+SKIP = re.compile(r'flags|Ethernet|Routing|Vlan|statistics')
+
+# trunk set {(host, interface)} from a hostname,interfacename csv with header
+def load_trunks(path):
+    with open(path, 'r') as fo:
+        next(fo, None)
+        return {tuple(line.rstrip('\r\n').split(',')[:2]) for line in fo if ',' in line}
+
+# (mac, host, interface, vlan) of every physical interface entry in a raw log
+def parse(lines):
+    host = None
+    match = INTERFACE.match
+    skip = SKIP.search
+    for line in lines:
+        # awk's $2 and $3 are the first two words of an indented line
+        offset = 0
+        if line[:1] not in ' \t':
+            if line.startswith('Host:'):
+                host = line[5:].strip()
+                continue
+            if line.startswith(SEPARATOR):
+                host = None
+                continue
+            offset = 1
+        if host is None:
+            continue
+        fields = line.split()
+        for field in fields:
+            if field.startswith(PREFIXES) and match(field):
+                if not skip(line):
+                    fields += ['', '']
+                    yield fields[offset + 1], host, field[:-2] if field.endswith('.0') else field, fields[offset]
+                break
+
+# (mac, host, interface, vlan) of added and moved entries in a macdelta csv
+def parse_delta(lines):
+    for row in csv.reader(lines):
+        if len(row) < 5 or row[4] not in ('added', 'moved'):
+            continue
+        if INTERFACE.match(row[2]):
+            yield row[0], row[1], row[2], row[3]
+
+# entries off the trunk set, in the given vlans if any
+def mapping(entries, trunks, vlans=None):
+    for mac, host, interface, vlan in entries:
+        if vlans and vlan not in vlans:
+            continue
+        if (host, interface) not in trunks:
+            yield mac, host, interface, vlan
+
+# write mapped entries as mac.map.csv, 'batch' rows per write, and return the row count
+def write(rows, path, batch=8192):
+    count = 0
+    with open(path, 'w', buffering=1 << 20) as fo:
+        fo.write(HEADER + '\n')
+        chunk = []
+        for row in rows:
+            chunk.append(','.join(row))
+            if len(chunk) == batch:
+                fo.write('\n'.join(chunk) + '\n')
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            fo.write('\n'.join(chunk) + '\n')
+            count += len(chunk)
+    return count
@@ -0,0 +1,125 @@
+# ninja_nac holds the parsers and joins of the NAC workflow in README.NAC.md,
+# so the stages that used to hand csv files to each other can run in one
+# process on in-memory indexes:
+#   trunk set        {(host, interface)}               ninja.trunk.int.pop.sh
+#   MAC index        {mac: (switch, interface, vlan)}  ninja.mac.map.sh
+#   range index      ninja_staticip.RangeTable         ninja.hostinfo.processor.sh
+#   edge interfaces  (host, interface, vlan)           ninja.edge.int.filter.sh
+#   statics index    {(switch, interface): [static]}   ninja.edge.int.processor.sh
+# Each function follows the script named next to it, so the rows match what
+# the scripts write.
+
+import re
+import ninja_mac
+import ninja_staticip
+
+NAC_VLAN = 'NAC-UNPRIV'
+HOSTS_HEADER = 'mac,ip,hostname,static,switch,interface,original vlan,new vlan'
+TRUNK_HEADER = 'hostname,interfacename'
+
+# block separator of fireblade.mss.py, with or without its colour codes
+SEPARATOR = re.compile(r'(?:\033\[[0-9;]*m)?' + ninja_mac.SEPARATOR)
+
+# (host, interface) of every trunk in a trimmed trunk log, see README.NAC.md
+def parse_trunk_log(lines):
+    host = None
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith('Host:'):
+            host = line[5:].strip()
+        elif SEPARATOR.match(line):
+            host = None
+        elif host is not None and line.strip():
+            yield host, line
+
+# (mac, ip, hostname) of an ARP csv with header, warning through 'warn' on invalid IPs
+def load_arp(path, warn=print):
+    entries = []
+    with open(path, 'r') as fo:
+        next(fo, None)
+        for line_count, line in enumerate(fo, start=2):
+            mac, ip, hostname = (line.replace('\r', '').rstrip('\n').split(',', 3) + ['', ''])[:3]
+            if not mac or not ip or not hostname:
+                continue
+            if not ninja_staticip.valid_ip(ip):
+                warn(f"Warning: Invalid IP in ARP file line {line_count}: {ip}")
+                continue
+            entries.append((mac, ip, hostname))
+    return entries
+
+# {mac: (switch, interface, original vlan)} of mac.map rows, the last row of a mac winning
+def mac_index(rows):
+    return {mac: (host, interface, vlan) for mac, host, interface, vlan in rows}
+
+# {mac: (switch, interface, original vlan)} of a mac.map.csv
+def load_mac_map(path):
+    rows = []
+    with open(path, 'r') as fo:
+        for line in fo:
+            row = (line.replace('\r', '').rstrip('\n').split(',', 3) + ['', '', ''])[:4]
+            if row[0] and row[0] != 'mac':
+                rows.append(row)
+    return mac_index(rows)
+
+# hosts.map rows of ARP entries and their static results joined with the MAC index
+def host_rows(entries, results, mac_info):
+    for (mac, ip, hostname), static in zip(entries, results):
+        info = mac_info.get(mac)
+        if info is None:
+            yield mac, ip, hostname, static, 'n/a', 'n/a', 'n/a', 'n/a'
+        else:
+            switch, interface, original_vlan = info
+            yield mac, ip, hostname, static, switch, interface, original_vlan, \
+                original_vlan if static == 'yes' else NAC_VLAN
+
+# (host, interface, vlan) of every access interface in a raw edge interface log
+def parse_edge(lines):
+    host, trunks, members = None, set(), []
+
+    def flush():
+        for interface, vlan in members:
+            if interface not in trunks and vlan != 'trunk':
+                yield host, interface, vlan
+
+    for line in lines:
+        line = line.replace('\r', '').rstrip('\n')
+        if SEPARATOR.match(line) or line.startswith('Host: '):
+            yield from flush()
+            trunks, members = set(), []
+            host = line[6:].strip() if line.startswith('Host: ') else None
+            continue
+        if not line:
+            continue
+        interface = line.split(' unit', 1)[0].strip()
+        if 'interface-mode trunk' in line:
+            trunks.add(interface)
+        elif 'vlan members' in line:
+            members.append((interface, line.split('members ', 1)[-1].strip()))
+    yield from flush()
+
+# {(switch, interface): [static results]} of hosts.map rows
+def statics_index(rows):
+    index = {}
+    for row in rows:
+        static, switch, interface = row[3], row[4], row[5]
+        if switch and interface and static:
+            index.setdefault((switch, interface), []).append(static)
+    return index
+
+# new vlan of an edge interface from the static results of its hosts, mode 'on'
+# keeping the original vlan if any host is static, 'off' flipping it if any is not
+def new_vlan(original_vlan, statics, mode):
+    if not statics:
+        return NAC_VLAN
+    if len(statics) == 1:
+        return original_vlan if statics[0] == 'yes' else NAC_VLAN
+    if mode == 'on':
+        return original_vlan if 'yes' in statics else NAC_VLAN
+    return NAC_VLAN if 'no' in statics else original_vlan
+
+# (host, interface, original vlan, new vlan) of every edge interface
+def matrix(edges, statics, mode):
+    for host, interface, vlan in edges:
+        if not vlan:
+            continue
+        yield host, interface, vlan, new_vlan(vlan, statics.get((host, interface)), mode)
@@ -0,0 +1,136 @@
+# ninja_staticip classifies IPv4 addresses against the static IP ranges of a
+# range file (cidr,start_ip,end_ip), the engine behind ninja.staticip.tester.py
+# and ninja.hostinfo.processor.py. The range file is read once into two sorted
+# arrays of merged integer intervals, one of the static ranges and one of their
+# subnets, and every IP is resolved by binary search as
+#   yes  in a static range,
+#   no   in the subnet of a static range but not in any static range,
+#   n/a  not in any subnet.
+# Batches go through numpy.searchsorted when numpy is installed and through
+# bisect otherwise.
+
+import re
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+IP = re.compile(r'[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}')
+CIDR = re.compile(r'([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})/([0-9]{1,2})')
+
+# a valid line of the range file, 'name' is range_<line number>
+Range = namedtuple('Range', 'name cidr start_ip end_ip subnet_start subnet_end start end')
+
+def ip_to_int(ip):
+    a, b, c, d = ip.split('.')
+    return (int(a) << 24) + (int(b) << 16) + (int(c) << 8) + int(d)
+
+def valid_ip(ip):
+    return IP.fullmatch(ip) is not None and all(int(octet) <= 255 for octet in ip.split('.'))
+
+def valid_cidr(cidr):
+    match = CIDR.fullmatch(cidr)
+    return match is not None and valid_ip(match.group(1)) and int(match.group(2)) <= 32
+
+# first and last address of a subnet as integers
+def subnet(cidr):
+    network, prefix = cidr.split('/')
+    prefix = int(prefix)
+    start = ip_to_int(network) & (0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF
+    return start, start | (0xFFFFFFFF >> prefix)
+
+# sorted, non-overlapping (starts, ends) arrays covering the given intervals
+def merge(intervals):
+    starts, ends = array('Q'), array('Q')
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+class RangeTable:
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+        self.static = merge((r.start, r.end) for r in ranges)
+        self.subnets = merge((r.subnet_start, r.subnet_end) for r in ranges)
+        if numpy is not None:
+            self.static = tuple(numpy.frombuffer(a, dtype=numpy.uint64) for a in self.static)
+            self.subnets = tuple(numpy.frombuffer(a, dtype=numpy.uint64) for a in self.subnets)
+
+    # membership of every value in the merged intervals (starts, ends)
+    @staticmethod
+    def _member(intervals, values):
+        starts, ends = intervals
+        if numpy is not None:
+            if not len(starts):
+                return numpy.zeros(len(values), dtype=bool)
+            index = numpy.searchsorted(starts, values, side='right') - 1
+            return (index >= 0) & (ends[numpy.maximum(index, 0)] >= values)
+        hits = []
+        for value in values:
+            index = bisect_right(starts, value) - 1
+            hits.append(index >= 0 and ends[index] >= value)
+        return hits
+
+    # yes/no/n/a of a batch of IPs, in order
+    def classify(self, ips):
+        values = [ip_to_int(ip) for ip in ips]
+        if numpy is not None:
+            values = numpy.array(values, dtype=numpy.uint64)
+            static = self._member(self.static, values)
+            inside = self._member(self.subnets, values)
+            return numpy.where(static, 'yes', numpy.where(inside, 'no', 'n/a')).tolist()
+        static = self._member(self.static, values)
+        inside = self._member(self.subnets, values)
+        return ['yes' if s else 'no' if n else 'n/a' for s, n in zip(static, inside)]
+
+    # (result, range) of a single IP, range being the first static range that
+    # holds it, else the first range whose subnet holds it, else None
+    def lookup(self, ip):
+        value = ip_to_int(ip)
+        in_subnet = None
+        for r in self.ranges:
+            if r.start <= value <= r.end:
+                return 'yes', r
+            if in_subnet is None and r.subnet_start <= value <= r.subnet_end:
+                in_subnet = r
+        return ('no', in_subnet) if in_subnet else ('n/a', None)
+
+# RangeTable of a range file, with a warning through 'warn' for every line skipped
+def load(path, warn=print):
+    ranges = []
+    count = 0
+    with open(path, 'r') as fo:
+        for line in fo:
+            cidr, start_ip, end_ip = (line.replace('\r', '').rstrip('\n').split(',', 2) + ['', ''])[:3]
+            if not cidr or not start_ip or not end_ip:
+                continue
+            count += 1
+
+            if not valid_cidr(cidr):
+                warn(f"Warning: Invalid CIDR in line {count}: {cidr}")
+                continue
+            if not valid_ip(start_ip):
+                warn(f"Warning: Invalid start IP in line {count}: {start_ip}")
+                continue
+            if not valid_ip(end_ip):
+                warn(f"Warning: Invalid end IP in line {count}: {end_ip}")
+                continue
+            start, end = ip_to_int(start_ip), ip_to_int(end_ip)
+            if start > end:
+                warn(f"Warning: Invalid range in line {count}: start IP ({start_ip}) > end IP ({end_ip})")
+                continue
+            subnet_start, subnet_end = subnet(cidr)
+            if not (subnet_start <= start <= subnet_end and subnet_start <= end <= subnet_end):
+                warn(f"Warning: Static range ({start_ip}-{end_ip}) in line {count} is not within subnet {cidr}")
+                continue
+
+            ranges.append(Range(f'range_{count}', cidr, start_ip, end_ip, subnet_start, subnet_end, start, end))
+    return RangeTable(ranges)